@@ -0,0 +1,139 @@
+"""
+Measures the inference throughput of a model shared by a growing number of
+threads, for each way of sharing it:
+
+- serialized: one `ThreadSafeModel` whose calls are serialised with a lock
+- concurrent: one `ThreadSafeModel` whose calls run in parallel
+- batched: one `openl3.server.MicroBatcher` that coalesces the calls of all
+  threads into shared inference batches
+- per-thread: one model per thread (partitioned, uses more memory)
+
+Usage:
+
+    python benchmarks/bench_concurrency.py --threads 1 2 4 8 --clips 32
+"""
+from __future__ import print_function
+import sys
+import time
+import argparse
+import threading
+import numpy as np
+import openl3
+from openl3.core import TARGET_SR, _get_audio_frames
+from openl3.models import load_embedding_model, ThreadSafeModel
+from openl3.server import MicroBatcher
+
+
+MODES = ('serialized', 'concurrent', 'batched', 'per-thread')
+
+
+def _run_threads(n_threads, target):
+    """Runs `target(i)` in `n_threads` threads, and returns the elapsed time"""
+    errors = []
+
+    def run(i):
+        try:
+            target(i)
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=run, args=(i,)) for i in range(n_threads)]
+    start = time.time()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.time() - start
+    if errors:
+        raise errors[0]
+    return elapsed
+
+
+def bench(mode, n_threads, clips, args):
+    """Returns the throughput in windows per second of a sharing mode"""
+    load_args = (args.input_repr, args.content_type, args.embedding_size)
+    kwargs = dict(hop_size=args.hop_size, batch_size=args.batch_size, verbose=0)
+    # Each thread processes its share of the clips
+    shares = [clips[i::n_threads] for i in range(n_threads)]
+
+    if mode == 'batched':
+        model = ThreadSafeModel(load_embedding_model(*load_args, frontend=args.frontend),
+                                serialize=False)
+        batcher = MicroBatcher(lambda: model, max_batch_size=args.batch_size)
+        batcher.wait_ready()
+
+        def target(i):
+            for audio in shares[i]:
+                batcher.embed(_get_audio_frames(audio, args.hop_size, True))
+
+        try:
+            elapsed = _run_threads(n_threads, target)
+        finally:
+            batcher.close()
+    else:
+        if mode == 'per-thread':
+            models = [load_embedding_model(*load_args, frontend=args.frontend,
+                                           use_cache=False, thread_safe=True)
+                      for _ in range(n_threads)]
+        else:
+            model = ThreadSafeModel(load_embedding_model(*load_args, frontend=args.frontend),
+                                    serialize=(mode == 'serialized'))
+            models = [model] * n_threads
+
+        def target(i):
+            for audio in shares[i]:
+                openl3.get_embedding(audio, TARGET_SR, model=models[i], **kwargs)
+
+        elapsed = _run_threads(n_threads, target)
+
+    n_windows = sum(_get_audio_frames(audio, args.hop_size, True).shape[0] for audio in clips)
+    return n_windows / elapsed
+
+
+def parse_args(args):
+    parser = argparse.ArgumentParser(description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--threads', type=int, nargs='+', default=[1, 2, 4, 8],
+                        help='Numbers of threads.')
+    parser.add_argument('--modes', nargs='+', choices=MODES, default=list(MODES),
+                        help='Ways of sharing the model.')
+    parser.add_argument('--clips', type=int, default=32,
+                        help='Number of clips processed per measurement.')
+    parser.add_argument('--duration', type=float, default=2.,
+                        help='Duration of the clips in seconds.')
+    parser.add_argument('--input-repr', default='mel256')
+    parser.add_argument('--content-type', default='music')
+    parser.add_argument('--embedding-size', type=int, default=512)
+    parser.add_argument('--frontend', default='kapre', choices=['kapre', 'numpy'])
+    parser.add_argument('--hop-size', type=float, default=0.1)
+    parser.add_argument('--batch-size', type=int, default=32)
+    return parser.parse_args(args)
+
+
+def main(args):
+    args = parse_args(args)
+    rng = np.random.RandomState(0)
+    clips = [rng.uniform(-1, 1, int(args.duration * TARGET_SR)).astype(np.float32)
+             for _ in range(args.clips)]
+
+    # Warm up the model cache and the backend
+    load_embedding_model(args.input_repr, args.content_type, args.embedding_size,
+                         frontend=args.frontend)
+    bench('serialized', 1, clips[:1], args)
+
+    print('{:<12}'.format('threads') + ''.join('{:>12}'.format(mode) for mode in args.modes))
+    for n_threads in args.threads:
+        row = '{:<12}'.format(n_threads)
+        for mode in args.modes:
+            try:
+                row += '{:>12.1f}'.format(bench(mode, n_threads, clips, args))
+            except Exception as e:
+                print('{} with {} threads failed: {}'.format(mode, n_threads, e),
+                      file=sys.stderr)
+                row += '{:>12}'.format('error')
+        print(row)
+    print('(windows per second)')
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
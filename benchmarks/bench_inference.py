@@ -0,0 +1,91 @@
+"""
+Measures the speedup of models built for inference only
+(``load_embedding_model(..., optimize=True)``, which folds the batch
+normalizations into the convolutions), and optionally compiled with XLA,
+for each input representation:
+
+    python benchmarks/bench_inference.py --batch-size 32 --xla
+"""
+from __future__ import print_function
+import sys
+import json
+import time
+import argparse
+import numpy as np
+from openl3.models import load_embedding_model
+
+
+timer = getattr(time, 'perf_counter', time.time)
+
+
+def bench(model, batch, repeat):
+    """Returns the fastest inference time of a batch out of `repeat` runs"""
+    model.predict_on_batch(batch)
+    best = None
+    for _ in range(repeat):
+        start = timer()
+        model.predict_on_batch(batch)
+        elapsed = timer() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def parse_args(args):
+    parser = argparse.ArgumentParser(description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--input-reprs', nargs='+', default=['linear', 'mel128', 'mel256'],
+                        choices=['linear', 'mel128', 'mel256'])
+    parser.add_argument('--embedding-sizes', type=int, nargs='+', default=[512, 6144],
+                        choices=[512, 6144])
+    parser.add_argument('--content-type', default='music', choices=['music', 'env'])
+    parser.add_argument('--batch-size', type=int, default=32)
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--xla', action='store_true', default=False,
+                        help='Also measure optimized models compiled with XLA. With '
+                             'TensorFlow 2, this enables XLA for the whole process, so '
+                             'these models are measured last.')
+    parser.add_argument('--output', '-o', default=None,
+                        help='Path to a JSON file to save the results to.')
+    return parser.parse_args(args)
+
+
+def main(args):
+    args = parse_args(args)
+    rng = np.random.RandomState(0)
+    batch = rng.uniform(-1, 1, (args.batch_size, 1, 48000)).astype(np.float32)
+
+    variants = [('original', {}), ('optimized', {'optimize': True})]
+    if args.xla:
+        variants.append(('optimized+xla', {'optimize': True, 'use_xla': True}))
+
+    results = []
+    for name, kwargs in variants:
+        for input_repr in args.input_reprs:
+            for embedding_size in args.embedding_sizes:
+                model = load_embedding_model(input_repr, args.content_type, embedding_size,
+                                             use_cache=False, **kwargs)
+                results.append({
+                    'variant': name,
+                    'input_repr': input_repr,
+                    'embedding_size': embedding_size,
+                    'batch_size': args.batch_size,
+                    'time': bench(model, batch, args.repeat),
+                })
+
+    reference = dict(((result['input_repr'], result['embedding_size']), result['time'])
+                     for result in results if result['variant'] == 'original')
+    print('{:<16}{:<8}{:>6}{:>12}{:>10}'.format('variant', 'input', 'size', 'time (s)',
+                                               'speedup'))
+    for result in results:
+        result['speedup'] = reference[(result['input_repr'], result['embedding_size'])] \
+            / result['time']
+        print('{variant:<16}{input_repr:<8}{embedding_size:>6}{time:>12.4f}'
+              '{speedup:>9.2f}x'.format(**result))
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2, sort_keys=True)
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
@@ -0,0 +1,116 @@
+"""
+Measures the inference time saved by skipping silent windows
+(``get_embedding(..., silence_threshold=...)``) on synthetic audio with a
+growing proportion of silence (and of low-level noise below the threshold),
+and the time spent finding the silent windows:
+
+    python benchmarks/bench_silence.py --duration 60 --threshold -60
+"""
+from __future__ import print_function
+import sys
+import json
+import time
+import argparse
+import numpy as np
+import openl3
+from openl3.core import TARGET_SR, _SilenceGate, _get_audio_frames, _iter_frame_batches
+from openl3.models import load_embedding_model
+
+
+timer = getattr(time, 'perf_counter', time.time)
+
+
+def _synthesize(duration, silent_fraction, seed=0):
+    """
+    Returns noise whose second part is silent: the first half of the silent
+    part is digital silence, and the second half is noise at -90 dBFS
+    """
+    rng = np.random.RandomState(seed)
+    n_samples = int(duration * TARGET_SR)
+    n_silent = int(silent_fraction * n_samples)
+    audio = 0.1 * rng.randn(n_samples)
+    audio[n_samples - n_silent:] = 0
+    audio[n_samples - n_silent // 2:] = 10 ** (-90 / 20.) * rng.randn(n_silent // 2)
+    return audio.astype(np.float32)
+
+
+def _time(func, repeat):
+    """Returns the result of `func` and its fastest running time out of `repeat` runs"""
+    best = None
+    for _ in range(repeat):
+        start = timer()
+        result = func()
+        elapsed = timer() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return result, best
+
+
+def parse_args(args):
+    parser = argparse.ArgumentParser(description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--silent-fractions', type=float, nargs='+',
+                        default=[0., 0.25, 0.5, 0.75, 0.9])
+    parser.add_argument('--duration', type=float, default=60.,
+                        help='Duration of the synthetic audio in seconds.')
+    parser.add_argument('--threshold', type=float, default=-60.,
+                        help='Silence threshold in dBFS.')
+    parser.add_argument('--input-repr', default='mel256', choices=['linear', 'mel128', 'mel256'])
+    parser.add_argument('--content-type', default='music', choices=['music', 'env'])
+    parser.add_argument('--embedding-size', type=int, default=512, choices=[512, 6144])
+    parser.add_argument('--frontend', default='kapre', choices=['kapre', 'numpy'])
+    parser.add_argument('--hop-size', type=float, default=0.1)
+    parser.add_argument('--batch-size', type=int, default=32)
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--output', '-o', default=None,
+                        help='Path to a JSON file to save the results to.')
+    return parser.parse_args(args)
+
+
+def main(args):
+    args = parse_args(args)
+    model = load_embedding_model(args.input_repr, args.content_type, args.embedding_size,
+                                 frontend=args.frontend, thread_safe=True)
+    kwargs = dict(model=model, hop_size=args.hop_size, batch_size=args.batch_size, verbose=0)
+
+    # Warm up the model and compute its silence embedding
+    openl3.get_embedding(_synthesize(2., 0.5), TARGET_SR, silence_threshold=args.threshold,
+                         **kwargs)
+
+    results = []
+    print('{:>8}{:>10}{:>12}{:>12}{:>10}{:>12}'.format('silent', 'skipped', 'time (s)',
+                                                       'gated (s)', 'speedup', 'gate (s)'))
+    for silent_fraction in args.silent_fractions:
+        audio = _synthesize(args.duration, silent_fraction)
+        _, elapsed = _time(lambda: openl3.get_embedding(audio, TARGET_SR, **kwargs),
+                           args.repeat)
+        (_, _, mask), gated = _time(lambda: openl3.get_embedding(
+            audio, TARGET_SR, silence_threshold=args.threshold, return_mask=True, **kwargs),
+            args.repeat)
+
+        # Time spent finding the silent windows alone
+        x = _get_audio_frames(audio, args.hop_size, True)
+        batches = list(_iter_frame_batches([x], args.batch_size))
+        gate = _SilenceGate(args.threshold)
+        _, gate_time = _time(lambda: [gate.update(batch) for batch in batches], args.repeat)
+
+        result = {
+            'silent_fraction': silent_fraction,
+            'n_windows': int(mask.size),
+            'skipped': float(1 - mask.mean()),
+            'time': elapsed,
+            'gated_time': gated,
+            'speedup': elapsed / gated,
+            'gate_time': gate_time,
+        }
+        results.append(result)
+        print('{silent_fraction:>8.2f}{skipped:>10.2f}{time:>12.3f}{gated_time:>12.3f}'
+              '{speedup:>9.2f}x{gate_time:>12.4f}'.format(**result))
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump({'parameters': vars(args), 'results': results}, f, indent=2,
+                      sort_keys=True)
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
@@ -0,0 +1,283 @@
+"""
+Times each stage of computing and saving embeddings on synthetic audio of
+varying durations, sampling rates and channel counts, for each model
+configuration:
+
+- decode: reading the audio file with soundfile
+- downmix: averaging the channels
+- resample: resampling to 48kHz
+- frame: centering, padding and framing the audio into windows
+- batch: copying the windows into float32 inference batches
+- spectrogram: computing the spectrograms (numpy front-end only)
+- predict: running the model
+- save: saving the output file
+
+The results are written as JSON, and can be compared with the results of a
+previous run to detect regressions:
+
+    python benchmarks/bench_stages.py --output baseline.json
+    python benchmarks/bench_stages.py --baseline baseline.json --tolerance 0.2
+"""
+from __future__ import print_function
+import os
+import sys
+import json
+import time
+import shutil
+import socket
+import argparse
+import platform
+import tempfile
+import numpy as np
+import soundfile as sf
+import openl3
+from openl3.core import (
+    TARGET_SR, _iter_resampled_blocks, _get_audio_frames, _iter_frame_batches, _save_output
+)
+from openl3.models import load_embedding_model, get_spectrogram_input_repr
+from openl3.frontend import compute_model_input
+
+
+STAGES = ('decode', 'downmix', 'resample', 'frame', 'batch', 'spectrogram', 'predict', 'save')
+
+timer = getattr(time, 'perf_counter', time.time)
+
+
+def _time(func, repeat):
+    """Returns the result of `func` and its fastest running time out of `repeat` runs"""
+    best = None
+    for _ in range(repeat):
+        start = timer()
+        result = func()
+        elapsed = timer() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return result, best
+
+
+def _synthesize(duration, sr, channels, seed=0):
+    """Returns noise plus a chirp, which exercise every frequency band"""
+    rng = np.random.RandomState(seed)
+    t = np.arange(int(duration * sr)) / float(sr)
+    chirp = np.sin(2 * np.pi * (100 + (sr / 4. - 100) * t / max(duration, 1e-3) / 2) * t)
+    audio = 0.5 * chirp[:, np.newaxis] + 0.1 * rng.randn(t.size, channels)
+    return (audio if channels > 1 else audio[:, 0]).astype(np.float32)
+
+
+def bench_audio(path, args):
+    """Times the stages that do not depend on the model, and returns the windows"""
+    timings = {}
+    (audio, sr), timings['decode'] = _time(lambda: sf.read(path), args.repeat)
+
+    if audio.ndim == 2:
+        audio, timings['downmix'] = _time(lambda: np.mean(audio, axis=1), args.repeat)
+    else:
+        timings['downmix'] = 0.
+
+    if sr != TARGET_SR:
+        audio, timings['resample'] = _time(lambda: np.concatenate(list(_iter_resampled_blocks(
+            lambda start, stop: audio[start:stop], audio.size, sr, args.resample_method))),
+            args.repeat)
+    else:
+        timings['resample'] = 0.
+
+    x, timings['frame'] = _time(lambda: _get_audio_frames(audio, args.hop_size, True),
+                                args.repeat)
+    return x, timings
+
+
+def bench_model(model, x, output_path, args):
+    """Times the stages that depend on the model"""
+    timings = {}
+    batches, timings['batch'] = _time(lambda: list(_iter_frame_batches([x], args.batch_size)),
+                                      args.repeat)
+
+    input_repr = get_spectrogram_input_repr(model)
+    hop_len = int(args.hop_size * TARGET_SR)
+    if input_repr is not None:
+        batches, timings['spectrogram'] = _time(
+            lambda: [compute_model_input(batch[:, 0, :], input_repr, hop_len=hop_len)
+                     for batch in batches], args.repeat)
+    else:
+        timings['spectrogram'] = 0.
+
+    embedding, timings['predict'] = _time(
+        lambda: np.concatenate([model.predict_on_batch(batch) for batch in batches]),
+        args.repeat)
+
+    ts = np.arange(embedding.shape[0]) * args.hop_size
+    _, timings['save'] = _time(
+        lambda: _save_output(output_path, embedding, ts, args.output_format), args.repeat)
+    return timings
+
+
+def get_environment():
+    """Returns a description of the machine and of the library versions"""
+    environment = {
+        'host': socket.gethostname(),
+        'platform': platform.platform(),
+        'processor': platform.processor(),
+        'cpu_count': os.cpu_count() if hasattr(os, 'cpu_count') else None,
+        'python': platform.python_version(),
+        'numpy': np.__version__,
+        'openl3': openl3.__version__,
+        'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+    }
+    for name in ('keras', 'tensorflow'):
+        module = sys.modules.get(name)
+        if module is not None:
+            environment[name] = getattr(module, '__version__', None)
+    return environment
+
+
+def run(args):
+    tempdir = tempfile.mkdtemp()
+    results = []
+    try:
+        models = {}
+        for input_repr in args.input_reprs:
+            for embedding_size in args.embedding_sizes:
+                key = (input_repr, args.content_type, embedding_size, args.frontend)
+                models[key] = load_embedding_model(*key)
+
+        # Warm up the resamplers (which are compiled on first use) and the models
+        warmup_args = argparse.Namespace(**dict(vars(args), repeat=1))
+        for sr in args.srs:
+            path = os.path.join(tempdir, 'warmup.wav')
+            sf.write(path, _synthesize(2., sr, 1), sr, subtype='PCM_16')
+            x, _ = bench_audio(path, warmup_args)
+            for model in models.values():
+                bench_model(model, x, os.path.join(tempdir, 'out.npz'), warmup_args)
+
+        for duration in args.durations:
+            for sr in args.srs:
+                for channels in args.channels:
+                    path = os.path.join(tempdir, 'audio.wav')
+                    sf.write(path, _synthesize(duration, sr, channels), sr, subtype='PCM_16')
+                    x, audio_timings = bench_audio(path, args)
+
+                    for key, model in sorted(models.items()):
+                        timings = dict(audio_timings)
+                        timings.update(bench_model(model, x, os.path.join(tempdir, 'out.npz'),
+                                                   args))
+                        result = {
+                            'duration': duration,
+                            'sr': sr,
+                            'channels': channels,
+                            'input_repr': key[0],
+                            'content_type': key[1],
+                            'embedding_size': key[2],
+                            'frontend': key[3],
+                            'n_windows': x.shape[0],
+                            'stages': timings,
+                            'total': sum(timings.values()),
+                        }
+                        results.append(result)
+                        print('{duration:>6}s {sr:>6}Hz {channels}ch {input_repr:>6} '
+                              '{embedding_size:>4}: '.format(**result)
+                              + ' '.join('{}={:.4f}'.format(stage, timings[stage])
+                                         for stage in STAGES),
+                              file=sys.stderr)
+    finally:
+        shutil.rmtree(tempdir)
+
+    return {
+        'environment': get_environment(),
+        'parameters': {
+            'hop_size': args.hop_size,
+            'batch_size': args.batch_size,
+            'resample_method': args.resample_method,
+            'output_format': args.output_format,
+            'repeat': args.repeat,
+        },
+        'results': results,
+    }
+
+
+def _result_key(result):
+    return tuple(result[name] for name in ('duration', 'sr', 'channels', 'input_repr',
+                                           'content_type', 'embedding_size', 'frontend'))
+
+
+def compare(report, baseline, tolerance, min_time=1e-3):
+    """
+    Returns the regressions of a report with respect to a baseline, i.e. the
+    stages that are more than `tolerance` (relative) slower. Stages faster
+    than `min_time` seconds in the baseline are ignored, since their timings
+    are too noisy.
+    """
+    baseline_results = dict((_result_key(result), result) for result in baseline['results'])
+    regressions = []
+    for result in report['results']:
+        baseline_result = baseline_results.get(_result_key(result))
+        if baseline_result is None:
+            continue
+        for stage, elapsed in sorted(result['stages'].items()):
+            reference = baseline_result['stages'].get(stage)
+            if reference is None or reference < min_time:
+                continue
+            if elapsed > reference * (1 + tolerance):
+                regressions.append({'case': _result_key(result), 'stage': stage,
+                                    'baseline': reference, 'time': elapsed,
+                                    'ratio': elapsed / reference})
+    return regressions
+
+
+def parse_args(args):
+    parser = argparse.ArgumentParser(description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--durations', type=float, nargs='+', default=[1., 10., 60.],
+                        help='Durations of the synthetic audio in seconds.')
+    parser.add_argument('--srs', type=int, nargs='+', default=[48000, 44100, 22050],
+                        help='Sampling rates of the synthetic audio.')
+    parser.add_argument('--channels', type=int, nargs='+', default=[1, 2],
+                        help='Channel counts of the synthetic audio.')
+    parser.add_argument('--input-reprs', nargs='+', default=['linear', 'mel128', 'mel256'],
+                        choices=['linear', 'mel128', 'mel256'])
+    parser.add_argument('--embedding-sizes', type=int, nargs='+', default=[512, 6144],
+                        choices=[512, 6144])
+    parser.add_argument('--content-type', default='music', choices=['music', 'env'])
+    parser.add_argument('--frontend', default='kapre', choices=['kapre', 'numpy'])
+    parser.add_argument('--resample-method', default='kaiser_best',
+                        choices=['kaiser_best', 'kaiser_fast', 'polyphase'])
+    parser.add_argument('--output-format', default='float32',
+                        choices=['float32', 'float16', 'int8'])
+    parser.add_argument('--hop-size', type=float, default=0.1)
+    parser.add_argument('--batch-size', type=int, default=32)
+    parser.add_argument('--repeat', type=int, default=3,
+                        help='Number of runs of each stage; the fastest one is reported.')
+    parser.add_argument('--output', '-o', default=None,
+                        help='Path to the JSON report. By default it is written to stdout.')
+    parser.add_argument('--baseline', default=None,
+                        help='Path to the JSON report of a previous run. Stages that '
+                             'are slower than in the baseline are reported, and the exit '
+                             'status is 1 if there are any.')
+    parser.add_argument('--tolerance', type=float, default=0.2,
+                        help='Relative slowdown tolerated with --baseline.')
+    return parser.parse_args(args)
+
+
+def main(args):
+    args = parse_args(args)
+    report = run(args)
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2, sort_keys=True)
+    else:
+        json.dump(report, sys.stdout, indent=2, sort_keys=True)
+        print()
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare(report, json.load(f), args.tolerance)
+        for regression in regressions:
+            print('Regression: {} {} took {:.4f}s instead of {:.4f}s ({:.2f}x)'.format(
+                regression['case'], regression['stage'], regression['time'],
+                regression['baseline'], regression['ratio']), file=sys.stderr)
+        if regressions:
+            return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
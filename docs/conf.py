@@ -45,7 +45,7 @@ class Mock(MagicMock):
 MOCK_MODULES = [
     'numpy', 'soundfile', 'resampy', 'keras', 'tensorflow',
     'kapre', 'kapre.time_frequency', 'keras.layers', 'keras.models',
-    'keras.regularizers', 'sklearn', 'sklearn.decomposition'
+    'keras.regularizers', 'sklearn', 'sklearn.decomposition', 'h5py'
 ]
 
 sys.modules.update((mod_name, Mock()) for mod_name in MOCK_MODULES)
@@ -1,2 +1,10 @@
+import sys
 from .version import version as __version__
-from .core import get_embedding, get_output_path, process_file
\ No newline at end of file
+from .core import (
+    get_embedding, get_embeddings_batch, get_config_embeddings, get_output_path, process_file,
+    process_file_configs, load_embedding
+)
+from .reader import open_embedding
+
+if sys.version_info >= (3, 5):
+    from .aio import aget_embedding
@@ -0,0 +1,146 @@
+import numpy as np
+from numbers import Real
+from .openl3_exceptions import OpenL3Error
+
+
+AGGREGATE_METHODS = ("mean", "max", "std", "meanstd")
+
+
+def get_segment_length(segment_duration, hop_size):
+    """
+    Returns the number of frames of the segments over which embeddings are
+    aggregated, i.e. `segment_duration` rounded to a whole number of hops,
+    or None if `segment_duration` is None (whole clip).
+    """
+    if segment_duration is None:
+        return None
+    if not isinstance(segment_duration, Real) or isinstance(segment_duration, bool) \
+            or segment_duration <= 0:
+        raise OpenL3Error('Invalid segment duration {}'.format(segment_duration))
+    return max(1, int(round(segment_duration / float(hop_size))))
+
+
+def validate_aggregate_args(aggregate, segment_duration, hop_size):
+    """Raises an OpenL3Error if the aggregation parameters are invalid"""
+    if aggregate is None:
+        if segment_duration is not None:
+            raise OpenL3Error('A segment duration requires an aggregation method')
+        return
+    if str(aggregate) not in AGGREGATE_METHODS:
+        raise OpenL3Error('Invalid aggregation method "{}"'.format(aggregate))
+    get_segment_length(segment_duration, hop_size)
+
+
+class EmbeddingAggregator(object):
+    """
+    Summarises consecutive embedding frames over the whole clip or over
+    fixed-length segments, as they are computed. Frames are added batch by
+    batch with `update`, and only the running statistics of the current
+    segment and the summaries of the completed segments are kept in memory.
+    Means and variances are accumulated in float64 and combined across
+    batches with the parallel algorithm of Chan et al.
+
+    Parameters
+    ----------
+    method : "mean", "max", "std" or "meanstd"
+        Summary of each dimension. "std" is the population standard
+        deviation, and "meanstd" concatenates the mean and the standard
+        deviation, which doubles the dimensionality.
+    hop_size : float
+        Hop size of the frames in seconds.
+    segment_duration : float or None
+        Duration of the segments in seconds, rounded to a whole number of
+        hops. If None, the whole clip is summarised into a single frame. The
+        last segment may be shorter.
+    """
+    def __init__(self, method, hop_size, segment_duration=None):
+        validate_aggregate_args(method, segment_duration, hop_size)
+        self.method = method
+        self.hop_size = hop_size
+        self.segment_length = get_segment_length(segment_duration, hop_size)
+        self._rows = []
+        self._reset()
+
+    def _reset(self):
+        self._count = 0
+        self._mean = None
+        self._m2 = None
+        self._max = None
+
+    def _update_segment(self, frames):
+        """Adds frames that all belong to the current segment"""
+        n = frames.shape[0]
+        if self.method == "max":
+            frames_max = frames.max(axis=0)
+            self._max = frames_max if self._max is None else np.maximum(self._max, frames_max)
+        else:
+            frames_mean = frames.mean(axis=0, dtype=np.float64)
+            if self.method != "mean":
+                frames_m2 = np.square(frames - frames_mean).sum(axis=0)
+            if self._count == 0:
+                self._mean = frames_mean
+                if self.method != "mean":
+                    self._m2 = frames_m2
+            else:
+                total = self._count + n
+                delta = frames_mean - self._mean
+                self._mean = self._mean + delta * (float(n) / total)
+                if self.method != "mean":
+                    self._m2 = self._m2 + frames_m2 \
+                        + np.square(delta) * (float(self._count) * n / total)
+        self._count += n
+
+    def _finish_segment(self):
+        """Appends the summary of the current segment to the output"""
+        if self.method == "mean":
+            row = self._mean
+        elif self.method == "max":
+            row = self._max
+        else:
+            std = np.sqrt(self._m2 / self._count)
+            row = std if self.method == "std" else np.concatenate([self._mean, std])
+        self._rows.append(np.asarray(row, dtype=np.float32))
+        self._reset()
+
+    def update(self, embedding):
+        """
+        Adds a batch of consecutive frames.
+
+        Parameters
+        ----------
+        embedding : np.ndarray [shape=(T, D)]
+            Embedding of the frames that follow the previously added frames.
+        """
+        idx = 0
+        n_frames = embedding.shape[0]
+        while idx < n_frames:
+            if self.segment_length is None:
+                n = n_frames - idx
+            else:
+                n = min(self.segment_length - self._count, n_frames - idx)
+            self._update_segment(embedding[idx:idx + n])
+            idx += n
+            if self._count == self.segment_length:
+                self._finish_segment()
+
+    def finalize(self):
+        """
+        Returns the summaries of all segments, including the last partial
+        segment.
+
+        Returns
+        -------
+        embedding : np.ndarray [shape=(S, D) or (S, 2*D)]
+            Summary of each segment, as float32.
+        timestamps : np.ndarray [shape=(S,)]
+            Timestamp of the first frame of each segment.
+        """
+        if self._count > 0:
+            self._finish_segment()
+        if not self._rows:
+            raise OpenL3Error('No frames to aggregate')
+
+        embedding = np.stack(self._rows)
+        segment_length = self.segment_length or 0
+        ts = np.arange(embedding.shape[0]) * (segment_length * self.hop_size)
+        return embedding, ts
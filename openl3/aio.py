@@ -0,0 +1,203 @@
+# Asyncio API. This module requires Python 3.5+, and `aget_embedding` is only
+# exported by `openl3` on these versions.
+import asyncio
+import threading
+import weakref
+import numpy as np
+from concurrent.futures import ThreadPoolExecutor
+from six import string_types
+from .core import _preprocess_audio, _get_audio_frames, _read_audio
+from .server import EmbeddingServer, DEFAULT_MAX_BATCH_SIZE, DEFAULT_MAX_WAIT
+from .openl3_exceptions import OpenL3Error
+
+
+# Maximum number of requests processed at the same time by default
+DEFAULT_MAX_PENDING = 64
+
+# Number of threads that decode and resample audio by default
+DEFAULT_MAX_WORKERS = 4
+
+_DEFAULT_EMBEDDER = None
+_DEFAULT_EMBEDDER_LOCK = threading.Lock()
+
+# Returns the loop running the current coroutine. `asyncio.get_running_loop`
+# was added in Python 3.7, and calling `asyncio.get_event_loop` from a
+# coroutine is deprecated since then.
+_get_running_loop = getattr(asyncio, 'get_running_loop', asyncio.get_event_loop)
+
+
+def _prepare_frames(audio, sr, center, hop_size, resample_method):
+    """Decodes (if `audio` is a path), resamples and frames audio"""
+    if isinstance(audio, string_types):
+        audio, sr = _read_audio(audio)
+    elif sr is None:
+        raise OpenL3Error('The sampling rate is required for audio data')
+    audio = _preprocess_audio(audio, sr, resample_method)
+    return _get_audio_frames(audio, hop_size, center)
+
+
+def _set_future(future, request):
+    """Sets the result of the future of a micro-batcher request"""
+    if future.cancelled():
+        return
+    if request.error is not None:
+        future.set_exception(OpenL3Error(request.error))
+    else:
+        future.set_result(request.embedding)
+
+
+def _get_callback(loop, future):
+    """Returns a micro-batcher callback that sets a future in its event loop"""
+    def callback(request):
+        try:
+            loop.call_soon_threadsafe(_set_future, future, request)
+        except RuntimeError:
+            # The event loop is closed
+            pass
+    return callback
+
+
+class AsyncEmbedder(object):
+    """
+    Computes embeddings without blocking the event loop. Audio is decoded,
+    resampled and framed on a thread pool, and inference runs in the
+    inference thread of a `openl3.server.MicroBatcher` per model, which
+    keeps the model resident and shares inference batches between
+    coroutines.
+
+    Parameters
+    ----------
+    max_pending : int
+        Maximum number of requests processed at the same time. Further
+        requests wait for one of them to finish, which bounds the memory
+        used by decoded audio.
+    max_workers : int
+        Number of threads that decode and resample audio.
+    max_batch_size : int
+        Maximum number of windows per inference call.
+    max_wait : float
+        Maximum time in seconds that a request waits for other requests to
+        share its inference batches.
+    load_model : callable or None
+        Function called with (input_repr, content_type, embedding_size,
+        frontend) to load a model. By default, models are taken from the
+        model cache as `openl3.models.ThreadSafeModel` objects.
+    """
+    def __init__(self, max_pending=DEFAULT_MAX_PENDING, max_workers=DEFAULT_MAX_WORKERS,
+                 max_batch_size=DEFAULT_MAX_BATCH_SIZE, max_wait=DEFAULT_MAX_WAIT,
+                 load_model=None):
+        if not isinstance(max_pending, int) or isinstance(max_pending, bool) or max_pending < 1:
+            raise OpenL3Error('Invalid maximum number of pending requests {}'.format(max_pending))
+        if not isinstance(max_workers, int) or isinstance(max_workers, bool) or max_workers < 1:
+            raise OpenL3Error('Invalid number of workers {}'.format(max_workers))
+
+        self.max_pending = max_pending
+        self.n_pending = 0
+        self._executor = ThreadPoolExecutor(max_workers)
+        self._server = EmbeddingServer(max_batch_size=max_batch_size, max_wait=max_wait,
+                                       load_model=load_model)
+        # asyncio primitives are bound to an event loop
+        self._semaphores = weakref.WeakKeyDictionary()
+        self._lock = threading.Lock()
+
+    def _get_semaphore(self, loop):
+        with self._lock:
+            semaphore = self._semaphores.get(loop)
+            if semaphore is None:
+                semaphore = self._semaphores[loop] = asyncio.Semaphore(self.max_pending)
+            return semaphore
+
+    async def preload(self, configs):
+        """
+        Loads models without blocking the event loop (see
+        `openl3.server.EmbeddingServer.preload`).
+        """
+        loop = _get_running_loop()
+        await loop.run_in_executor(self._executor, self._server.preload, list(configs))
+
+    async def get_embedding(self, audio, sr=None, input_repr="mel256", content_type="music",
+                            embedding_size=6144, center=True, hop_size=0.1,
+                            resample_method="kaiser_best", frontend="kapre"):
+        """
+        Computes the embedding of audio data or of an audio file. The
+        parameters are the same as for `openl3.get_embedding`, except that
+        `audio` can be the path to an audio file, in which case `sr` is
+        ignored. If the coroutine is cancelled while it waits for inference,
+        its windows are dropped from the inference queue.
+
+        Returns
+        -------
+            embedding : np.ndarray [shape=(T, D)]
+                Array of embeddings for each window.
+            timestamps : np.ndarray [shape=(T,)]
+                Array of timestamps corresponding to each embedding in the output.
+        """
+        config = self._server.get_config(input_repr, content_type, embedding_size, frontend,
+                                         center, hop_size, resample_method)
+        loop = _get_running_loop()
+
+        async with self._get_semaphore(loop):
+            self.n_pending += 1
+            try:
+                x = await loop.run_in_executor(self._executor, _prepare_frames, audio, sr,
+                                               center, hop_size, resample_method)
+
+                future = loop.create_future()
+                request = self._server.get_batcher(*config).submit(
+                    x, _get_callback(loop, future))
+                try:
+                    embedding = await future
+                except asyncio.CancelledError:
+                    request.cancel()
+                    raise
+            finally:
+                self.n_pending -= 1
+
+        ts = np.arange(embedding.shape[0]) * hop_size
+        return embedding, ts
+
+    def close(self):
+        """Stops the inference threads and the thread pool"""
+        self._server.close()
+        self._executor.shutdown()
+
+
+def get_default_embedder():
+    """Returns the `AsyncEmbedder` used by `aget_embedding`, created on first use"""
+    global _DEFAULT_EMBEDDER
+    with _DEFAULT_EMBEDDER_LOCK:
+        if _DEFAULT_EMBEDDER is None:
+            _DEFAULT_EMBEDDER = AsyncEmbedder()
+        return _DEFAULT_EMBEDDER
+
+
+async def aget_embedding(audio, sr=None, input_repr="mel256", content_type="music",
+                         embedding_size=6144, center=True, hop_size=0.1,
+                         resample_method="kaiser_best", frontend="kapre"):
+    """
+    Computes the embedding of audio data or of an audio file without blocking
+    the event loop, with a process-wide `AsyncEmbedder` (see
+    `get_default_embedder`). Concurrent calls share a single resident model
+    per model configuration and share inference batches.
+
+    Parameters
+    ----------
+    audio : np.ndarray [shape=(N,) or (N,C)] or str
+        1D numpy array of audio data, or path to an audio file.
+    sr : int or None
+        Sampling rate of the audio data. Ignored if `audio` is a path.
+    input_repr, content_type, embedding_size, center, hop_size,
+    resample_method, frontend
+        Same as for `openl3.get_embedding`.
+
+    Returns
+    -------
+        embedding : np.ndarray [shape=(T, D)]
+            Array of embeddings for each window.
+        timestamps : np.ndarray [shape=(T,)]
+            Array of timestamps corresponding to each embedding in the output.
+    """
+    return await get_default_embedder().get_embedding(
+        audio, sr, input_repr=input_repr, content_type=content_type,
+        embedding_size=embedding_size, center=center, hop_size=hop_size,
+        resample_method=resample_method, frontend=frontend)
@@ -0,0 +1,364 @@
+import os
+import json
+import errno
+import shutil
+import hashlib
+import tempfile
+import threading
+import weakref
+import numpy as np
+from numbers import Integral
+from .version import version
+from .utils import write_atomic, replace_file
+from .openl3_exceptions import OpenL3Error
+
+
+# Default maximum size of an embedding cache, in bytes
+DEFAULT_CACHE_SIZE = 10 * 1024 ** 3
+
+# Prefix of the names of models constructed by `load_embedding_model`
+MODEL_NAME_PREFIX = 'openl3'
+
+# Weight digests of models that were not constructed by openl3
+_MODEL_DIGESTS = weakref.WeakKeyDictionary()
+_MODEL_DIGESTS_LOCK = threading.Lock()
+
+
+def get_model_name(input_repr, content_type, embedding_size, frontend="kapre",
+                   optimize=False, use_xla=False):
+    """
+    Returns the name given to the model with the given characteristics by
+    `load_embedding_model`. Optimized and XLA-compiled models only match the
+    plain model up to rounding, so their names (and thus their cached
+    embeddings) are distinct.
+    """
+    name = '{}_{}_{}_{}_{}'.format(MODEL_NAME_PREFIX, input_repr, content_type,
+                                   embedding_size, frontend)
+    if optimize:
+        name += '_optimize'
+    if use_xla:
+        name += '_xla'
+    return name
+
+
+def get_model_id(model):
+    """
+    Returns a string that identifies the embeddings computed by a model. For
+    models loaded with `load_embedding_model` this is the model name, and
+    for other models it is a digest of the input shape and the weights.
+
+    Parameters
+    ----------
+    model : keras.models.Model
+        Model object.
+
+    Returns
+    -------
+    model_id : str
+        Model identifier.
+    """
+    if model.name.startswith(MODEL_NAME_PREFIX + '_'):
+        return model.name
+
+    with _MODEL_DIGESTS_LOCK:
+        if model not in _MODEL_DIGESTS:
+            h = hashlib.sha256(str(model.input_shape).encode('utf-8'))
+            for weights in model.get_weights():
+                h.update(np.ascontiguousarray(weights).tobytes())
+            _MODEL_DIGESTS[model] = h.hexdigest()
+        return _MODEL_DIGESTS[model]
+
+
+def _init_audio_hash(n_samples, n_channels, sr):
+    """Returns a hash object for decoded audio with the given properties"""
+    return hashlib.sha256('{}:{}:{}:'.format(n_samples, n_channels, sr).encode('utf-8'))
+
+
+def _update_audio_hash(h, audio):
+    """Adds a block of decoded float64 audio samples to an audio hash"""
+    h.update(np.ascontiguousarray(audio, dtype=np.float64).tobytes())
+
+
+def get_audio_hash(audio, sr):
+    """
+    Returns a digest of decoded audio samples and their sampling rate.
+
+    Parameters
+    ----------
+    audio : np.ndarray [shape=(N,) or (N,C)]
+        Decoded audio data.
+    sr : int
+        Sampling rate.
+
+    Returns
+    -------
+    audio_hash : str
+        Hexadecimal digest.
+    """
+    n_channels = 1 if audio.ndim == 1 else audio.shape[1]
+    h = _init_audio_hash(audio.shape[0], n_channels, sr)
+    _update_audio_hash(h, audio)
+    return h.hexdigest()
+
+
+def get_sound_file_hash(sound_file, block_size=2 ** 20):
+    """
+    Returns a digest of the decoded samples of an open sound file, read
+    block by block, that is equal to the digest returned by `get_audio_hash`
+    for the whole file. The file position is reset to the beginning.
+
+    Parameters
+    ----------
+    sound_file : soundfile.SoundFile
+        Open sound file.
+    block_size : int
+        Number of samples read at a time.
+
+    Returns
+    -------
+    audio_hash : str
+        Hexadecimal digest.
+    """
+    h = _init_audio_hash(sound_file.frames, sound_file.channels, sound_file.samplerate)
+    sound_file.seek(0)
+    for block in sound_file.blocks(blocksize=block_size):
+        _update_audio_hash(h, block)
+    sound_file.seek(0)
+    return h.hexdigest()
+
+
+def get_cache_key(audio_hash, model_id, center, hop_size, resample_method,
+                  output_format="float32", compress=False, aggregate=None,
+                  segment_duration=None, projection_id=None, silence_threshold=None):
+    """
+    Returns the cache key of the embedding of some audio.
+
+    Parameters
+    ----------
+    audio_hash : str
+        Digest of the decoded audio, see `get_audio_hash`.
+    model_id : str
+        Model identifier, see `get_model_id`.
+    center : boolean
+        Whether the audio is centered.
+    hop_size : float
+        Hop size in seconds.
+    resample_method : str
+        Resampling method.
+    output_format : str
+        Storage format of the embedding.
+    compress : boolean
+        Whether the output file is compressed.
+    aggregate : str or None
+        Aggregation method of the embedding.
+    segment_duration : float or None
+        Duration of the aggregation segments.
+    projection_id : str or None
+        Identifier of the PCA projection of the embedding (see
+        `openl3.pca.EmbeddingProjection.id`).
+    silence_threshold : float or None
+        Level in dBFS below which windows are not run through the model.
+
+    Returns
+    -------
+    key : str
+        Hexadecimal cache key, which also depends on the openl3 version.
+    """
+    params = [audio_hash, model_id, bool(center), float(hop_size),
+              str(resample_method), str(output_format), bool(compress), version]
+    if aggregate is not None:
+        params += [str(aggregate), segment_duration]
+    if projection_id is not None:
+        params += [str(projection_id)]
+    if silence_threshold is not None:
+        params += ['silence', float(silence_threshold)]
+    return hashlib.sha256(json.dumps(params).encode('utf-8')).hexdigest()
+
+
+class EmbeddingCache(object):
+    """
+    On-disk cache of embedding outputs, keyed by the content of the decoded
+    audio and the embedding parameters (see `get_cache_key`). Each entry is
+    stored as a .npz file in the same format as the outputs of
+    `process_file`. Entries are written atomically, so the cache can be
+    shared by several processes, and the least recently used entries are
+    removed when the cache grows larger than `max_size`.
+
+    Parameters
+    ----------
+    cache_dir : str
+        Path to the cache directory. It is created if it does not exist.
+    max_size : int
+        Maximum total size of the cached entries, in bytes.
+    """
+    def __init__(self, cache_dir, max_size=DEFAULT_CACHE_SIZE):
+        if not isinstance(max_size, Integral) or isinstance(max_size, bool) or max_size < 0:
+            raise OpenL3Error('Invalid cache size {}'.format(max_size))
+
+        self.cache_dir = cache_dir
+        self.max_size = max_size
+        self._lock = threading.Lock()
+
+        try:
+            os.makedirs(cache_dir)
+        except OSError as e:
+            if e.errno != errno.EEXIST or not os.path.isdir(cache_dir):
+                raise OpenL3Error('Could not create cache directory "{}"'.format(cache_dir))
+
+        self._size = sum(size for _, _, size in self._iter_entries())
+
+    def __getstate__(self):
+        # The lock cannot be pickled; a copy sent to another process gets its own
+        state = self.__dict__.copy()
+        del state['_lock']
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._lock = threading.Lock()
+
+    def _get_entry_path(self, key):
+        """Returns the path of the entry with the given key"""
+        return os.path.join(self.cache_dir, key[:2], key + '.npz')
+
+    def _iter_entries(self):
+        """Yields (path, last access time, size) for each cached entry"""
+        for subdir in os.listdir(self.cache_dir):
+            subdir_path = os.path.join(self.cache_dir, subdir)
+            if not os.path.isdir(subdir_path):
+                continue
+            for fname in os.listdir(subdir_path):
+                if not fname.endswith('.npz'):
+                    continue
+                path = os.path.join(subdir_path, fname)
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    # Removed by another process
+                    continue
+                yield path, stat.st_mtime, stat.st_size
+
+    def get(self, key):
+        """
+        Returns the path of the cached output with the given key, or None if
+        it is not in the cache. The entry is marked as recently used.
+        """
+        path = self._get_entry_path(key)
+        try:
+            os.utime(path, None)
+        except OSError:
+            return None
+        return path
+
+    def load(self, key):
+        """
+        Returns the cached (embedding, timestamps) with the given key, or
+        None if they are not in the cache.
+        """
+        path = self.get(key)
+        if path is None:
+            return None
+        try:
+            with np.load(path) as data:
+                return data['embedding'], data['timestamps']
+        except (IOError, OSError, KeyError, ValueError):
+            return None
+
+    def copy_to(self, key, output_path):
+        """
+        Copies the cached output with the given key to `output_path`.
+        Returns False if it is not in the cache.
+        """
+        path = self.get(key)
+        if path is None:
+            return False
+
+        def write(f):
+            with open(path, 'rb') as src:
+                shutil.copyfileobj(src, f)
+        try:
+            write_atomic(output_path, write)
+        except (IOError, OSError):
+            # Removed by another process
+            return False
+        return True
+
+    def put(self, key, embedding, timestamps):
+        """Adds an embedding and its timestamps to the cache"""
+        self._add(key, lambda f: np.savez(f, embedding=embedding, timestamps=timestamps))
+
+    def put_file(self, key, path):
+        """Adds an output file saved by `process_file` to the cache"""
+        def write(f):
+            with open(path, 'rb') as src:
+                shutil.copyfileobj(src, f)
+        self._add(key, write)
+
+    def _add(self, key, write):
+        """Writes an entry to a temporary file and moves it into place"""
+        path = self._get_entry_path(key)
+        entry_dir = os.path.dirname(path)
+        try:
+            os.makedirs(entry_dir)
+        except OSError as e:
+            if e.errno != errno.EEXIST:
+                raise
+
+        tmp_fd, tmp_path = tempfile.mkstemp(suffix='.tmp', dir=entry_dir)
+        try:
+            with os.fdopen(tmp_fd, 'wb') as f:
+                write(f)
+            size = os.path.getsize(tmp_path)
+            if size > self.max_size:
+                return
+            with self._lock:
+                # An existing entry with the same key is replaced
+                try:
+                    size -= os.path.getsize(path)
+                except OSError:
+                    pass
+                replace_file(tmp_path, path)
+                self._size += size
+                if self._size > self.max_size:
+                    self._evict()
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+    def _evict(self):
+        """Removes least recently used entries until the cache fits its maximum size"""
+        entries = sorted(self._iter_entries(), key=lambda entry: entry[1])
+        self._size = sum(size for _, _, size in entries)
+        for path, _, size in entries:
+            if self._size <= self.max_size:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                # Removed by another process
+                pass
+            self._size -= size
+
+    def clear(self):
+        """Removes all cached entries"""
+        with self._lock:
+            for path, _, _ in list(self._iter_entries()):
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+            self._size = 0
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        del state['_lock']
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._lock = threading.Lock()
+
+    @property
+    def size(self):
+        """Total size of the cached entries in bytes, as tracked by this process"""
+        return self._size
@@ -1,13 +1,51 @@
 from __future__ import print_function
 import os
 import sys
-import sklearn.decomposition
-from openl3 import process_file
-from openl3.models import load_embedding_model
+import json
+import fnmatch
+import threading
+import warnings
+import traceback
+import multiprocessing
+import numpy as np
+from openl3 import process_file, process_file_configs, get_output_path
+from openl3.core import (
+    TARGET_SR, OUTPUT_FORMATS, is_valid_output, get_config_suffix, _read_audio,
+    _preprocess_audio, _get_audio_frames, _iter_frame_batches, _predict_batches, _save_output,
+    _validate_configs, _validate_silence_threshold, _validate_batch_size, _resolve_batch_size,
+    _SilenceGate
+)
+from openl3.models import load_embedding_model, get_model_cache_info
+from openl3.aggregate import AGGREGATE_METHODS, EmbeddingAggregator, validate_aggregate_args
+from openl3.pca import get_projection
+from openl3.tuning import DEFAULT_MEMORY_BUDGET, set_memory_budget
+from openl3.server import (
+    DEFAULT_MAX_BATCH_SIZE, DEFAULT_MAX_WAIT, DEFAULT_MAX_REQUEST_SIZE, DEFAULT_MAX_DURATION,
+    DEFAULT_MAX_FRAMES, serve
+)
+from openl3.cache import (
+    EmbeddingCache, DEFAULT_CACHE_SIZE, get_model_name, get_audio_hash, get_cache_key
+)
 from openl3.openl3_exceptions import OpenL3Error
+from openl3.openl3_warnings import OpenL3Warning
 from argparse import ArgumentParser, RawDescriptionHelpFormatter, ArgumentTypeError
-from collections import Iterable
+try:
+    from collections.abc import Iterable
+except ImportError:
+    from collections import Iterable
+from itertools import chain
+try:
+    from os import scandir
+except ImportError:
+    from scandir import scandir
 from six import string_types
+from six.moves import queue
+
+
+# Extensions of the audio formats that can be read with soundfile
+AUDIO_EXTENSIONS = ('.wav', '.wave', '.flac', '.ogg', '.oga', '.aif', '.aiff', '.aifc',
+                    '.au', '.snd', '.caf', '.w64', '.rf64', '.mp3', '.voc', '.sd2',
+                    '.htk', '.nist', '.sph', '.paf', '.pvf', '.xi', '.svx', '.mat')
 
 
 def positive_float(value):
@@ -22,34 +60,226 @@ def positive_float(value):
     return fvalue
 
 
-def get_file_list(input_list):
-    """Get list of files from the list of inputs"""
+def positive_int(value):
+    """An argparse type method for accepting only positive ints"""
+    try:
+        ivalue = int(value)
+    except (ValueError, TypeError) as e:
+        raise ArgumentTypeError('Expected a positive int, error message: '
+                                '{}'.format(e))
+    if ivalue <= 0 or ivalue != float(value):
+        raise ArgumentTypeError('Expected a positive int')
+    return ivalue
+
+
+def batch_size_type(value):
+    """An argparse type method for accepting positive ints or 'auto'"""
+    if value == 'auto':
+        return value
+    return positive_int(value)
+
+
+def get_file_list(input_list, recursive=False, extensions=AUDIO_EXTENSIONS,
+                  include=None, exclude=None):
+    """
+    Get list of files from the list of inputs. See `iter_file_list` for a
+    description of the parameters.
+    """
+    return list(iter_file_list(input_list, recursive=recursive, extensions=extensions,
+                               include=include, exclude=exclude))
+
+
+def iter_file_list(input_list, recursive=False, extensions=AUDIO_EXTENSIONS,
+                   include=None, exclude=None):
+    """
+    Lazily yields the files of a list of inputs. Directories are scanned with
+    `os.scandir` as the files are consumed, so that processing can start
+    before a large directory tree has been fully listed.
+
+    Parameters
+    ----------
+    input_list : iterable of str
+        File and directory paths. It can be an iterator, e.g. lines read
+        from a file list.
+    recursive : boolean
+        If True, subdirectories of the input directories are traversed too.
+        Symbolic links to directories are not followed.
+    extensions : iterable of str or None
+        File extensions (case-insensitive) of the files found in
+        directories. If None, all files are included.
+    include : iterable of str or None
+        Glob patterns. If given, only the files found in directories whose
+        path relative to the input directory matches one of the patterns
+        are included.
+    exclude : iterable of str or None
+        Glob patterns. Files and subdirectories found in directories whose
+        path relative to the input directory matches one of the patterns
+        are excluded.
+
+    Yields
+    ------
+    filepath : str
+        Path to a file. Input files are always yielded (as absolute paths),
+        the filters only apply to the contents of directories.
+    """
     if not isinstance(input_list, Iterable) or isinstance(input_list, string_types):
         raise ArgumentTypeError('input_list must be iterable (and not string)')
-    file_list = []
+
+    if extensions is not None:
+        extensions = set(ext.lower() if ext.startswith('.') else '.' + ext.lower()
+                         for ext in extensions)
+    include = list(include) if include else None
+    exclude = list(exclude) if exclude else None
+
     for item in input_list:
         if os.path.isfile(item):
-            file_list.append(os.path.abspath(item))
+            yield os.path.abspath(item)
         elif os.path.isdir(item):
-            for fname in os.listdir(item):
-                path = os.path.join(item, fname)
-                if os.path.isfile(path):
-                    file_list.append(path)
+            for path in _iter_dir(item, recursive, extensions, include, exclude):
+                yield path
         else:
             raise OpenL3Error('Could not find {}'.format(item))
 
-    return file_list
+
+def _iter_dir(root, recursive, extensions, include, exclude):
+    """Yields the files of a directory that pass the filters"""
+    stack = [(root, '')]
+    while stack:
+        dirpath, reldir = stack.pop()
+        for entry in scandir(dirpath):
+            relpath = os.path.join(reldir, entry.name) if reldir else entry.name
+            if exclude and any(fnmatch.fnmatch(relpath, p) for p in exclude):
+                continue
+
+            if entry.is_dir(follow_symlinks=False):
+                if recursive:
+                    stack.append((entry.path, relpath))
+                continue
+
+            if not entry.is_file():
+                continue
+            if extensions is not None and \
+                    os.path.splitext(entry.name)[1].lower() not in extensions:
+                continue
+            if include and not any(fnmatch.fnmatch(relpath, p) for p in include):
+                continue
+            yield entry.path
+
+
+def read_file_list(path):
+    """
+    Lazily yields the paths listed in a text file, one per line. Empty lines
+    and lines starting with "#" are ignored.
+
+    Parameters
+    ----------
+    path : str
+        Path to the text file, or "-" to read from standard input.
+
+    Yields
+    ------
+    filepath : str
+        Listed path.
+    """
+    f = sys.stdin if path == '-' else open(path)
+    try:
+        for line in f:
+            line = line.strip()
+            if line and not line.startswith('#'):
+                yield line
+    finally:
+        if f is not sys.stdin:
+            f.close()
+
+
+class RunManifest(object):
+    """
+    Log of the status of each file of a run, stored as JSON lines. Each line
+    records the "pending", "completed" or "failed" status of a file (and the
+    error for failed files); the last line for a file is its current status.
+    Lines are flushed as they are written, so the manifest is up to date if
+    the run is interrupted.
+
+    Parameters
+    ----------
+    path : str
+        Path to the manifest file. Records are appended to an existing file.
+    """
+    def __init__(self, path):
+        self.path = path
+        self._file = open(path, 'a')
+        self._lock = threading.Lock()
+
+    def record(self, filepath, status, output_path=None, error=None):
+        """Appends the status of a file to the manifest"""
+        entry = {'file': filepath, 'status': status}
+        if output_path is not None:
+            entry['output'] = output_path
+        if error is not None:
+            entry['error'] = error
+        with self._lock:
+            self._file.write(json.dumps(entry) + '\n')
+            self._file.flush()
+
+    def close(self):
+        """Closes the manifest file"""
+        self._file.close()
+
+
+def read_manifest(path):
+    """
+    Reads a run manifest written by `run`.
+
+    Parameters
+    ----------
+    path : str
+        Path to the manifest file.
+
+    Returns
+    -------
+    files : dict
+        Dictionary with "completed", "failed" and "pending" keys, mapping
+        each status to the list of files whose last recorded status is that
+        status.
+    """
+    statuses = {}
+    with open(path) as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                entry = json.loads(line)
+            except ValueError:
+                # Line truncated by an interrupted run
+                continue
+            # Re-insert so that files are listed in the order of their last update
+            statuses.pop(entry['file'], None)
+            statuses[entry['file']] = entry['status']
+
+    files = {'completed': [], 'failed': [], 'pending': []}
+    for filepath, status in statuses.items():
+        files[status].append(filepath)
+    return files
 
 
 def run(inputs, output_dir=None, suffix=None, input_repr="mel256", content_type="music",
-        embedding_size=6144, center=True, hop_size=0.1, verbose=False):
+        embedding_size=6144, center=True, hop_size=0.1, resample_method="kaiser_best",
+        frontend="kapre", streaming=False, jobs=1, batch_size=32, memory_budget=None,
+        cache_dir=None,
+        cache_size=DEFAULT_CACHE_SIZE, resume=False, manifest=None, recursive=False,
+        extensions=AUDIO_EXTENSIONS, include=None, exclude=None, file_list_path=None,
+        output_format="float32", compress=False, store=None, aggregate=None,
+        segment_duration=None, pca=None, silence_threshold=None, configs=None, verbose=False):
     """
     Computes and saves L3 embedding for given inputs.
 
     Parameters
     ----------
     inputs : list of str, or str
-        File/directory path or list of file/directory paths to be processed
+        File/directory path or list of file/directory paths to be processed.
+        Files are discovered lazily (see `iter_file_list`), so processing
+        starts before large directory trees have been fully listed.
     output_dir : str or None
         Path to directory for saving output files. If None, output files will
         be saved to the directory containing the input file.
@@ -67,6 +297,92 @@ def run(inputs, output_dir=None, suffix=None, input_repr="mel256", content_type=
         to center of window.
     hop_size : float
         Hop size in seconds.
+    resample_method : "kaiser_best", "kaiser_fast" or "polyphase"
+        Method used to resample audio that is not 48kHz.
+    frontend : "kapre" or "numpy"
+        Front-end used to compute the spectrogram input of the model.
+    streaming : boolean
+        If True, process files block by block so that memory usage does not
+        depend on the duration of the files.
+    jobs : int
+        Number of worker processes used to decode and resample files. If
+        greater than 1, decoding runs in parallel with inference and saving.
+        The workers are started with the "spawn" method where available, so
+        scripts calling `run` with several jobs must guard their entry point
+        with ``if __name__ == '__main__':``.
+    batch_size : int or "auto"
+        Maximum number of windows per inference call. If "auto", the batch
+        size with the best throughput within `memory_budget` is measured on
+        first use and cached per host and model (see
+        `openl3.tuning.get_batch_size`).
+    memory_budget : int or None
+        Memory budget of an inference batch in bytes, used with
+        ``batch_size="auto"``. If None, the budget set with
+        `openl3.tuning.set_memory_budget` is used.
+    cache_dir : str or None
+        Path to the directory of an embedding cache. If given, files whose
+        decoded audio has already been processed with the same parameters are
+        copied from the cache instead of being processed again.
+    cache_size : int
+        Maximum size of the embedding cache in bytes.
+    resume : boolean
+        If True, files that already have a valid output file are skipped, so
+        that an interrupted run can be resumed. Outputs are always written
+        atomically, so an interrupted run never leaves a partial output.
+    manifest : str or None
+        Path to a run manifest (see `RunManifest`) recording the files that
+        are pending, completed and failed. Files are recorded as pending when
+        they are discovered. A file that cannot be processed is recorded as
+        failed and the other files are still processed; an `OpenL3Error`
+        listing the failed files is raised at the end of the run.
+    recursive : boolean
+        If True, traverse the subdirectories of the input directories.
+    extensions : iterable of str or None
+        Extensions of the files processed in the input directories. By
+        default only audio files are processed. If None, all files are.
+    include : iterable of str or None
+        Glob patterns of the (relative) paths of the files processed in the
+        input directories.
+    exclude : iterable of str or None
+        Glob patterns of the (relative) paths of the files and directories
+        skipped in the input directories.
+    file_list_path : str or None
+        Path to a text file listing files (or directories) to process, one
+        per line, in addition to `inputs`. If "-", the list is read from
+        standard input.
+    output_format : "float32", "float16" or "int8"
+        Storage format of the embeddings (see `process_file`).
+    compress : boolean
+        If True, compress the output files.
+    store : str or None
+        Path to an embedding store directory (see
+        `openl3.store.EmbeddingStore`). If given, the embeddings of all files
+        are appended to the store instead of being saved to one output file
+        per input file, and `output_dir` and `suffix` are ignored. It cannot
+        be used with `cache_dir`.
+    aggregate : "mean", "max", "std", "meanstd" or None
+        If given, the embeddings are summarised over each file, or over
+        segments of `segment_duration` seconds, before being saved (see
+        `openl3.get_embedding`).
+    segment_duration : float or None
+        Duration of the aggregation segments in seconds.
+    pca : str, openl3.pca.EmbeddingProjection or None
+        PCA projection, or path to a saved projection (see
+        `openl3.pca.fit_pca`), applied to the embeddings as they are
+        computed.
+    silence_threshold : float or None
+        If given, RMS level in dBFS below which windows are not run through
+        the model, and get the embedding of a window of zeros instead (see
+        `openl3.get_embedding`).
+    configs : list of tuple or None
+        Model configurations, as (input_repr, content_type, embedding_size)
+        or (input_repr, content_type, embedding_size, frontend) tuples. If
+        given, each file is decoded and resampled once, and the embeddings of
+        all the configurations are saved to one output file per
+        configuration (see `openl3.process_file_configs`), instead of using
+        `input_repr`, `content_type` and `embedding_size`. It cannot be used
+        with `streaming`, `jobs`, `cache_dir`, `store`, `aggregate`, `pca`
+        or `silence_threshold`.
     quiet : boolean
         If True, suppress all non-error output to stdout
 
@@ -74,43 +390,499 @@ def run(inputs, output_dir=None, suffix=None, input_repr="mel256", content_type=
     -------
     """
 
+    if not isinstance(jobs, int) or isinstance(jobs, bool) or jobs < 1:
+        raise OpenL3Error('Invalid number of jobs {}'.format(jobs))
+
+    if jobs > 1 and streaming:
+        raise OpenL3Error('Parallel processing is not supported in streaming mode')
+
+    _validate_batch_size(batch_size)
+    if memory_budget is not None:
+        set_memory_budget(memory_budget)
+
+    if str(output_format) not in OUTPUT_FORMATS:
+        raise OpenL3Error('Invalid output format "{}"'.format(output_format))
+
+    validate_aggregate_args(aggregate, segment_duration, hop_size)
+    _validate_silence_threshold(silence_threshold)
+    pca = get_projection(pca)
+
+    if configs is not None:
+        configs = _validate_configs(configs, center, hop_size, 0, resample_method, frontend)
+        if streaming or jobs > 1 or cache_dir or store is not None or aggregate is not None \
+                or pca is not None or silence_threshold is not None:
+            raise OpenL3Error('Several model configurations cannot be used with streaming, '
+                              'parallel jobs, an embedding cache or store, aggregation, PCA '
+                              'or a silence threshold')
+
     if isinstance(inputs, string_types):
-        file_list = [inputs]
-    elif isinstance(inputs, Iterable):
-        file_list = get_file_list(inputs)
+        file_list = iter([inputs])
+    elif isinstance(inputs, Iterable) or (inputs is None and file_list_path is not None):
+        if file_list_path is not None:
+            inputs = chain(inputs or [], read_file_list(file_list_path))
+        file_list = iter_file_list(inputs, recursive=recursive, extensions=extensions,
+                                   include=include, exclude=exclude)
     else:
         raise OpenL3Error('Invalid input: {}'.format(str(inputs)))
 
-    if len(file_list) == 0:
+    # Only look at the first file, so that discovery continues lazily
+    try:
+        file_list = chain([next(file_list)], file_list)
+    except StopIteration:
         print('openl3: No WAV files found in {}. Aborting.'.format(str(inputs)))
         sys.exit(-1)
 
+    if store is not None and cache_dir:
+        raise OpenL3Error('An embedding cache cannot be used with an embedding store')
+
+    cache = EmbeddingCache(cache_dir, max_size=cache_size) if cache_dir else None
+
+    if store is not None:
+        # Imported here, so that h5py is only loaded when a store is used
+        from openl3.store import EmbeddingStore
+        store = EmbeddingStore(store, mode='a', output_format=output_format,
+                               compression='gzip' if compress else None)
+
+    if manifest is not None:
+        manifest = RunManifest(manifest)
+        file_list = _record_pending(file_list, manifest)
+
+    try:
+        if configs is not None:
+            _run_configs(file_list, configs, output_dir=output_dir, suffix=suffix,
+                         center=center, hop_size=hop_size, batch_size=batch_size,
+                         resample_method=resample_method, frontend=frontend,
+                         resume=resume, manifest=manifest,
+                         output_format=output_format, compress=compress, verbose=verbose)
+        elif jobs > 1:
+            _run_pipeline(file_list, output_dir=output_dir, suffix=suffix,
+                          input_repr=input_repr, content_type=content_type,
+                          embedding_size=embedding_size, center=center,
+                          hop_size=hop_size, resample_method=resample_method,
+                          frontend=frontend, jobs=jobs, batch_size=batch_size,
+                          cache=cache, resume=resume,
+                          manifest=manifest, output_format=output_format,
+                          compress=compress, store=store, aggregate=aggregate,
+                          segment_duration=segment_duration, pca=pca,
+                          silence_threshold=silence_threshold, verbose=verbose)
+        else:
+            _run_serial(file_list, output_dir=output_dir, suffix=suffix,
+                        input_repr=input_repr, content_type=content_type,
+                        embedding_size=embedding_size, center=center,
+                        hop_size=hop_size, batch_size=batch_size,
+                        resample_method=resample_method, frontend=frontend,
+                        streaming=streaming, cache=cache,
+                        resume=resume, manifest=manifest, output_format=output_format,
+                        compress=compress, store=store, aggregate=aggregate,
+                        segment_duration=segment_duration, pca=pca,
+                        silence_threshold=silence_threshold, verbose=verbose)
+    finally:
+        if manifest is not None:
+            manifest.close()
+        if store is not None:
+            store.close()
+
+    if verbose:
+        print('openl3: Done!')
+
+
+def _record_pending(file_list, manifest):
+    """Records each file as pending in the manifest as it is discovered"""
+    for filepath in file_list:
+        manifest.record(filepath, 'pending')
+        yield filepath
+
+
+def _skip_completed(filepath, output_path, resume, manifest, verbose, store=None):
+    """
+    Checks whether a file can be skipped because a valid output already
+    exists (or it is already in the store), and records it as completed if so
+    """
+    if not resume:
+        return False
+    if store is not None:
+        if filepath not in store:
+            return False
+    elif not is_valid_output(output_path):
+        return False
+    if verbose:
+        print('openl3: Skipping (output exists): {}'.format(filepath))
+    if manifest is not None:
+        manifest.record(filepath, 'completed', output_path=output_path)
+    return True
+
+
+def _get_output_path(filepath, suffix, output_dir, store=None):
+    """
+    Returns the path of the output of a file, which is the store directory
+    if the embeddings are appended to a store
+    """
+    if store is not None:
+        return store.path
+    return get_output_path(filepath, (suffix or "") + ".npz", output_dir=output_dir)
+
+
+def _record_failure(filepath, error, failures, manifest, verbose):
+    """Records a file that could not be processed, so that the run can go on"""
+    if manifest is not None:
+        manifest.record(filepath, 'failed', error=error)
+    if verbose:
+        print('openl3: Failed: {}'.format(filepath))
+    failures.append((filepath, error))
+
+
+def _raise_failures(failures):
+    """Raises an error summarising the files that could not be processed, if any"""
+    if not failures:
+        return
+    details = '\n'.join('{}: {}'.format(filepath, error.strip().splitlines()[-1])
+                        for filepath, error in failures)
+    raise OpenL3Error('Could not process {} file(s):\n{}'.format(len(failures), details))
+
+
+def _run_serial(file_list, output_dir=None, suffix=None, input_repr="mel256",
+                content_type="music", embedding_size=6144, center=True,
+                hop_size=0.1, batch_size=32, resample_method="kaiser_best",
+                frontend="kapre",
+                streaming=False, cache=None, resume=False, manifest=None,
+                output_format="float32", compress=False, store=None, aggregate=None,
+                segment_duration=None, pca=None, silence_threshold=None, verbose=False):
+    """Computes and saves L3 embedding for the given files one at a time"""
     # Load model
-    model = load_embedding_model(input_repr, content_type, embedding_size)
+    model = load_embedding_model(input_repr, content_type, embedding_size,
+                                 frontend=frontend)
 
-    # Process all files in the arguments
+    # Process all files in the arguments. A file that cannot be processed is
+    # recorded as failed, and the other files are still processed.
+    failures = []
     for filepath in file_list:
+        output_path = _get_output_path(filepath, suffix, output_dir, store)
+        if _skip_completed(filepath, output_path, resume, manifest, verbose, store):
+            continue
+
         if verbose:
             print('openl3: Processing: {}'.format(filepath))
-        process_file(filepath,
-                     output_dir=output_dir,
-                     suffix=suffix,
-                     model=model,
-                     center=center,
-                     hop_size=hop_size,
-                     verbose=verbose)
-    if verbose:
-        print('openl3: Done!')
+        try:
+            process_file(filepath,
+                         output_dir=output_dir,
+                         suffix=suffix,
+                         model=model,
+                         center=center,
+                         hop_size=hop_size,
+                         batch_size=batch_size,
+                         resample_method=resample_method,
+                         streaming=streaming,
+                         cache=cache,
+                         output_format=output_format,
+                         compress=compress,
+                         store=store,
+                         aggregate=aggregate,
+                         segment_duration=segment_duration,
+                         pca=pca,
+                         silence_threshold=silence_threshold,
+                         verbose=verbose)
+        except Exception:
+            _record_failure(filepath, traceback.format_exc(), failures, manifest, verbose)
+            continue
+
+        if manifest is not None:
+            manifest.record(filepath, 'completed', output_path=output_path)
+
+    _raise_failures(failures)
+
+
+def _run_configs(file_list, configs, output_dir=None, suffix=None, center=True,
+                 hop_size=0.1, batch_size=32, resample_method="kaiser_best",
+                 frontend="kapre",
+                 resume=False, manifest=None, output_format="float32", compress=False,
+                 verbose=False):
+    """
+    Computes and saves the embeddings of several model configurations for the
+    given files one at a time
+    """
+    failures = []
+    for filepath in file_list:
+        output_paths = [get_output_path(filepath, get_config_suffix(config, suffix) + ".npz",
+                                        output_dir=output_dir)
+                        for config in configs]
+        if resume and all(is_valid_output(output_path) for output_path in output_paths):
+            if verbose:
+                print('openl3: Skipping (outputs exist): {}'.format(filepath))
+            if manifest is not None:
+                manifest.record(filepath, 'completed', output_path=output_paths)
+            continue
+
+        if verbose:
+            print('openl3: Processing: {}'.format(filepath))
+        try:
+            process_file_configs(filepath, configs,
+                                 output_dir=output_dir,
+                                 suffix=suffix,
+                                 center=center,
+                                 hop_size=hop_size,
+                                 batch_size=batch_size,
+                                 resample_method=resample_method,
+                                 frontend=frontend,
+                                 skip_existing=resume,
+                                 output_format=output_format,
+                                 compress=compress,
+                                 verbose=verbose)
+        except Exception:
+            _record_failure(filepath, traceback.format_exc(), failures, manifest, verbose)
+            continue
+
+        if manifest is not None:
+            manifest.record(filepath, 'completed', output_path=output_paths)
+
+    _raise_failures(failures)
+
+
+def _get_worker_context():
+    """
+    Returns the multiprocessing context used to start the decoding workers.
+    Models are cached process-wide (see `load_embedding_model`), so a model
+    loaded earlier in this process would be inherited by forked workers,
+    along with the threads of its backend. The workers are therefore started
+    with the "spawn" method where it is available (Python 3.4+). On Python 2
+    the workers can only be forked, and a warning is issued if a model is
+    already loaded.
+    """
+    if hasattr(multiprocessing, 'get_context'):
+        return multiprocessing.get_context('spawn')
+
+    if get_model_cache_info()['size'] > 0:
+        warnings.warn('Forking the decoding workers while embedding models are loaded; '
+                      'call openl3.models.clear_model_cache() first to avoid '
+                      'copying the models into the workers', OpenL3Warning)
+    return multiprocessing
+
+
+def _decode_worker(task_queue, result_queue, resample_method, cache=None,
+                   cache_params=None):
+    """
+    Decode, downmix and resample the files from the task queue. If the
+    embedding of a file is in the cache, it is copied to the output path and
+    the audio is not resampled.
+    """
+    while True:
+        task = task_queue.get()
+        if task is None:
+            result_queue.put(None)
+            break
+        filepath, output_path = task
+        try:
+            audio, sr = _read_audio(filepath)
+            cache_key = None
+            if cache is not None:
+                (model_id, center, hop_size, output_format, compress, aggregate,
+                 segment_duration, projection_id, silence_threshold) = cache_params
+                cache_key = get_cache_key(get_audio_hash(audio, sr), model_id,
+                                          center, hop_size, resample_method,
+                                          output_format, compress, aggregate,
+                                          segment_duration, projection_id,
+                                          silence_threshold)
+                if cache.copy_to(cache_key, output_path):
+                    result_queue.put((filepath, None, None, None))
+                    continue
+            audio = _preprocess_audio(audio, sr, resample_method).astype(np.float32)
+            result_queue.put((filepath, audio, cache_key, None))
+        except Exception:
+            result_queue.put((filepath, None, None, traceback.format_exc()))
+
+
+def _feed_tasks(tasks, task_queue, n_workers, errors):
+    """Put all tasks on the task queue, followed by one sentinel per worker"""
+    try:
+        for task in tasks:
+            task_queue.put(task)
+    except Exception as e:
+        # Raised by file discovery; reported by the inference stage
+        errors.append(e)
+    finally:
+        for _ in range(n_workers):
+            task_queue.put(None)
+
+
+def _write_outputs(write_queue, failures, cache=None, manifest=None,
+                   output_format="float32", compress=False, store=None, verbose=False):
+    """
+    Save the embeddings from the write queue (or append them to the store)
+    and add them to the cache. Files that cannot be saved are added to
+    `failures`.
+    """
+    while True:
+        item = write_queue.get()
+        if item is None:
+            break
+        filepath, output_path, embedding, ts, cache_key = item
+        try:
+            if store is not None:
+                store.append(filepath, embedding, ts)
+            else:
+                _save_output(output_path, embedding, ts, output_format, compress)
+            if cache_key is not None:
+                cache.put_file(cache_key, output_path)
+        except Exception:
+            _record_failure(filepath, traceback.format_exc(), failures, manifest, verbose)
+            continue
+
+        if manifest is not None:
+            manifest.record(filepath, 'completed', output_path=output_path)
+
+
+def _run_pipeline(file_list, output_dir=None, suffix=None, input_repr="mel256",
+                  content_type="music", embedding_size=6144, center=True,
+                  hop_size=0.1, resample_method="kaiser_best", frontend="kapre",
+                  jobs=2, batch_size=32, cache=None, resume=False, manifest=None,
+                  output_format="float32", compress=False, store=None, aggregate=None,
+                  segment_duration=None, pca=None, silence_threshold=None, verbose=False):
+    """
+    Computes and saves L3 embedding for the given files with a
+    producer/consumer pipeline: a pool of `jobs` worker processes decodes,
+    downmixes and resamples files, a single inference stage in this process
+    owns the model, and a writer thread saves the outputs. The stages are
+    connected by bounded queues. Files found in the embedding cache are
+    copied by the workers and skip resampling and inference. If `resume` is
+    True, files that already have a valid output are not queued.
+    """
+    cache_params = (get_model_name(input_repr, content_type, embedding_size, frontend),
+                    center, hop_size, output_format, compress, aggregate, segment_duration,
+                    pca.id if pca is not None else None, silence_threshold)
+
+    # The workers never hold a model: they are spawned where possible, and
+    # are started before the model of this run is loaded otherwise
+    context = _get_worker_context()
+    task_queue = context.Queue(maxsize=2 * jobs)
+    result_queue = context.Queue(maxsize=2 * jobs)
+    workers = [context.Process(target=_decode_worker,
+                               args=(task_queue, result_queue, resample_method,
+                                     cache, cache_params))
+               for _ in range(jobs)]
+    for worker in workers:
+        worker.daemon = True
+        worker.start()
+
+    def iter_tasks():
+        for filepath in file_list:
+            output_path = _get_output_path(filepath, suffix, output_dir, store)
+            if not _skip_completed(filepath, output_path, resume, manifest, verbose, store):
+                yield filepath, output_path
+
+    tasks = iter_tasks()
+    feed_errors = []
+    feeder = threading.Thread(target=_feed_tasks,
+                              args=(tasks, task_queue, jobs, feed_errors))
+    feeder.daemon = True
+    feeder.start()
+
+    # Files that cannot be decoded, embedded or saved are recorded as failed,
+    # and the other files are still processed
+    failures = []
+    write_queue = queue.Queue(maxsize=2 * jobs)
+    writer = threading.Thread(target=_write_outputs,
+                              args=(write_queue, failures, cache, manifest,
+                                    output_format, compress, store, verbose))
+    writer.daemon = True
+    writer.start()
+
+    try:
+        model = load_embedding_model(input_repr, content_type, embedding_size,
+                                     frontend=frontend)
+        batch_size = _resolve_batch_size(batch_size, [model])
+
+        n_done = 0
+        while n_done < jobs:
+            try:
+                item = result_queue.get(timeout=1)
+            except queue.Empty:
+                if not any(worker.is_alive() for worker in workers):
+                    raise OpenL3Error('Decoding workers exited unexpectedly')
+                continue
+
+            if item is None:
+                n_done += 1
+                continue
+
+            filepath, audio, cache_key, error = item
+            if error is not None:
+                _record_failure(filepath, error, failures, manifest, verbose)
+                continue
+
+            output_path = _get_output_path(filepath, suffix, output_dir, store)
+            if audio is None:
+                if verbose:
+                    print('openl3: Copied from cache: {}'.format(filepath))
+                if manifest is not None:
+                    manifest.record(filepath, 'completed', output_path=output_path)
+                continue
+
+            if verbose:
+                print('openl3: Processing: {}'.format(filepath))
+
+            try:
+                x = _get_audio_frames(audio, hop_size, center)
+                gate = _SilenceGate(silence_threshold) if silence_threshold is not None else None
+                if aggregate is not None:
+                    aggregator = EmbeddingAggregator(aggregate, hop_size, segment_duration)
+                    _predict_batches(model, _iter_frame_batches([x], batch_size), x.shape[0],
+                                     0, hop_len=int(hop_size * TARGET_SR),
+                                     aggregator=aggregator, projection=pca, gate=gate)
+                    embedding, ts = aggregator.finalize()
+                else:
+                    embedding = _predict_batches(model, _iter_frame_batches([x], batch_size),
+                                                 x.shape[0], 0,
+                                                 hop_len=int(hop_size * TARGET_SR),
+                                                 projection=pca, gate=gate)
+                    ts = np.arange(embedding.shape[0]) * hop_size
+            except Exception:
+                _record_failure(filepath, traceback.format_exc(), failures, manifest, verbose)
+                continue
+
+            write_queue.put((filepath, output_path, embedding, ts, cache_key))
+    finally:
+        for worker in workers:
+            if worker.is_alive():
+                worker.terminate()
+            worker.join()
+        write_queue.put(None)
+        writer.join()
+
+    if feed_errors:
+        raise feed_errors[0]
+    _raise_failures(failures)
 
 
 def parse_args(args):
     parser = ArgumentParser(sys.argv[0], description=main.__doc__,
                             formatter_class=RawDescriptionHelpFormatter)
 
-    parser.add_argument('inputs', nargs='+',
+    parser.add_argument('inputs', nargs='*',
                         help='Path or paths to files to process, or path to '
                              'a directory of files to process.')
 
+    parser.add_argument('--file-list', default=None,
+                        help='Text file listing the files to process, one per '
+                             'line; use "-" to read the list from standard input.')
+
+    parser.add_argument('--recursive', action='store_true', default=False,
+                        help='Process the files in subdirectories of the input '
+                             'directories too.')
+
+    parser.add_argument('--ext', action='append', default=None,
+                        help='Extension of the files to process in the input '
+                             'directories (can be repeated). By default, the '
+                             'extensions of all supported audio formats.')
+
+    parser.add_argument('--include', action='append', default=None,
+                        help='Only process the files in the input directories '
+                             'whose relative path matches this glob pattern '
+                             '(can be repeated).')
+
+    parser.add_argument('--exclude', action='append', default=None,
+                        help='Skip the files and subdirectories in the input '
+                             'directories whose relative path matches this glob '
+                             'pattern (can be repeated).')
+
     parser.add_argument('--output-dir', '-o', default=None,
                         help='Directory to save the ouptut file(s); '
                              'if not given, the output will be '
@@ -140,19 +912,219 @@ def parse_args(args):
     parser.add_argument('--hop-size', '-t', type=positive_float, default=0.1,
                         help='Hop size in seconds for processing audio files.')
 
+    parser.add_argument('--resample-method', '-r', default='kaiser_best',
+                        choices=['kaiser_best', 'kaiser_fast', 'polyphase'],
+                        help='Method used to resample audio that is not 48kHz. '
+                             '"kaiser_fast" and "polyphase" are much faster '
+                             'than the default "kaiser_best".')
+
+    parser.add_argument('--frontend', '-f', default='kapre',
+                        choices=['kapre', 'numpy'],
+                        help='Front-end used to compute the spectrogram input '
+                             'of the model. "numpy" computes it outside of the '
+                             'model, which is much faster on CPU.')
+
+    parser.add_argument('--streaming', action='store_true', default=False,
+                        help='Read and process audio files block by block, so '
+                             'that long files do not have to fit in memory.')
+
+    parser.add_argument('--jobs', '-j', type=positive_int, default=1,
+                        help='Number of worker processes used to decode and '
+                             'resample files in parallel with inference.')
+
+    parser.add_argument('--batch-size', '-b', type=batch_size_type, default=32,
+                        help='Maximum number of windows per inference call, or "auto" '
+                             'to use the batch size with the best throughput within '
+                             '--memory-budget, which is measured on first use and '
+                             'cached per host and model.')
+
+    parser.add_argument('--memory-budget', type=positive_float,
+                        default=DEFAULT_MEMORY_BUDGET / 1024. ** 3,
+                        help='Memory budget of an inference batch in GB, used with '
+                             '--batch-size auto.')
+
+    parser.add_argument('--cache-dir', default=None,
+                        help='Directory of an embedding cache. Files whose '
+                             'audio has already been processed with the same '
+                             'parameters are copied from the cache.')
+
+    parser.add_argument('--cache-size', type=positive_float, default=DEFAULT_CACHE_SIZE / 1024. ** 3,
+                        help='Maximum size of the embedding cache in GB. Least '
+                             'recently used entries are removed first.')
+
+    parser.add_argument('--resume', action='store_true', default=False,
+                        help='Skip files that already have a valid output file, '
+                             'e.g. to resume an interrupted run.')
+
+    parser.add_argument('--manifest', default=None,
+                        help='Path to a manifest file (JSON lines) recording '
+                             'the pending, completed and failed files of the run.')
+
+    parser.add_argument('--output-format', default='float32',
+                        choices=['float32', 'float16', 'int8'],
+                        help='Storage format of the embeddings. "float16" halves '
+                             'and "int8" (per-dimension quantization) quarters '
+                             'the size of the output files.')
+
+    parser.add_argument('--compress', action='store_true', default=False,
+                        help='Compress the output files.')
+
+    parser.add_argument('--store', default=None,
+                        help='Path to a directory in which the embeddings of all '
+                             'files are appended to a sharded HDF5 embedding store, '
+                             'instead of saving one output file per input file. '
+                             'Cannot be used with --cache-dir.')
+
+    parser.add_argument('--aggregate', default=None, choices=list(AGGREGATE_METHODS),
+                        help='Save a summary of the embedding of each file (or '
+                             'of each segment, see --segment-duration) instead of '
+                             'the embedding of every window. "meanstd" '
+                             'concatenates the mean and the standard deviation.')
+
+    parser.add_argument('--segment-duration', type=positive_float, default=None,
+                        help='Duration in seconds of the segments summarised '
+                             'with --aggregate. By default the whole file is '
+                             'summarised.')
+
+    parser.add_argument('--pca', default=None,
+                        help='Path to a PCA projection saved with '
+                             'openl3.pca.fit_pca(...).save(path), applied to the '
+                             'embeddings as they are computed.')
+
+    parser.add_argument('--silence-threshold', type=float, default=None,
+                        help='RMS level in dBFS (e.g. -60) below which analysis windows '
+                             'are considered silent. Silent windows are not run through '
+                             'the model and get the embedding of a window of zeros.')
+
+    parser.add_argument('--config', type=model_config, action='append', default=None,
+                        help='Model configuration, as '
+                             'input_repr,content_type,embedding_size[,frontend] (can be '
+                             'repeated). Each file is decoded and resampled once for all '
+                             'the configurations, and each configuration is saved to '
+                             '<name>_<suffix>_<input_repr>_<content_type>_<size>.npz. '
+                             'Overrides --input-repr, --content-type and --embedding-size.')
+
     parser.add_argument('--quiet', '-q', action='store_true', default=False,
                         help='Suppress all non-error messages to stdout.')
 
-    return parser.parse_args(args)
+    parsed_args = parser.parse_args(args)
+    if not parsed_args.inputs and parsed_args.file_list is None:
+        parser.error('at least one input or --file-list is required')
+    return parsed_args
+
+
+def model_config(value):
+    """An argparse type method for accepting input_repr,content_type,embedding_size[,frontend]"""
+    parts = value.split(',')
+    if len(parts) not in (3, 4):
+        raise ArgumentTypeError('Expected input_repr,content_type,embedding_size[,frontend]')
+    try:
+        parts[2] = int(parts[2])
+    except ValueError:
+        raise ArgumentTypeError('Invalid embedding size "{}"'.format(parts[2]))
+    return tuple(parts)
+
+
+def parse_serve_args(args):
+    parser = ArgumentParser('{} serve'.format(sys.argv[0]),
+                            description='Runs a server that keeps embedding models loaded '
+                                        'and computes embeddings of the audio sent to '
+                                        'POST /embedding, running concurrent requests in '
+                                        'shared inference batches.',
+                            formatter_class=RawDescriptionHelpFormatter)
+
+    parser.add_argument('--host', default='127.0.0.1',
+                        help='Address of the HTTP server.')
+
+    parser.add_argument('--port', '-p', type=int, default=8080,
+                        help='Port of the HTTP server.')
+
+    parser.add_argument('--socket', default=None,
+                        help='Path to a Unix socket to serve HTTP on, instead of '
+                             '--host and --port.')
+
+    parser.add_argument('--max-batch-size', type=positive_int, default=DEFAULT_MAX_BATCH_SIZE,
+                        help='Maximum number of windows per inference batch.')
+
+    parser.add_argument('--max-wait', type=float, default=DEFAULT_MAX_WAIT * 1000,
+                        help='Maximum time in milliseconds that a request waits '
+                             'for other requests to share its inference batch.')
+
+    parser.add_argument('--preload', type=model_config, action='append', default=None,
+                        help='Model to load on startup, as '
+                             'input_repr,content_type,embedding_size[,frontend] '
+                             '(can be repeated). Other models are loaded on first use.')
+
+    parser.add_argument('--allow-paths', action='store_true', default=False,
+                        help='Accept requests giving the path of an audio file to '
+                             'read on the server. Clients can then read any audio '
+                             'file that the server can read.')
+
+    parser.add_argument('--max-request-size', type=positive_float,
+                        default=DEFAULT_MAX_REQUEST_SIZE / 1024. ** 2,
+                        help='Maximum size of a request in MB. Larger requests are '
+                             'rejected.')
+
+    parser.add_argument('--max-duration', type=positive_float, default=DEFAULT_MAX_DURATION,
+                        help='Maximum duration of the audio of a request in seconds. '
+                             'Longer requests are rejected before decoding.')
+
+    parser.add_argument('--max-frames', type=positive_int, default=DEFAULT_MAX_FRAMES,
+                        help='Maximum number of windows of a request. Requests with '
+                             'more windows are rejected.')
+
+    parser.add_argument('--input-repr', '-i', default='mel256',
+                        choices=['linear', 'mel128', 'mel256'],
+                        help='Default time-frequency input representation of requests.')
+
+    parser.add_argument('--content-type', '-c', default='music',
+                        choices=['music', 'env'],
+                        help='Default content type of requests.')
+
+    parser.add_argument('--embedding-size', '-s', type=int, default=6144,
+                        help='Default embedding dimensionality of requests.')
+
+    parser.add_argument('--frontend', '-f', default='kapre',
+                        choices=['kapre', 'numpy'],
+                        help='Default front-end of requests.')
+
+    parser.add_argument('--quiet', '-q', action='store_true', default=False,
+                        help='Do not log requests.')
+
+    parsed_args = parser.parse_args(args)
+    if parsed_args.max_wait < 0:
+        parser.error('--max-wait must not be negative')
+    return parsed_args
 
 
 def main():
     """
     Extracts audio embeddings from models based on the Look, Listen, and Learn models (Arandjelovic and Zisserman 2017).
+
+    Run "openl3 serve --help" for the embedding server.
     """
+    if sys.argv[1:2] == ['serve']:
+        args = parse_serve_args(sys.argv[2:])
+        serve(host=args.host,
+              port=args.port,
+              socket_path=args.socket,
+              max_batch_size=args.max_batch_size,
+              max_wait=args.max_wait / 1000.,
+              preload=args.preload or (),
+              allow_paths=args.allow_paths,
+              max_request_size=int(args.max_request_size * 1024 ** 2),
+              max_duration=args.max_duration,
+              max_frames=args.max_frames,
+              input_repr=args.input_repr,
+              content_type=args.content_type,
+              embedding_size=args.embedding_size,
+              frontend=args.frontend,
+              verbose=not args.quiet)
+        return
+
     args = parse_args(sys.argv[1:])
 
-    run(args.inputs,
+    run(args.inputs or None,
         output_dir=args.output_dir,
         suffix=args.suffix,
         input_repr=args.input_repr,
@@ -160,4 +1132,27 @@ def main():
         embedding_size=args.embedding_size,
         center=not args.no_centering,
         hop_size=args.hop_size,
+        resample_method=args.resample_method,
+        frontend=args.frontend,
+        streaming=args.streaming,
+        jobs=args.jobs,
+        batch_size=args.batch_size,
+        memory_budget=int(args.memory_budget * 1024 ** 3),
+        cache_dir=args.cache_dir,
+        cache_size=int(args.cache_size * 1024 ** 3),
+        resume=args.resume,
+        manifest=args.manifest,
+        recursive=args.recursive,
+        extensions=args.ext or AUDIO_EXTENSIONS,
+        include=args.include,
+        exclude=args.exclude,
+        file_list_path=args.file_list,
+        output_format=args.output_format,
+        compress=args.compress,
+        store=args.store,
+        aggregate=args.aggregate,
+        segment_duration=args.segment_duration,
+        pca=args.pca,
+        silence_threshold=args.silence_threshold,
+        configs=args.config,
         verbose=not args.quiet)
@@ -1,33 +1,77 @@
 import os
-import sklearn.decomposition
-import keras
-import resampy
+import weakref
+import tempfile
+import threading
 import traceback
 import soundfile as sf
 import numpy as np
 from numbers import Real
+from six import string_types
+try:
+    from collections.abc import Iterable
+except ImportError:
+    from collections import Iterable
+try:
+    from math import gcd
+except ImportError:
+    from fractions import gcd
 import warnings
-from .models import load_embedding_model
+from collections import OrderedDict
+from .models import load_embedding_model, get_spectrogram_input_repr, ThreadSafeModel
+from .frontend import (
+    SPECTROGRAM_PARAMS, compute_model_input, compute_power_spectrogram, power_to_model_input
+)
+from .aggregate import EmbeddingAggregator, validate_aggregate_args
+from .pca import get_projection
+from .tuning import get_batch_size
+from .cache import (
+    EmbeddingCache, get_model_name, get_model_id, get_audio_hash, get_sound_file_hash,
+    get_cache_key
+)
+from .utils import write_atomic
 from .openl3_exceptions import OpenL3Error
 from .openl3_warnings import OpenL3Warning
 
 
 TARGET_SR = 48000
 
+RESAMPLE_METHODS = ("kaiser_best", "kaiser_fast", "polyphase")
+
+OUTPUT_FORMATS = ("float32", "float16", "int8")
+
+# Number of embedding frames converted to the output format at a time
+OUTPUT_CHUNK_SIZE = 4096
+
+# Polyphase resampling filters, keyed by (sr_orig, sr_new)
+_POLYPHASE_FILTERS = {}
+
+# Outputs of each model for a silent window, computed on first use
+_SILENCE_EMBEDDINGS = weakref.WeakKeyDictionary()
+_SILENCE_EMBEDDINGS_LOCK = threading.Lock()
+
+# Audio is resampled in blocks of this many seconds (plus context on either
+# side), so that the in-memory and streaming paths produce identical output
+RESAMPLE_BLOCK_DURATION = 60
+
 
 def _center_audio(audio, frame_len):
     """Center audio so that first sample will occur in the middle of the first frame"""
     return np.pad(audio, (int(frame_len / 2.0), 0), mode='constant', constant_values=0)
 
 
-def _pad_audio(audio, frame_len, hop_len):
-    """Pad audio if necessary so that all samples are processed"""
-    audio_len = audio.size
+def _get_pad_length(audio_len, frame_len, hop_len):
+    """Get the number of samples to pad so that all samples are processed"""
     if audio_len < frame_len:
         pad_length = frame_len - audio_len
     else:
         pad_length = int(np.ceil((audio_len - frame_len)/float(hop_len))) * hop_len \
                      - (audio_len - frame_len)
+    return pad_length
+
+
+def _pad_audio(audio, frame_len, hop_len):
+    """Pad audio if necessary so that all samples are processed"""
+    pad_length = _get_pad_length(audio.size, frame_len, hop_len)
 
     if pad_length > 0:
         audio = np.pad(audio, (0, pad_length), mode='constant', constant_values=0)
@@ -35,59 +79,32 @@ def _pad_audio(audio, frame_len, hop_len):
     return audio
 
 
-def get_embedding(audio, sr, model=None, input_repr="mel256",
-                  content_type="music", embedding_size=6144,
-                  center=True, hop_size=0.1, verbose=1):
+def _import_keras_model():
     """
-    Computes and returns L3 embedding for given audio data
-
-    Parameters
-    ----------
-    audio : np.ndarray [shape=(N,) or (N,C)]
-        1D numpy array of audio data.
-    sr : int
-        Sampling rate, if not 48kHz will audio will be resampled.
-    model : keras.models.Model or None
-        Loaded model object. If a model is provided, then `input_repr`,
-        `content_type`, and `embedding_size` will be ignored.
-        If None is provided, the model will be loaded using
-        the provided values of `input_repr`, `content_type` and
-        `embedding_size`.
-    input_repr : "linear", "mel128", or "mel256"
-        Spectrogram representation used for model. Ignored if `model` is
-        a valid Keras model.
-    content_type : "music" or "env"
-        Type of content used to train embedding. Ignored if `model` is
-        a valid Keras model.
-    embedding_size : 6144 or 512
-        Embedding dimensionality. Ignored if `model` is a valid
-        Keras model.
-    center : boolean
-        If True, pads beginning of signal so timestamps correspond
-        to center of window.
-    hop_size : float
-        Hop size in seconds.
-    verbose : 0 or 1
-        Keras verbosity.
+    Returns the keras Model class. Keras is imported on first use, so that
+    importing openl3 does not load it.
+    """
+    with warnings.catch_warnings():
+        # Suppress TF and Keras warnings when importing
+        warnings.simplefilter("ignore")
+        from keras.models import Model
+    return Model
 
-    Returns
-    -------
-        embedding : np.ndarray [shape=(T, D)]
-            Array of embeddings for each window.
-        timestamps : np.ndarray [shape=(T,)]
-            Array of timestamps corresponding to each embedding in the output.
 
-    """
-    if audio.size == 0:
-        raise OpenL3Error('Got empty audio')
+def _get_progbar(target):
+    """Returns a keras progress bar"""
+    import keras
+    return keras.utils.Progbar(target)
 
-    # Warn user if audio is all zero
-    if np.all(audio == 0):
-        warnings.warn('Provided audio is all zeros', OpenL3Warning)
 
-    if model is not None and not isinstance(model, keras.models.Model):
+def _validate_embedding_args(model, input_repr, content_type, embedding_size,
+                             center, hop_size, verbose, resample_method="kaiser_best",
+                             frontend="kapre"):
+    """Check that the embedding arguments are valid"""
+    if model is not None and not isinstance(model, ThreadSafeModel) \
+            and not isinstance(model, _import_keras_model()):
         raise OpenL3Error('Invalid model provided. Must be of type keras.model.Models'
-                          ' but got {}'.format(str(type(model))))
+                          ' or openl3.models.ThreadSafeModel but got {}'.format(str(type(model))))
 
     if str(input_repr) not in ("linear", "mel128", "mel256"):
         raise OpenL3Error('Invalid input representation "{}"'.format(input_repr))
@@ -95,10 +112,13 @@ def get_embedding(audio, sr, model=None, input_repr="mel256",
     if str(content_type) not in ("music", "env"):
         raise OpenL3Error('Invalid content type "{}"'.format(content_type))
 
-    if embedding_size not in (6144, 512):
-        raise OpenL3Error('Invalid content type "{}"'.format(embedding_size))
+    sizes = embedding_size if isinstance(embedding_size, (list, tuple)) else [embedding_size]
+    if not sizes or any(size not in (6144, 512) for size in sizes) \
+            or len(set(sizes)) != len(sizes):
+        raise OpenL3Error('Invalid embedding size "{}"'.format(embedding_size))
 
-    if not isinstance(hop_size, Real) or hop_size <= 0:
+    if not isinstance(hop_size, Real) or hop_size * TARGET_SR < 1:
+        # The hop must be at least one sample at 48kHz
         raise OpenL3Error('Invalid hop size {}'.format(hop_size))
 
     if verbose not in (0, 1):
@@ -107,6 +127,45 @@ def get_embedding(audio, sr, model=None, input_repr="mel256",
     if center not in (True, False):
         raise OpenL3Error('Invalid center value {}'.format(center))
 
+    if str(resample_method) not in RESAMPLE_METHODS:
+        raise OpenL3Error('Invalid resample method "{}"'.format(resample_method))
+
+    if str(frontend) not in ("kapre", "numpy"):
+        raise OpenL3Error('Invalid frontend "{}"'.format(frontend))
+
+
+def _validate_silence_threshold(silence_threshold):
+    """Check that the silence threshold is a level in dBFS"""
+    if silence_threshold is not None and (not isinstance(silence_threshold, Real)
+                                          or isinstance(silence_threshold, bool)
+                                          or silence_threshold > 0):
+        raise OpenL3Error('Invalid silence threshold {}'.format(silence_threshold))
+
+
+def _validate_batch_size(batch_size):
+    """Check that the inference batch size is valid"""
+    if batch_size == "auto":
+        return
+    if not isinstance(batch_size, int) or isinstance(batch_size, bool) or batch_size <= 0:
+        raise OpenL3Error('Invalid batch size {}'.format(batch_size))
+
+
+def _resolve_batch_size(batch_size, models):
+    """Returns the batch size to use with all the given models"""
+    if batch_size == "auto":
+        return min(get_batch_size(model) for model in models)
+    return batch_size
+
+
+def _preprocess_audio(audio, sr, resample_method="kaiser_best"):
+    """Check the audio, downmix it to mono and resample it to the target sampling rate"""
+    if audio.size == 0:
+        raise OpenL3Error('Got empty audio')
+
+    # Warn user if audio is all zero
+    if np.all(audio == 0):
+        warnings.warn('Provided audio is all zeros', OpenL3Warning)
+
     # Check audio array dimension
     if audio.ndim > 2:
         raise OpenL3Error('Audio array can only be be 1D or 2D')
@@ -116,12 +175,105 @@ def get_embedding(audio, sr, model=None, input_repr="mel256",
 
     # Resample if necessary
     if sr != TARGET_SR:
-        audio = resampy.resample(audio, sr_orig=sr, sr_new=TARGET_SR, filter='kaiser_best')
+        audio = np.concatenate(list(_iter_resampled_blocks(
+            lambda start, stop: audio[start:stop], audio.size, sr, resample_method)))
 
-    # Get embedding model
-    if model is None:
-        model = load_embedding_model(input_repr, content_type, embedding_size)
+    return audio
 
+
+def _get_polyphase_filter(sr_orig, sr_new):
+    """
+    Get the upsampling and downsampling factors and the (cached) anti-aliasing
+    filter used to resample audio from `sr_orig` to `sr_new` with a rational
+    polyphase resampler. The filter is the one designed by
+    `scipy.signal.resample_poly`.
+    """
+    import scipy.signal
+
+    key = (sr_orig, sr_new)
+    if key not in _POLYPHASE_FILTERS:
+        divisor = gcd(sr_orig, sr_new)
+        up = sr_new // divisor
+        down = sr_orig // divisor
+        max_rate = max(up, down)
+        filt = scipy.signal.firwin(2 * 10 * max_rate + 1, 1. / max_rate,
+                                   window=('kaiser', 5.0))
+        _POLYPHASE_FILTERS[key] = (up, down, filt)
+    return _POLYPHASE_FILTERS[key]
+
+
+def _resample(audio, sr, resample_method):
+    """
+    Resample audio to the target sampling rate with the given method. The
+    resampling libraries are imported on first use, since they are slow to
+    import.
+    """
+    if resample_method == "polyphase" and int(sr) == sr:
+        import scipy.signal
+        up, down, filt = _get_polyphase_filter(int(sr), TARGET_SR)
+        audio_resampled = scipy.signal.resample_poly(audio, up, down, window=filt)
+        # Use the same output length as resampy
+        return audio_resampled[:audio.size * up // down]
+
+    if resample_method == "polyphase":
+        # Polyphase resampling needs integer sampling rates
+        resample_method = "kaiser_best"
+    import resampy
+    return resampy.resample(audio, sr_orig=sr, sr_new=TARGET_SR, filter=resample_method)
+
+
+def _iter_resampled_blocks(read_audio, n_samples, sr, resample_method="kaiser_best"):
+    """
+    Yield consecutive blocks of mono audio resampled to the target sampling
+    rate. Each block is resampled together with (at least) one second of
+    context on either side, and block boundaries fall on input samples that
+    map to integer output samples, so the concatenated blocks do not depend
+    on how the audio is read.
+
+    Parameters
+    ----------
+    read_audio : callable
+        Function that takes a (start, stop) sample range and returns the
+        corresponding mono audio samples.
+    n_samples : int
+        Total number of input samples.
+    sr : int
+        Sampling rate of the input audio.
+    resample_method : "kaiser_best", "kaiser_fast" or "polyphase"
+        Resampling method.
+    """
+    if sr == TARGET_SR or int(sr) != sr:
+        block_len = int(RESAMPLE_BLOCK_DURATION * sr)
+        context_len = 0
+        if sr != TARGET_SR:
+            # Block boundaries cannot be aligned for fractional sampling rates
+            block_len = n_samples
+    else:
+        sr = int(sr)
+        # Number of input samples that map to an integer number of output samples
+        unit = sr // gcd(sr, TARGET_SR)
+        block_len = unit * max(1, int(round(RESAMPLE_BLOCK_DURATION * sr / float(unit))))
+        context_len = unit * int(np.ceil(sr / float(unit)))
+
+    for start in range(0, n_samples, block_len):
+        stop = min(start + block_len, n_samples)
+        if sr == TARGET_SR:
+            yield read_audio(start, stop)
+            continue
+
+        chunk_start = max(0, start - context_len)
+        chunk_stop = min(n_samples, stop + context_len)
+        chunk = _resample(read_audio(chunk_start, chunk_stop), sr, resample_method)
+
+        offset = (start - chunk_start) * TARGET_SR // sr
+        if stop == n_samples:
+            yield chunk[offset:]
+        else:
+            yield chunk[offset:offset + (stop - start) * TARGET_SR // sr]
+
+
+def _get_audio_frames(audio, hop_size, center):
+    """Split preprocessed audio into (overlapping) model input windows"""
     audio_len = audio.size
     frame_len = TARGET_SR
     hop_len = int(hop_size * TARGET_SR)
@@ -137,6 +289,11 @@ def get_embedding(audio, sr, model=None, input_repr="mel256",
     # Pad if necessary to ensure that we process all samples
     audio = _pad_audio(audio, frame_len, hop_len)
 
+    return _frame_audio(audio, frame_len, hop_len)
+
+
+def _frame_audio(audio, frame_len, hop_len):
+    """Split audio into as many complete frames as possible, without copying"""
     # Split audio into frames, copied from librosa.util.frame
     n_frames = 1 + int((len(audio) - frame_len) / float(hop_len))
     x = np.lib.stride_tricks.as_strided(audio, shape=(frame_len, n_frames),
@@ -145,17 +302,669 @@ def get_embedding(audio, sr, model=None, input_repr="mel256",
     # Add a channel dimension
     x = x.reshape((x.shape[0], 1, x.shape[-1]))
 
+    return x
+
+
+def _iter_stream_frames(blocks, hop_size, center):
+    """
+    Yield frame arrays from consecutive blocks of preprocessed audio. Only the
+    audio that is needed for the next frame (less than one window) is carried
+    over between blocks, and the frames are the same as the ones returned by
+    `_get_audio_frames` for the concatenated blocks.
+    """
+    frame_len = TARGET_SR
+    hop_len = int(hop_size * TARGET_SR)
+
+    if center:
+        buf = np.zeros(int(frame_len / 2.0))
+    else:
+        buf = np.zeros(0)
+    signal_len = buf.size
+    n_frames = 0
+
+    for block in blocks:
+        signal_len += block.size
+        buf = np.concatenate([buf, block])
+        if buf.size < frame_len:
+            continue
+
+        frames = _frame_audio(buf, frame_len, hop_len)
+        n_frames += frames.shape[0]
+        yield frames
+        buf = buf[frames.shape[0] * hop_len:]
+
+    if signal_len - (int(frame_len / 2.0) if center else 0) < frame_len:
+        warnings.warn('Duration of provided audio is shorter than window size (1 second). Audio will be padded.',
+                      OpenL3Warning)
+
+    # Pad the remaining audio the same way as the full signal would be padded
+    pad_length = _get_pad_length(signal_len, frame_len, hop_len)
+    n_total = 1 + (signal_len + pad_length - frame_len) // hop_len
+    if n_total > n_frames:
+        buf = np.concatenate([buf, np.zeros((n_total - n_frames - 1) * hop_len
+                                            + frame_len - buf.size)])
+        yield _frame_audio(buf, frame_len, hop_len)
+
+
+def _iter_frame_batches(frames_list, batch_size):
+    """
+    Yield float32 batches of at most `batch_size` windows from a list of
+    (strided) frame arrays. Windows of consecutive arrays are packed into the
+    same batch, and only one batch is materialized at a time.
+    """
+    batch = None
+    n_batch = 0
+    for frames in frames_list:
+        idx = 0
+        n_frames = frames.shape[0]
+        while idx < n_frames:
+            if batch is None:
+                batch = np.empty((batch_size,) + frames.shape[1:], dtype=np.float32)
+            n_copy = min(batch_size - n_batch, n_frames - idx)
+            batch[n_batch:n_batch + n_copy] = frames[idx:idx + n_copy]
+            n_batch += n_copy
+            idx += n_copy
+            if n_batch == batch_size:
+                yield batch
+                batch = None
+                n_batch = 0
+
+    if n_batch > 0:
+        yield batch[:n_batch]
+
+
+class _SilenceGate(object):
+    """
+    Finds the windows of each batch whose RMS level is below a threshold (in
+    dBFS), which are not run through the model, and records which windows
+    were active.
+    """
+    def __init__(self, threshold):
+        self.threshold = threshold
+        self._masks = []
+
+    def update(self, batch):
+        """Returns the mask of the active windows of a batch of audio windows"""
+        frames = batch[:, 0, :]
+        power = np.einsum('ij,ij->i', frames, frames) / float(frames.shape[-1])
+        with np.errstate(divide='ignore'):
+            active = 10 * np.log10(power) >= self.threshold
+        self._masks.append(active)
+        return active
+
+    @property
+    def mask(self):
+        """Mask of the active windows of all the batches seen so far"""
+        if not self._masks:
+            return np.zeros((0,), dtype=bool)
+        return np.concatenate(self._masks)
+
+
+def _get_silence_embedding(model):
+    """Returns the (cached) output of a model for a window of zeros"""
+    with _SILENCE_EMBEDDINGS_LOCK:
+        embedding = _SILENCE_EMBEDDINGS.get(model)
+    if embedding is None:
+        embedding = _predict_batch(model, np.zeros((1, 1, TARGET_SR), dtype=np.float32))
+        with _SILENCE_EMBEDDINGS_LOCK:
+            _SILENCE_EMBEDDINGS[model] = embedding
+    return embedding
+
+
+def _predict_gated_batch(model, batch, active, projection=None):
+    """
+    Run inference on the active windows of a batch only, and use the silence
+    embedding of the model for the other windows
+    """
+    silence = _get_silence_embedding(model)
+    multi_output = isinstance(silence, list)
+    embedding = [np.repeat(output, batch.shape[0], axis=0)
+                 for output in (silence if multi_output else [silence])]
+    if active.any():
+        # The active windows are not consecutive, so the STFT is not shared
+        active_embedding = _predict_batch(model, batch[active])
+        for output, active_output in zip(embedding, active_embedding if multi_output
+                                         else [active_embedding]):
+            output[active] = active_output
+
+    if not multi_output:
+        embedding = embedding[0]
+    if projection is not None:
+        if multi_output:
+            raise OpenL3Error('A PCA projection requires a model with a single output')
+        embedding = projection.transform(embedding)
+    return embedding
+
+
+def _predict_batch(model, batch, hop_len=None, projection=None, gate=None):
+    """
+    Run inference on a batch of audio windows with `predict_on_batch`. If the
+    model takes spectrograms as input, the spectrograms are computed first.
+    `hop_len` is the hop size between the windows if they are consecutive
+    windows of the same signal, and None otherwise. If a projection is
+    given, the embedding of the batch is projected. If a silence gate is
+    given, only the windows that are not silent are run through the model.
+    """
+    if gate is not None:
+        active = gate.update(batch)
+        if not active.all():
+            return _predict_gated_batch(model, batch, active, projection)
+
+    input_repr = get_spectrogram_input_repr(model)
+    if input_repr is not None:
+        batch = compute_model_input(batch[:, 0, :], input_repr, hop_len=hop_len)
+    embedding = model.predict_on_batch(batch)
+    if projection is not None:
+        if isinstance(embedding, list):
+            raise OpenL3Error('A PCA projection requires a model with a single output')
+        embedding = projection.transform(embedding)
+    return embedding
+
+
+def _predict_batches(model, batches, n_frames, verbose, hop_len=None,
+                     aggregator=None, projection=None, gate=None):
+    """
+    Run inference on each batch with `predict_on_batch` and collect the
+    results into a single (n_frames, D) array, or into a list of arrays (one
+    per output) for models with several outputs. If an aggregator is given,
+    the results of each batch are added to it instead, and None is returned.
+    If a silence gate is given, silent windows are skipped (see
+    `_predict_batch`).
+    """
+    if verbose:
+        progbar = _get_progbar(n_frames)
+
+    outputs = None
+    multi_output = False
+    idx = 0
+    for batch in batches:
+        batch_embedding = _predict_batch(model, batch, hop_len, projection, gate)
+        multi_output = isinstance(batch_embedding, list)
+        batch_outputs = batch_embedding if multi_output else [batch_embedding]
+        if aggregator is not None:
+            if multi_output:
+                raise OpenL3Error('Aggregation requires a model with a single output')
+            aggregator.update(batch_embedding)
+        else:
+            if outputs is None:
+                outputs = [np.empty((n_frames,) + output.shape[1:], dtype=output.dtype)
+                           for output in batch_outputs]
+            for output, batch_output in zip(outputs, batch_outputs):
+                output[idx:idx + batch_output.shape[0]] = batch_output
+        idx += batch_outputs[0].shape[0]
+        if verbose:
+            progbar.update(idx)
+
+    if outputs is None or multi_output:
+        return outputs
+    return outputs[0]
+
+
+def _get_embedding_dict(embeddings):
+    """Returns the embeddings of each output of a model, keyed by embedding size"""
+    embedding_dict = {}
+    for embedding in embeddings:
+        size = embedding.shape[1]
+        if size in embedding_dict:
+            raise OpenL3Error('Several outputs of the model have the embedding size {}'.format(
+                size))
+        embedding_dict[size] = embedding
+    return embedding_dict
+
+
+def _validate_multi_output_args(embedding_size, aggregate=None, pca=None):
+    """Check that several embedding sizes are not combined with per-size processing"""
+    if isinstance(embedding_size, (list, tuple)) and len(embedding_size) > 1:
+        if aggregate is not None:
+            raise OpenL3Error('Aggregation cannot be used with several embedding sizes')
+        if pca is not None:
+            raise OpenL3Error('A PCA projection cannot be used with several embedding sizes')
+
+
+def _is_multi_output_model(model):
+    """Returns True if a model has several outputs, e.g. one per embedding size"""
+    outputs = getattr(model, 'outputs', None)
+    return isinstance(outputs, (list, tuple)) and len(outputs) > 1
+
+
+def get_embedding(audio, sr, model=None, input_repr="mel256",
+                  content_type="music", embedding_size=6144,
+                  center=True, hop_size=0.1, batch_size=32,
+                  resample_method="kaiser_best", frontend="kapre", aggregate=None,
+                  segment_duration=None, pca=None, silence_threshold=None,
+                  return_mask=False, verbose=1):
+    """
+    Computes and returns L3 embedding for given audio data
+
+    Parameters
+    ----------
+    audio : np.ndarray [shape=(N,) or (N,C)]
+        1D numpy array of audio data.
+    sr : int
+        Sampling rate, if not 48kHz will audio will be resampled.
+    model : keras.models.Model, openl3.models.ThreadSafeModel or None
+        Loaded model object. If a model is provided, then `input_repr`,
+        `content_type`, and `embedding_size` will be ignored.
+        If None is provided, the model will be loaded using
+        the provided values of `input_repr`, `content_type` and
+        `embedding_size`. Models shared between threads should be wrapped
+        in a `ThreadSafeModel`.
+    input_repr : "linear", "mel128", or "mel256"
+        Spectrogram representation used for model. Ignored if `model` is
+        a valid Keras model.
+    content_type : "music" or "env"
+        Type of content used to train embedding. Ignored if `model` is
+        a valid Keras model.
+    embedding_size : 6144, 512 or list of them
+        Embedding dimensionality. Ignored if `model` is a valid
+        Keras model. If several sizes are given, the embeddings of all the
+        sizes are computed in a single pass of a model with one output per
+        size, and returned in a dictionary.
+    center : boolean
+        If True, pads beginning of signal so timestamps correspond
+        to center of window.
+    hop_size : float
+        Hop size in seconds.
+    batch_size : int or "auto"
+        Maximum number of windows per inference call. Windows are converted
+        to float32 one batch at a time, so memory usage depends on the batch
+        size rather than on the duration of the audio. If "auto", the batch size
+        with the best throughput within the memory budget is measured on
+        first use and cached per host and model (see
+        `openl3.tuning.get_batch_size`).
+    resample_method : "kaiser_best", "kaiser_fast" or "polyphase"
+        Method used to resample audio that is not 48kHz. "kaiser_best" and
+        "kaiser_fast" use resampy with the corresponding filter, and
+        "polyphase" uses a rational polyphase resampler with a filter that
+        is computed once per sampling rate.
+    frontend : "kapre" or "numpy"
+        Front-end used to compute the spectrogram input of the model if no
+        model is provided. "kapre" computes it with the kapre layers of the
+        model, "numpy" computes it with `openl3.frontend` (much faster on CPU)
+        and uses a model without the kapre layer. If a model is provided, the
+        front-end is determined by its input shape.
+    aggregate : "mean", "max", "std", "meanstd" or None
+        If given, the embedding is summarised over the whole clip, or over
+        segments of `segment_duration` seconds, with the given statistic
+        (see `openl3.aggregate.EmbeddingAggregator`). The statistics are
+        computed incrementally after each inference batch, so the embedding
+        of all the windows is never held in memory.
+    segment_duration : float or None
+        Duration of the aggregation segments in seconds, rounded to a whole
+        number of hops. If None, the whole clip is aggregated into a single
+        frame. Requires `aggregate`.
+    pca : openl3.pca.EmbeddingProjection, str or None
+        PCA projection (see `openl3.pca.fit_pca`), or path to a saved
+        projection. If given, the embedding of each inference batch is
+        projected onto the principal components as it is computed, before
+        it is aggregated.
+    silence_threshold : float or None
+        If given, RMS level in dBFS (e.g. -60) below which a window is
+        considered silent. Silent windows are not run through the model, and
+        their embedding is the embedding of a window of zeros, which is
+        computed once per model.
+    return_mask : bool
+        If True, the mask of the windows that were run through the model
+        (i.e. that are not silent) is also returned. Requires `aggregate` to
+        be None.
+    verbose : 0 or 1
+        Keras verbosity.
+
+    Returns
+    -------
+        embedding : np.ndarray [shape=(T, D)] or dict
+            Array of embeddings for each window, or for each segment if
+            `aggregate` is given. If several embedding sizes are requested
+            (or if the model has several outputs), dictionary of such arrays
+            keyed by embedding size.
+        timestamps : np.ndarray [shape=(T,)]
+            Array of timestamps corresponding to each embedding in the output.
+        mask : np.ndarray [shape=(T,)]
+            Boolean array that is False for the silent windows, returned if
+            `return_mask` is True.
+
+    """
+    _validate_batch_size(batch_size)
+    _validate_embedding_args(model, input_repr, content_type, embedding_size,
+                             center, hop_size, verbose, resample_method, frontend)
+    validate_aggregate_args(aggregate, segment_duration, hop_size)
+    _validate_multi_output_args(embedding_size if model is None else None, aggregate, pca)
+    _validate_silence_threshold(silence_threshold)
+    if return_mask and aggregate is not None:
+        raise OpenL3Error('The mask of silent windows cannot be returned with aggregation')
+    projection = get_projection(pca)
+    gate = _SilenceGate(silence_threshold) if silence_threshold is not None else None
+
+    audio = _preprocess_audio(audio, sr, resample_method)
+
+    # Get embedding model
+    if model is None:
+        model = load_embedding_model(input_repr, content_type, embedding_size,
+                                     frontend=frontend, thread_safe=True)
+    batch_size = _resolve_batch_size(batch_size, [model])
+
+    x = _get_audio_frames(audio, hop_size, center)
+
+    if aggregate is not None:
+        aggregator = EmbeddingAggregator(aggregate, hop_size, segment_duration)
+        _predict_batches(model, _iter_frame_batches([x], batch_size), x.shape[0],
+                         verbose, hop_len=int(hop_size * TARGET_SR), aggregator=aggregator,
+                         projection=projection, gate=gate)
+        return aggregator.finalize()
+
     # Get embedding and timestamps
-    embedding = model.predict(x, verbose=verbose)
+    embedding = _predict_batches(model, _iter_frame_batches([x], batch_size),
+                                 x.shape[0], verbose, hop_len=int(hop_size * TARGET_SR),
+                                 projection=projection, gate=gate)
+
+    ts = np.arange(x.shape[0]) * hop_size
 
-    ts = np.arange(embedding.shape[0]) * hop_size
+    if isinstance(embedding, list):
+        embedding = _get_embedding_dict(embedding)
 
+    if return_mask:
+        mask = gate.mask if gate is not None else np.ones((x.shape[0],), dtype=bool)
+        return embedding, ts, mask
     return embedding, ts
 
 
+def get_embeddings_batch(audios, srs, model=None, input_repr="mel256",
+                         content_type="music", embedding_size=6144,
+                         center=True, hop_size=0.1, batch_size=32,
+                         resample_method="kaiser_best", frontend="kapre", pca=None,
+                         silence_threshold=None, return_mask=False, verbose=1):
+    """
+    Computes and returns L3 embeddings for a list of audio arrays. The
+    windows of all audio arrays are packed into batches of (at most)
+    `batch_size` windows, so that clips shorter than a batch share a
+    single inference call.
+
+    Parameters
+    ----------
+    audios : list of np.ndarray [shape=(N,) or (N,C)]
+        List of 1D or 2D numpy arrays of audio data.
+    srs : int or list of int
+        Sampling rate of each audio array, or a single sampling rate shared
+        by all audio arrays. Audio that is not 48kHz will be resampled.
+    model : keras.models.Model, openl3.models.ThreadSafeModel or None
+        Loaded model object. If a model is provided, then `input_repr`,
+        `content_type`, and `embedding_size` will be ignored.
+        If None is provided, the model will be loaded using
+        the provided values of `input_repr`, `content_type` and
+        `embedding_size`. Models shared between threads should be wrapped
+        in a `ThreadSafeModel`.
+    input_repr : "linear", "mel128", or "mel256"
+        Spectrogram representation used for model. Ignored if `model` is
+        a valid Keras model.
+    content_type : "music" or "env"
+        Type of content used to train embedding. Ignored if `model` is
+        a valid Keras model.
+    embedding_size : 6144, 512 or list of them
+        Embedding dimensionality. Ignored if `model` is a valid
+        Keras model. If several sizes are given, they are computed in a
+        single pass (see `get_embedding`).
+    center : boolean
+        If True, pads beginning of signal so timestamps correspond
+        to center of window.
+    hop_size : float
+        Hop size in seconds.
+    batch_size : int or "auto"
+        Maximum number of windows per inference call. If "auto", the batch size
+        with the best throughput within the memory budget is measured on
+        first use and cached per host and model (see
+        `openl3.tuning.get_batch_size`).
+    resample_method : "kaiser_best", "kaiser_fast" or "polyphase"
+        Method used to resample audio that is not 48kHz. "kaiser_best" and
+        "kaiser_fast" use resampy with the corresponding filter, and
+        "polyphase" uses a rational polyphase resampler with a filter that
+        is computed once per sampling rate.
+    frontend : "kapre" or "numpy"
+        Front-end used to compute the spectrogram input of the model if no
+        model is provided. "kapre" computes it with the kapre layers of the
+        model, "numpy" computes it with `openl3.frontend` (much faster on CPU)
+        and uses a model without the kapre layer. If a model is provided, the
+        front-end is determined by its input shape.
+    pca : openl3.pca.EmbeddingProjection, str or None
+        PCA projection (see `openl3.pca.fit_pca`), or path to a saved
+        projection. If given, the embedding of each inference batch is
+        projected onto the principal components as it is computed.
+    silence_threshold : float or None
+        If given, RMS level in dBFS (e.g. -60) below which a window is
+        considered silent. Silent windows are not run through the model, and
+        their embedding is the embedding of a window of zeros, which is
+        computed once per model.
+    return_mask : bool
+        If True, the masks of the windows that were run through the model
+        (i.e. that are not silent) are also returned.
+    verbose : 0 or 1
+        Keras verbosity.
+
+    Returns
+    -------
+        embeddings : list of np.ndarray [shape=(T, D)] or list of dict
+            List of arrays of embeddings for each window of each audio array,
+            or of dictionaries of such arrays keyed by embedding size if
+            several embedding sizes are requested.
+        timestamps : list of np.ndarray [shape=(T,)]
+            List of arrays of timestamps corresponding to each embedding in
+            the output.
+        masks : list of np.ndarray [shape=(T,)]
+            List of boolean arrays that are False for the silent windows,
+            returned if `return_mask` is True.
+
+    """
+    if isinstance(audios, np.ndarray) or not isinstance(audios, Iterable):
+        raise OpenL3Error('audios must be a list of audio arrays')
+    audios = list(audios)
+
+    if isinstance(srs, Real):
+        srs = [srs] * len(audios)
+    elif isinstance(srs, Iterable):
+        srs = list(srs)
+    else:
+        raise OpenL3Error('Invalid sampling rates {}'.format(srs))
+
+    if len(srs) != len(audios):
+        raise OpenL3Error('Got {} audio arrays but {} sampling rates'.format(
+            len(audios), len(srs)))
+
+    _validate_batch_size(batch_size)
+    _validate_embedding_args(model, input_repr, content_type, embedding_size,
+                             center, hop_size, verbose, resample_method, frontend)
+    _validate_multi_output_args(embedding_size if model is None else None, pca=pca)
+    _validate_silence_threshold(silence_threshold)
+    projection = get_projection(pca)
+    gate = _SilenceGate(silence_threshold) if silence_threshold is not None else None
+
+    if len(audios) == 0:
+        return ([], [], []) if return_mask else ([], [])
+
+    frames = [_get_audio_frames(_preprocess_audio(audio, sr, resample_method),
+                                hop_size, center)
+              for audio, sr in zip(audios, srs)]
+    n_frames = [x.shape[0] for x in frames]
+
+    # Get embedding model
+    if model is None:
+        model = load_embedding_model(input_repr, content_type, embedding_size,
+                                     frontend=frontend, thread_safe=True)
+    batch_size = _resolve_batch_size(batch_size, [model])
+
+    # Pack the windows of all clips into batches and run inference once per batch
+    embedding = _predict_batches(model, _iter_frame_batches(frames, batch_size),
+                                 sum(n_frames), verbose, projection=projection, gate=gate)
+
+    # Split the results back per clip
+    offsets = np.cumsum(n_frames)[:-1]
+    if isinstance(embedding, list):
+        embeddings = [_get_embedding_dict(clip_embeddings) for clip_embeddings in
+                      zip(*[np.split(output, offsets, axis=0) for output in embedding])]
+    else:
+        embeddings = np.split(embedding, offsets, axis=0)
+    timestamps = [np.arange(n) * hop_size for n in n_frames]
+
+    if return_mask:
+        mask = gate.mask if gate is not None else np.ones((sum(n_frames),), dtype=bool)
+        return embeddings, timestamps, np.split(mask, offsets)
+    return embeddings, timestamps
+
+
+def _validate_configs(configs, center, hop_size, verbose, resample_method, frontend):
+    """
+    Checks a list of (input_repr, content_type, embedding_size[, frontend])
+    model configurations and returns them as 4-tuples, using `frontend` for
+    the configurations that do not specify one
+    """
+    if isinstance(configs, string_types) or not isinstance(configs, Iterable):
+        raise OpenL3Error('Invalid model configurations {}'.format(configs))
+
+    validated = []
+    for config in configs:
+        if not isinstance(config, (list, tuple)) or len(config) not in (3, 4):
+            raise OpenL3Error('Invalid model configuration {}; expected (input_repr, '
+                              'content_type, embedding_size[, frontend])'.format(config))
+        config = tuple(config) if len(config) == 4 else tuple(config) + (frontend,)
+        if isinstance(config[2], (list, tuple)):
+            raise OpenL3Error('Invalid embedding size "{}"'.format(config[2]))
+        _validate_embedding_args(None, config[0], config[1], config[2], center, hop_size,
+                                 verbose, resample_method, config[3])
+        if any(other[:3] == config[:3] for other in validated):
+            raise OpenL3Error('Duplicate model configuration {}'.format(config[:3]))
+        validated.append(config)
+
+    if not validated:
+        raise OpenL3Error('At least one model configuration is required')
+    return validated
+
+
+def _load_config_models(configs):
+    """
+    Loads the models of a list of configurations (see `_validate_configs`).
+    Configurations that only differ by their embedding size share a single
+    model with one output per size. Returns a list of (model, configs) pairs.
+    """
+    groups = OrderedDict()
+    for config in configs:
+        groups.setdefault((config[0], config[1], config[3]), []).append(config)
+    return [(load_embedding_model(input_repr, content_type, [config[2] for config in group],
+                                  frontend=frontend, thread_safe=True), group)
+            for (input_repr, content_type, frontend), group in groups.items()]
+
+
+def _predict_config_batches(models, batches, n_frames, verbose, hop_len=None):
+    """
+    Run inference on each batch with each model, and collect the results into
+    a list of (n_frames, D) arrays per model (one array per output). The
+    power spectrogram of a batch is computed once and shared by the models
+    that take spectrograms with the same STFT parameters as input.
+    """
+    if verbose:
+        progbar = _get_progbar(n_frames)
+
+    input_reprs = [get_spectrogram_input_repr(model) for model in models]
+    outputs = [None] * len(models)
+    idx = 0
+    for batch in batches:
+        powers = {}
+        for i, (model, input_repr) in enumerate(zip(models, input_reprs)):
+            if input_repr is None:
+                model_input = batch
+            else:
+                params = SPECTROGRAM_PARAMS[input_repr]
+                key = (params['n_dft'], params['n_hop'], params['padding'])
+                if key not in powers:
+                    powers[key] = compute_power_spectrogram(batch[:, 0, :], input_repr,
+                                                            hop_len=hop_len)
+                model_input = power_to_model_input(powers[key], input_repr)
+
+            batch_outputs = model.predict_on_batch(model_input)
+            if not isinstance(batch_outputs, list):
+                batch_outputs = [batch_outputs]
+            if outputs[i] is None:
+                outputs[i] = [np.empty((n_frames,) + output.shape[1:], dtype=output.dtype)
+                              for output in batch_outputs]
+            for output, batch_output in zip(outputs[i], batch_outputs):
+                output[idx:idx + batch_output.shape[0]] = batch_output
+        idx += batch.shape[0]
+        if verbose:
+            progbar.update(idx)
+
+    return outputs
+
+
+def get_config_embeddings(audio, sr, configs, center=True, hop_size=0.1, batch_size=32,
+                          resample_method="kaiser_best", frontend="kapre", verbose=True):
+    """
+    Computes the embeddings of audio data for several model configurations.
+    The audio is resampled and framed once for all the configurations,
+    configurations that only differ by their embedding size are computed
+    with a single forward pass, and with the numpy front-end, the STFT of
+    each batch is shared by the models that use the same STFT parameters
+    (e.g. "mel128" and "mel256").
+
+    Parameters
+    ----------
+    audio : np.ndarray [shape=(N,) or (N,C)]
+        1D numpy array of audio data.
+    sr : int
+        Sampling rate, if not 48kHz the audio will be resampled.
+    configs : list of tuple
+        Model configurations, as (input_repr, content_type, embedding_size)
+        or (input_repr, content_type, embedding_size, frontend) tuples.
+    center : boolean
+        If True, pads beginning of signal so timestamps correspond
+        to center of window.
+    hop_size : float
+        Hop size in seconds.
+    batch_size : int or "auto"
+        Maximum number of windows per inference call. If "auto", the
+        smallest of the batch sizes chosen for each model (see
+        `get_embedding`).
+    resample_method : "kaiser_best", "kaiser_fast" or "polyphase"
+        Method used to resample audio that is not 48kHz (see `get_embedding`).
+    frontend : "kapre" or "numpy"
+        Front-end of the configurations that do not specify one (see
+        `get_embedding`). The STFT can only be shared with "numpy".
+    verbose : bool
+        If True, prints verbose messages.
+
+    Returns
+    -------
+        embeddings : dict
+            Array of embeddings for each window (np.ndarray [shape=(T, D)]),
+            keyed by (input_repr, content_type, embedding_size).
+        timestamps : np.ndarray [shape=(T,)]
+            Array of timestamps corresponding to each embedding in the output.
+
+    """
+    _validate_batch_size(batch_size)
+    configs = _validate_configs(configs, center, hop_size, verbose, resample_method, frontend)
+
+    audio = _preprocess_audio(audio, sr, resample_method)
+    groups = _load_config_models(configs)
+    batch_size = _resolve_batch_size(batch_size, [model for model, _ in groups])
+    x = _get_audio_frames(audio, hop_size, center)
+
+    outputs = _predict_config_batches([model for model, _ in groups],
+                                      _iter_frame_batches([x], batch_size), x.shape[0],
+                                      verbose, hop_len=int(hop_size * TARGET_SR))
+
+    embeddings = {}
+    for (_, group), group_outputs in zip(groups, outputs):
+        for config, embedding in zip(group, group_outputs):
+            embeddings[config[:3]] = embedding
+
+    ts = np.arange(x.shape[0]) * hop_size
+    return embeddings, ts
+
+
 def process_file(filepath, output_dir=None, suffix=None, model=None,
                  input_repr="mel256", content_type="music",
-                 embedding_size=6144, center=True, hop_size=0.1, verbose=True):
+                 embedding_size=6144, center=True, hop_size=0.1, batch_size=32,
+                 resample_method="kaiser_best", frontend="kapre", streaming=False,
+                 cache=None, skip_existing=False, output_format="float32",
+                 compress=False, store=None, aggregate=None, segment_duration=None,
+                 pca=None, silence_threshold=None, verbose=True):
     """
     Computes and saves L3 embedding for given audio file
 
@@ -169,12 +978,15 @@ def process_file(filepath, output_dir=None, suffix=None, model=None,
     suffix : str or None
         String to be appended to the output filename, i.e. <base filename>_<suffix>.npz.
         If None, then no suffix will be added, i.e. <base filename>.npz.
-    model : keras.models.Model or None
+    model : keras.models.Model, openl3.models.ThreadSafeModel or None
         Loaded model object. If a model is provided, then `input_repr`,
         `content_type`, and `embedding_size` will be ignored.
         If None is provided, the model will be loaded using
         the provided values of `input_repr`, `content_type` and
-        `embedding_size`.
+        `embedding_size`. Models shared between threads should be wrapped
+        in a `ThreadSafeModel`. Models with several outputs (see
+        `get_embedding`) are not supported, since a single embedding is
+        saved per file.
     input_repr : "linear", "mel128", or "mel256"
         Spectrogram representation used for model. Ignored if `model` is
         a valid Keras model.
@@ -189,6 +1001,61 @@ def process_file(filepath, output_dir=None, suffix=None, model=None,
         to center of window.
     hop_size : float
         Hop size in seconds.
+    batch_size : int or "auto"
+        Maximum number of windows per inference call (see `get_embedding`).
+    streaming : boolean
+        If True, the file is read, resampled and embedded block by block and
+        the embeddings are appended to a temporary file as they are computed,
+        so memory usage does not depend on the duration of the file. The
+        output is identical to the output of the in-memory path.
+    resample_method : "kaiser_best", "kaiser_fast" or "polyphase"
+        Method used to resample audio that is not 48kHz. "kaiser_best" and
+        "kaiser_fast" use resampy with the corresponding filter, and
+        "polyphase" uses a rational polyphase resampler with a filter that
+        is computed once per sampling rate.
+    frontend : "kapre" or "numpy"
+        Front-end used to compute the spectrogram input of the model if no
+        model is provided. "kapre" computes it with the kapre layers of the
+        model, "numpy" computes it with `openl3.frontend` (much faster on CPU)
+        and uses a model without the kapre layer. If a model is provided, the
+        front-end is determined by its input shape.
+    cache : openl3.cache.EmbeddingCache, str or None
+        Embedding cache, or path to the directory of an embedding cache. If
+        the embedding of the same decoded audio with the same model and
+        parameters is in the cache, it is copied to the output file instead
+        of being computed, and new outputs are added to the cache.
+    skip_existing : boolean
+        If True and a valid output file (see `is_valid_output`) already
+        exists, the file is not processed again.
+    output_format : "float32", "float16" or "int8"
+        Storage format of the embedding. "float16" halves the size of the
+        output. "int8" quantizes each dimension linearly between its minimum
+        and maximum over the file, and stores the per-dimension scale and
+        offset, which quarters the size of the output. Use `load_embedding`
+        to load outputs in any format as float32.
+    compress : boolean
+        If True, the output is saved with `np.savez_compressed`.
+    store : openl3.store.EmbeddingStore or None
+        Embedding store opened for appending. If given, the embedding is
+        appended to the store under `filepath` instead of being saved to an
+        .npz file, and `output_dir`, `suffix`, `output_format` and `compress`
+        are ignored (the format of the store is used). With `skip_existing`,
+        files that are already in the store are skipped. Cannot be combined
+        with `cache`.
+    aggregate : "mean", "max", "std", "meanstd" or None
+        If given, the saved embedding is summarised over the whole file, or
+        over segments of `segment_duration` seconds (see `get_embedding`).
+        In streaming mode, no temporary file is needed.
+    segment_duration : float or None
+        Duration of the aggregation segments in seconds. Requires
+        `aggregate`.
+    pca : openl3.pca.EmbeddingProjection, str or None
+        PCA projection (see `openl3.pca.fit_pca`), or path to a saved
+        projection. If given, the saved embedding is projected onto the
+        principal components batch by batch (see `get_embedding`).
+    silence_threshold : float or None
+        If given, RMS level in dBFS below which windows are not run through
+        the model (see `get_embedding`).
     verbose : 0 or 1
         Keras verbosity.
 
@@ -199,24 +1066,411 @@ def process_file(filepath, output_dir=None, suffix=None, model=None,
     if not os.path.exists(filepath):
         raise OpenL3Error('File "{}" could not be found.'.format(filepath))
 
-    try:
-        audio, sr = sf.read(filepath)
-    except Exception:
-        raise OpenL3Error('Could not open file "{}":\n{}'.format(filepath, traceback.format_exc()))
+    _validate_batch_size(batch_size)
+    _validate_embedding_args(model, input_repr, content_type, embedding_size,
+                             center, hop_size, 1 if verbose else 0,
+                             resample_method, frontend)
+    if isinstance(embedding_size, (list, tuple)):
+        if model is None and len(embedding_size) > 1:
+            raise OpenL3Error('A single embedding size can be saved per file')
+        embedding_size = embedding_size[0]
+    if model is not None and _is_multi_output_model(model):
+        # Neither the in-memory nor the streaming path can save several outputs
+        raise OpenL3Error('A single embedding size can be saved per file, use '
+                          'process_file_configs for several embedding sizes')
+
+    if str(output_format) not in OUTPUT_FORMATS:
+        raise OpenL3Error('Invalid output format "{}"'.format(output_format))
+
+    validate_aggregate_args(aggregate, segment_duration, hop_size)
+    _validate_silence_threshold(silence_threshold)
+    projection = get_projection(pca)
+
+    cache = _get_embedding_cache(cache)
+    if cache is not None and store is not None:
+        raise OpenL3Error('An embedding cache cannot be used with an embedding store')
+    if cache is not None:
+        if model is not None:
+            model_id = get_model_id(model)
+        else:
+            model_id = get_model_name(input_repr, content_type, embedding_size, frontend)
 
     if not suffix:
         suffix = ""
 
-    output_path = get_output_path(filepath, suffix + ".npz", output_dir=output_dir)
+    if store is not None:
+        if skip_existing and filepath in store:
+            return
+        output_path = None
+        tmp_dir = store.path
 
-    embedding, ts = get_embedding(audio, sr, model=model, input_repr=input_repr,
-                                  content_type=content_type,
-                                  embedding_size=embedding_size, center=center,
-                                  hop_size=hop_size, verbose=1 if verbose else 0)
+        def save(embedding, ts):
+            store.append(filepath, embedding, ts)
+    else:
+        output_path = get_output_path(filepath, suffix + ".npz", output_dir=output_dir)
+        if skip_existing and is_valid_output(output_path):
+            return
+        tmp_dir = os.path.dirname(output_path)
+
+        def save(embedding, ts):
+            _save_output(output_path, embedding, ts, output_format, compress)
+
+    if streaming:
+        try:
+            sound_file = sf.SoundFile(filepath)
+        except Exception:
+            raise OpenL3Error('Could not open file "{}":\n{}'.format(filepath, traceback.format_exc()))
+    else:
+        audio, sr = _read_audio(filepath)
+
+    if streaming:
+        with sound_file:
+            if cache is not None:
+                cache_key = get_cache_key(get_sound_file_hash(sound_file), model_id,
+                                          center, hop_size, resample_method,
+                                          output_format, compress, aggregate,
+                                          segment_duration,
+                                          projection.id if projection is not None else None,
+                                          silence_threshold)
+                if cache.copy_to(cache_key, output_path):
+                    return
+
+            if model is None:
+                model = load_embedding_model(input_repr, content_type, embedding_size,
+                                             frontend=frontend, thread_safe=True)
+            _process_sound_file_streaming(sound_file, save, model,
+                                          center=center, hop_size=hop_size,
+                                          batch_size=_resolve_batch_size(batch_size, [model]),
+                                          resample_method=resample_method,
+                                          tmp_dir=tmp_dir,
+                                          aggregate=aggregate,
+                                          segment_duration=segment_duration,
+                                          projection=projection,
+                                          silence_threshold=silence_threshold,
+                                          verbose=1 if verbose else 0)
+    else:
+        if cache is not None:
+            cache_key = get_cache_key(get_audio_hash(audio, sr), model_id,
+                                      center, hop_size, resample_method,
+                                      output_format, compress, aggregate,
+                                      segment_duration,
+                                      projection.id if projection is not None else None,
+                                      silence_threshold)
+            if cache.copy_to(cache_key, output_path):
+                return
+
+        embedding, ts = get_embedding(audio, sr, model=model, input_repr=input_repr,
+                                      content_type=content_type,
+                                      embedding_size=embedding_size, center=center,
+                                      hop_size=hop_size, batch_size=batch_size,
+                                      resample_method=resample_method,
+                                      frontend=frontend, aggregate=aggregate,
+                                      segment_duration=segment_duration,
+                                      pca=projection, silence_threshold=silence_threshold,
+                                      verbose=1 if verbose else 0)
+
+        save(embedding, ts)
+
+    if store is not None:
+        return
 
-    np.savez(output_path, embedding=embedding, timestamps=ts)
     assert os.path.exists(output_path)
 
+    if cache is not None:
+        cache.put_file(cache_key, output_path)
+
+
+def get_config_suffix(config, suffix=None):
+    """
+    Returns the suffix of the output file of a model configuration (see
+    `process_file_configs`), i.e. <suffix>_<input_repr>_<content_type>_<embedding_size>
+
+    Parameters
+    ----------
+    config : tuple
+        (input_repr, content_type, embedding_size[, frontend]) model
+        configuration.
+    suffix : str or None
+        Suffix prepended to the name of the configuration, if any.
+
+    Returns
+    -------
+    config_suffix : str
+        Suffix of the output file, without extension.
+    """
+    name = '{}_{}_{}'.format(*config[:3])
+    return '{}_{}'.format(suffix, name) if suffix else name
+
+
+def process_file_configs(filepath, configs, output_dir=None, suffix=None, center=True,
+                         hop_size=0.1, batch_size=32, resample_method="kaiser_best",
+                         frontend="kapre", skip_existing=False, output_format="float32",
+                         compress=False, verbose=True):
+    """
+    Computes and saves the embeddings of an audio file for several model
+    configurations, decoding and resampling the file once (see
+    `get_config_embeddings`). The embedding of each configuration is saved to
+    <base filename>_<suffix>_<input_repr>_<content_type>_<embedding_size>.npz
+    (see `get_config_suffix`).
+
+    Parameters
+    ----------
+    filepath : str
+        Path to WAV file to be processed.
+    configs : list of tuple
+        Model configurations, as (input_repr, content_type, embedding_size)
+        or (input_repr, content_type, embedding_size, frontend) tuples.
+    output_dir : str or None
+        Path to directory for saving output files. If None, output files will
+        be saved to the directory containing the input file.
+    suffix : str or None
+        String inserted before the name of the configuration in the output
+        filenames.
+    center, hop_size, batch_size, resample_method, frontend
+        Same as for `get_config_embeddings`.
+    skip_existing : boolean
+        If True, the configurations that already have a valid output file
+        (see `is_valid_output`) are not computed again, and the file is not
+        read if all of them do.
+    output_format : "float32", "float16" or "int8"
+        Storage format of the embeddings (see `process_file`).
+    compress : boolean
+        If True, the outputs are saved with `np.savez_compressed`.
+    verbose : 0 or 1
+        Keras verbosity.
+
+    Returns
+    -------
+
+    """
+    if not os.path.exists(filepath):
+        raise OpenL3Error('File "{}" could not be found.'.format(filepath))
+
+    configs = _validate_configs(configs, center, hop_size, 1 if verbose else 0,
+                                resample_method, frontend)
+    if str(output_format) not in OUTPUT_FORMATS:
+        raise OpenL3Error('Invalid output format "{}"'.format(output_format))
+
+    output_paths = dict((config[:3], get_output_path(filepath,
+                                                     get_config_suffix(config, suffix) + ".npz",
+                                                     output_dir=output_dir))
+                        for config in configs)
+    if skip_existing:
+        configs = [config for config in configs
+                   if not is_valid_output(output_paths[config[:3]])]
+        if not configs:
+            return
+
+    audio, sr = _read_audio(filepath)
+    embeddings, ts = get_config_embeddings(audio, sr, configs, center=center,
+                                           hop_size=hop_size, batch_size=batch_size,
+                                           resample_method=resample_method,
+                                           frontend=frontend, verbose=1 if verbose else 0)
+
+    for config in configs:
+        output_path = output_paths[config[:3]]
+        _save_output(output_path, embeddings[config[:3]], ts, output_format, compress)
+        assert os.path.exists(output_path)
+
+
+def _get_embedding_cache(cache):
+    """Returns the embedding cache for a cache object or cache directory"""
+    if cache is None or isinstance(cache, EmbeddingCache):
+        return cache
+    if isinstance(cache, string_types):
+        return EmbeddingCache(cache)
+    raise OpenL3Error('Invalid embedding cache {}'.format(cache))
+
+
+def _read_audio(filepath):
+    """Read an audio file, raising an OpenL3Error if it cannot be opened"""
+    try:
+        return sf.read(filepath)
+    except Exception:
+        raise OpenL3Error('Could not open file "{}":\n{}'.format(filepath, traceback.format_exc()))
+
+
+def _process_sound_file_streaming(sound_file, save, model, center,
+                                  hop_size, batch_size, resample_method,
+                                  tmp_dir=None, aggregate=None, segment_duration=None,
+                                  projection=None, silence_threshold=None, verbose=0):
+    """
+    Computes L3 embedding for an open sound file block by block and saves it
+    with `save(embedding, timestamps)`. Embeddings are appended to a
+    temporary file in `tmp_dir` as they are computed, and `save` is called
+    with a memory-mapped view of the temporary file at the end. If
+    `aggregate` is given, the embeddings are aggregated as they are computed
+    instead, and no temporary file is needed. Windows below
+    `silence_threshold` are skipped (see `get_embedding`).
+    """
+    n_samples = sound_file.frames
+    sr = sound_file.samplerate
+    if n_samples == 0:
+        raise OpenL3Error('Got empty audio')
+
+    is_silent = [True]
+
+    def read_audio(start, stop):
+        sound_file.seek(start)
+        audio = sound_file.read(stop - start)
+        if is_silent[0] and np.any(audio != 0):
+            is_silent[0] = False
+        if audio.ndim == 2:
+            # Downmix if multichannel
+            audio = np.mean(audio, axis=1)
+        return audio
+
+    blocks = _iter_resampled_blocks(read_audio, n_samples, sr, resample_method)
+    batches = _iter_frame_batches(_iter_stream_frames(blocks, hop_size, center),
+                                  batch_size)
+    gate = _SilenceGate(silence_threshold) if silence_threshold is not None else None
+
+    if aggregate is not None:
+        aggregator = EmbeddingAggregator(aggregate, hop_size, segment_duration)
+        _predict_batches(model, batches, None, verbose,
+                         hop_len=int(hop_size * TARGET_SR), aggregator=aggregator,
+                         projection=projection, gate=gate)
+        if is_silent[0]:
+            warnings.warn('Provided audio is all zeros', OpenL3Warning)
+        save(*aggregator.finalize())
+        return
+
+    if verbose:
+        progbar = _get_progbar(None)
+
+    tmp_fd, tmp_path = tempfile.mkstemp(suffix='.tmp', dir=tmp_dir)
+    try:
+        n_frames = 0
+        with os.fdopen(tmp_fd, 'wb') as tmp_file:
+            for batch in batches:
+                batch_embedding = _predict_batch(model, batch, hop_len=int(hop_size * TARGET_SR),
+                                                 projection=projection, gate=gate)
+                tmp_file.write(np.ascontiguousarray(batch_embedding).tobytes())
+                n_frames += batch_embedding.shape[0]
+                if verbose:
+                    progbar.update(n_frames)
+
+        if is_silent[0]:
+            warnings.warn('Provided audio is all zeros', OpenL3Warning)
+
+        embedding = np.memmap(tmp_path, dtype=batch_embedding.dtype, mode='r',
+                              shape=(n_frames,) + batch_embedding.shape[1:])
+        ts = np.arange(n_frames) * hop_size
+        save(embedding, ts)
+        del embedding
+    finally:
+        os.remove(tmp_path)
+
+
+def _encode_embedding(embedding, output_format="float32"):
+    """
+    Returns the arrays stored in an output file for an embedding in the given
+    format. The embedding is converted in chunks of frames, so that it can be
+    a memory-mapped array.
+    """
+    if output_format == "float32":
+        return {'embedding': embedding}
+
+    n_frames = embedding.shape[0]
+    chunks = [(start, min(start + OUTPUT_CHUNK_SIZE, n_frames))
+              for start in range(0, n_frames, OUTPUT_CHUNK_SIZE)]
+
+    if output_format == "float16":
+        encoded = np.empty(embedding.shape, dtype=np.float16)
+        for start, stop in chunks:
+            encoded[start:stop] = embedding[start:stop]
+        return {'embedding': encoded}
+
+    # Quantize each dimension to [-127, 127] between its minimum and maximum
+    emb_min = np.min([embedding[start:stop].min(axis=0) for start, stop in chunks], axis=0)
+    emb_max = np.max([embedding[start:stop].max(axis=0) for start, stop in chunks], axis=0)
+    offset = ((emb_max + emb_min) / 2.0).astype(np.float32)
+    scale = ((emb_max - emb_min) / 254.0).astype(np.float32)
+    scale[scale == 0] = 1
+
+    encoded = np.empty(embedding.shape, dtype=np.int8)
+    for start, stop in chunks:
+        q = np.round((embedding[start:stop] - offset) / scale)
+        encoded[start:stop] = np.clip(q, -127, 127)
+    return {'embedding': encoded, 'embedding_scale': scale, 'embedding_offset': offset}
+
+
+def _save_output(output_path, embedding, timestamps, output_format="float32",
+                 compress=False):
+    """Atomically saves an embedding and its timestamps to an output file"""
+    arrays = _encode_embedding(embedding, output_format)
+    arrays['timestamps'] = timestamps
+    save = np.savez_compressed if compress else np.savez
+    write_atomic(output_path, lambda f: save(f, **arrays))
+
+
+def load_embedding(filepath):
+    """
+    Loads an embedding saved by `process_file` in any output format, and
+    returns it as float32. Quantized embeddings are dequantized.
+
+    Parameters
+    ----------
+    filepath : str
+        Path to output file.
+
+    Returns
+    -------
+        embedding : np.ndarray [shape=(T, D)]
+            Array of embeddings for each window.
+        timestamps : np.ndarray [shape=(T,)]
+            Array of timestamps corresponding to each embedding in the output.
+    """
+    try:
+        with np.load(filepath) as data:
+            embedding = data['embedding']
+            timestamps = data['timestamps']
+            if 'embedding_scale' in data.files:
+                embedding = embedding * data['embedding_scale'] + data['embedding_offset']
+    except Exception:
+        raise OpenL3Error('Could not load file "{}":\n{}'.format(filepath, traceback.format_exc()))
+
+    return embedding.astype(np.float32, copy=False), timestamps
+
+
+def is_valid_output(output_path):
+    """
+    Checks whether an output file is complete, i.e. whether it can be opened
+    and contains an embedding and timestamps with the same number of frames.
+    Only the array headers are read.
+
+    Parameters
+    ----------
+    output_path : str
+        Path to output file.
+
+    Returns
+    -------
+    valid : boolean
+        True if the output file is valid.
+    """
+    if not os.path.isfile(output_path):
+        return False
+
+    try:
+        shapes = {}
+        with np.load(output_path) as data:
+            for name in ('embedding', 'timestamps'):
+                if name not in data.files:
+                    return False
+                with data.zip.open(name + '.npy') as f:
+                    version = np.lib.format.read_magic(f)
+                    if version == (1, 0):
+                        header = np.lib.format.read_array_header_1_0(f)
+                    else:
+                        header = np.lib.format.read_array_header_2_0(f)
+                shapes[name] = header[0]
+    except Exception:
+        return False
+
+    return (len(shapes['embedding']) == 2 and len(shapes['timestamps']) == 1
+            and shapes['embedding'][0] == shapes['timestamps'][0])
+
 
 def get_output_path(filepath, suffix, output_dir=None):
     """
@@ -0,0 +1,218 @@
+import numpy as np
+
+
+# Spectrogram parameters of the kapre layers at the input of each network
+SPECTROGRAM_PARAMS = {
+    'linear': {
+        'n_dft': 512,
+        'n_hop': 242,
+        'n_mels': None,
+        'padding': 'valid',
+    },
+    'mel128': {
+        'n_dft': 2048,
+        'n_hop': 242,
+        'n_mels': 128,
+        'padding': 'same',
+    },
+    'mel256': {
+        'n_dft': 2048,
+        'n_hop': 242,
+        'n_mels': 256,
+        'padding': 'same',
+    }
+}
+
+SPECTROGRAM_SR = 48000
+SPECTROGRAM_FRAME_LEN = 48000
+
+AMIN = 1e-10
+DYNAMIC_RANGE = 80.0
+
+# Mel filterbanks, keyed by (n_dft, n_mels)
+_MEL_FILTERBANKS = {}
+
+
+def _hz_to_mel_htk(frequencies):
+    """Convert Hz to mels with the HTK formula"""
+    return 2595.0 * np.log10(1.0 + np.asanyarray(frequencies) / 700.0)
+
+
+def _mel_to_hz_htk(mels):
+    """Convert mels to Hz with the HTK formula"""
+    return 700.0 * (10.0 ** (np.asanyarray(mels) / 2595.0) - 1.0)
+
+
+def _get_mel_filterbank(n_dft, n_mels):
+    """
+    Returns the (cached) mel filterbank of shape (n_mels, n_dft // 2 + 1) used
+    by the kapre Melspectrogram layers, i.e. librosa's HTK mel filterbank with
+    area normalization (``norm=1``) between 0 Hz and the Nyquist frequency.
+    """
+    key = (n_dft, n_mels)
+    if key not in _MEL_FILTERBANKS:
+        fmin = 0.0
+        fmax = SPECTROGRAM_SR / 2.0
+        fftfreqs = np.linspace(0, fmax, int(1 + n_dft // 2), endpoint=True)
+        mel_f = _mel_to_hz_htk(np.linspace(_hz_to_mel_htk(fmin), _hz_to_mel_htk(fmax),
+                                           n_mels + 2))
+        fdiff = np.diff(mel_f)
+        ramps = np.subtract.outer(mel_f, fftfreqs)
+
+        weights = np.zeros((n_mels, int(1 + n_dft // 2)))
+        for i in range(n_mels):
+            lower = -ramps[i] / fdiff[i]
+            upper = ramps[i + 2] / fdiff[i + 1]
+            weights[i] = np.maximum(0, np.minimum(lower, upper))
+
+        enorm = 2.0 / (mel_f[2:n_mels + 2] - mel_f[:n_mels])
+        weights *= enorm[:, np.newaxis]
+        _MEL_FILTERBANKS[key] = weights.astype(np.float32)
+
+    return _MEL_FILTERBANKS[key]
+
+
+def _get_frame_layout(n_dft, n_hop, padding, frame_len):
+    """
+    Returns the number of STFT frames per window and the number of zeros
+    padded before each window, following the Keras convolution padding rules
+    """
+    if padding == 'same':
+        n_frames = int(np.ceil(frame_len / float(n_hop)))
+        pad_total = max((n_frames - 1) * n_hop + n_dft - frame_len, 0)
+        pad_left = pad_total // 2
+    else:
+        n_frames = (frame_len - n_dft) // n_hop + 1
+        pad_left = 0
+    return n_frames, pad_left
+
+
+def _stft_power(audio, starts, n_dft):
+    """
+    Computes the power spectrum of the frames of `audio` (shape (B, N)) that
+    start at the given sample indices, with a periodic Hann window. Samples
+    outside of the audio are zero.
+    """
+    window = (0.5 - 0.5 * np.cos(2.0 * np.pi * np.arange(n_dft) / n_dft)).astype(np.float32)
+
+    pad_left = max(0, -int(starts.min()))
+    pad_right = max(0, int(starts.max()) + n_dft - audio.shape[-1])
+    if pad_left or pad_right:
+        audio = np.pad(audio, ((0, 0), (pad_left, pad_right)), mode='constant')
+
+    idx = (starts + pad_left)[:, np.newaxis] + np.arange(n_dft)[np.newaxis, :]
+    spec = np.fft.rfft(audio[:, idx] * window, axis=-1)
+    return spec.real ** 2 + spec.imag ** 2
+
+
+def compute_power_spectrogram(frames, input_repr, hop_len=None):
+    """
+    Computes the power spectrogram of each one second window, as computed by
+    the kapre layer at the input of the network for `input_repr`.
+
+    If `frames` are consecutive windows of the same signal, `hop_len` is the
+    hop size between them (in samples), and `hop_len` is a multiple of the
+    STFT hop size, each STFT frame that lies fully inside the windows is
+    computed only once and shared between the windows that contain it.
+
+    Parameters
+    ----------
+    frames : np.ndarray [shape=(B, 48000)]
+        Batch of one second audio windows sampled at 48kHz.
+    input_repr : "linear", "mel128", or "mel256"
+        Spectrogram representation.
+    hop_len : int or None
+        Hop size between consecutive windows in samples, or None if the
+        windows are not consecutive windows of the same signal.
+
+    Returns
+    -------
+    power : np.ndarray [shape=(B, n_frames, n_bins)]
+        Power spectrogram of each window.
+    """
+    params = SPECTROGRAM_PARAMS[input_repr]
+    n_dft = params['n_dft']
+    n_hop = params['n_hop']
+    n_windows, frame_len = frames.shape
+    n_frames, pad_left = _get_frame_layout(n_dft, n_hop, params['padding'], frame_len)
+    starts = np.arange(n_frames) * n_hop - pad_left
+
+    if hop_len is None or hop_len % n_hop != 0 or hop_len > frame_len or n_windows < 2:
+        return _stft_power(frames, starts, n_dft)
+
+    # STFT frames that do not depend on the zero padding of each window
+    interior = np.nonzero((starts >= 0) & (starts + n_dft <= frame_len))[0]
+    k_first, k_last = interior[0], interior[-1]
+    step = hop_len // n_hop
+
+    # Reconstruct the signal covered by the (overlapping) windows and compute
+    # the interior STFT frames of all windows on a shared grid
+    signal = np.concatenate([frames[0], frames[1:, frame_len - hop_len:].ravel()])
+    grid = np.arange(k_first, (n_windows - 1) * step + k_last + 1) * n_hop - pad_left
+    shared = _stft_power(signal[np.newaxis, :], grid, n_dft)[0]
+
+    power = np.empty((n_windows, n_frames, shared.shape[-1]))
+    idx = (np.arange(n_windows) * step)[:, np.newaxis] + np.arange(k_last - k_first + 1)
+    power[:, k_first:k_last + 1] = shared[idx]
+
+    # Frames at the edges of each window include padding and are computed per window
+    edges = np.concatenate([np.arange(k_first), np.arange(k_last + 1, n_frames)]).astype(int)
+    if edges.size > 0:
+        power[:, edges] = _stft_power(frames, starts[edges], n_dft)
+
+    return power
+
+
+def power_to_model_input(power, input_repr):
+    """
+    Converts a power spectrogram to the input of the network for
+    `input_repr`: an (optionally mel-scaled) magnitude spectrogram in decibels,
+    normalized so that the maximum of each window is 0 dB and clipped to an
+    80 dB dynamic range.
+
+    Parameters
+    ----------
+    power : np.ndarray [shape=(B, n_frames, n_bins)]
+        Power spectrogram of each window.
+    input_repr : "linear", "mel128", or "mel256"
+        Spectrogram representation.
+
+    Returns
+    -------
+    spectrogram : np.ndarray [shape=(B, n_freq, n_frames, 1)]
+        Network input for each window.
+    """
+    params = SPECTROGRAM_PARAMS[input_repr]
+    if params['n_mels'] is not None:
+        power = np.dot(power, _get_mel_filterbank(params['n_dft'], params['n_mels']).T)
+
+    spec = np.sqrt(power).transpose(0, 2, 1)[..., np.newaxis]
+
+    log_spec = 10 * np.log10(np.maximum(spec, AMIN))
+    log_spec -= log_spec.max(axis=(1, 2, 3), keepdims=True)
+    log_spec = np.maximum(log_spec, -DYNAMIC_RANGE)
+    return log_spec.astype(np.float32)
+
+
+def compute_model_input(frames, input_repr, hop_len=None):
+    """
+    Computes the network input for a batch of one second windows, as
+    computed by the kapre layer at the input of the network for `input_repr`.
+
+    Parameters
+    ----------
+    frames : np.ndarray [shape=(B, 48000)]
+        Batch of one second audio windows sampled at 48kHz.
+    input_repr : "linear", "mel128", or "mel256"
+        Spectrogram representation.
+    hop_len : int or None
+        Hop size between consecutive windows in samples, or None if the
+        windows are not consecutive windows of the same signal.
+
+    Returns
+    -------
+    spectrogram : np.ndarray [shape=(B, n_freq, n_frames, 1)]
+        Network input for each window.
+    """
+    return power_to_model_input(compute_power_spectrogram(frames, input_repr, hop_len),
+                                input_repr)
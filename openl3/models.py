@@ -1,17 +1,35 @@
 import os
 import warnings
-import sklearn.decomposition
+import threading
+import numpy as np
+from collections import OrderedDict
+from .frontend import SPECTROGRAM_PARAMS
+from .cache import get_model_name
+from .openl3_exceptions import OpenL3Error
+from .openl3_warnings import OpenL3Warning
+
+# Keras and kapre are only imported when the first model is constructed
+# (see `_import_keras`), so that importing openl3 does not load them
+Model = Input = Conv2D = BatchNormalization = MaxPooling2D = None
+Flatten = Activation = regularizers = Spectrogram = Melspectrogram = None
+
+
+def _import_keras():
+    """Imports the keras and kapre classes used to construct the models"""
+    global Model, Input, Conv2D, BatchNormalization, MaxPooling2D, Flatten, \
+        Activation, regularizers, Spectrogram, Melspectrogram
+    if Model is not None:
+        return
 
-with warnings.catch_warnings():
-    # Suppress TF and Keras warnings when importing
-    warnings.simplefilter("ignore")
-    from keras.models import Model
-    from keras.layers import (
-        Input, Conv2D, BatchNormalization, MaxPooling2D,
-        Flatten, Activation, Lambda
-    )
-    import keras.regularizers as regularizers
-    from kapre.time_frequency import Spectrogram, Melspectrogram
+    with warnings.catch_warnings():
+        # Suppress TF and Keras warnings when importing
+        warnings.simplefilter("ignore")
+        from keras.layers import (
+            Input, Conv2D, BatchNormalization, MaxPooling2D, Flatten, Activation
+        )
+        import keras.regularizers as regularizers
+        from kapre.time_frequency import Spectrogram, Melspectrogram
+        from keras.models import Model
 
 
 POOLINGS = {
@@ -30,7 +48,24 @@ POOLINGS = {
 }
 
 
-def load_embedding_model(input_repr, content_type, embedding_size):
+# Process-wide cache of loaded embedding models, keyed by
+# (input_repr, content_type, embedding_size, frontend) and kept in LRU order
+_MODEL_CACHE = OrderedDict()
+_MODEL_CACHE_LOCK = threading.RLock()
+_MODEL_CACHE_INFO = {
+    'hits': 0,
+    'misses': 0,
+    'max_size': 4,
+}
+
+# Events of the models being constructed for the cache, keyed like the cache.
+# Models are constructed without holding the cache lock, and other threads
+# that need the same model wait for its event.
+_MODEL_LOADS = {}
+
+
+def load_embedding_model(input_repr, content_type, embedding_size, frontend="kapre",
+                         use_cache=True, thread_safe=False, optimize=False, use_xla=False):
     """
     Returns a model with the given characteristics. Loads the model
     if the model has not been loaded yet.
@@ -41,30 +76,446 @@ def load_embedding_model(input_repr, content_type, embedding_size):
         Spectrogram representation used for model.
     content_type : "music" or "env"
         Type of content used to train embedding.
-    embedding_size : 6144 or 512
-        Embedding dimensionality.
+    embedding_size : 6144, 512 or list of them
+        Embedding dimensionality. If several sizes are given, the model has
+        one output per size, in the same order. The sizes only differ by the
+        final max pooling, so all of them are computed in a single pass.
+    frontend : "kapre" or "numpy"
+        If "kapre", the model takes one second audio windows as input and
+        computes the spectrogram with kapre layers. If "numpy", the kapre
+        layer is left out and the model takes spectrograms computed with
+        `openl3.frontend.compute_model_input` as input.
+    use_cache : boolean
+        If True, the model is taken from (and stored in) the process-wide
+        model cache, and the same model object is returned to every caller
+        in the process, so it must not be modified, compiled or trained.
+        If False, a new model is always constructed, which the caller owns.
+    thread_safe : boolean
+        If True, the model is returned wrapped in a `ThreadSafeModel`, which
+        can be used from any thread. Cached models always have the same
+        wrapper, so all the threads that use them share its lock. If False,
+        the keras model is returned, which is shared in the same way if it
+        is cached.
+    optimize : boolean
+        If True, the model is built for inference only: each
+        BatchNormalization layer that follows a convolution is folded into
+        the weights of the convolution, and the weight regularizers (which
+        are only used for training) are dropped. The embeddings are the same
+        up to floating point rounding.
+    use_xla : boolean
+        If True, the operations of the model are compiled with XLA, if the
+        TensorFlow backend supports it. With TensorFlow 2, this enables XLA
+        for the whole process.
 
     Returns
     -------
+    model : keras.models.Model or ThreadSafeModel
+        Model object.
+    """
+    if frontend not in ("kapre", "numpy"):
+        raise OpenL3Error('Invalid frontend "{}"'.format(frontend))
+    if isinstance(embedding_size, (list, tuple)):
+        embedding_size = tuple(embedding_size) if len(embedding_size) > 1 else embedding_size[0]
+
+    if not use_cache:
+        model = _construct_embedding_model(input_repr, content_type, embedding_size,
+                                           frontend, optimize=optimize, use_xla=use_xla)
+        return ThreadSafeModel(model) if thread_safe else model
+
+    key = (input_repr, content_type, embedding_size, frontend)
+    if optimize or use_xla:
+        key += (bool(optimize), bool(use_xla))
+    while True:
+        with _MODEL_CACHE_LOCK:
+            if key in _MODEL_CACHE:
+                _MODEL_CACHE_INFO['hits'] += 1
+                safe_model = _MODEL_CACHE.pop(key)
+                _MODEL_CACHE[key] = safe_model
+                break
+            loaded = _MODEL_LOADS.get(key)
+            if loaded is None:
+                _MODEL_CACHE_INFO['misses'] += 1
+                loaded = _MODEL_LOADS[key] = threading.Event()
+                owner = True
+            else:
+                owner = False
+
+        if not owner:
+            # Constructed by another thread, look it up again once it is done
+            loaded.wait()
+            continue
+
+        try:
+            safe_model = ThreadSafeModel(_construct_embedding_model(
+                input_repr, content_type, embedding_size, frontend, optimize=optimize,
+                use_xla=use_xla))
+            with _MODEL_CACHE_LOCK:
+                _MODEL_CACHE[key] = safe_model
+                _evict_models()
+        finally:
+            with _MODEL_CACHE_LOCK:
+                del _MODEL_LOADS[key]
+            loaded.set()
+        break
+
+    return safe_model if thread_safe else safe_model.model
+
+
+class ThreadSafeModel(object):
+    """
+    Wrapper that makes a model safe to call from many threads. With a
+    TensorFlow 1 backend, the graph and session of the model are captured
+    when the wrapper is created (so it must be created in the thread that
+    loaded the model), and every inference call runs with them as defaults.
+    The predict function of the model is built once, up front, and calls
+    are serialised with a lock unless `serialize` is False.
+
+    The wrapper can be passed to `openl3.get_embedding`,
+    `openl3.get_embeddings_batch` and `openl3.process_file` like a model,
+    and other attributes are taken from the wrapped model.
+
+    Parameters
+    ----------
     model : keras.models.Model
         Model object.
+    serialize : boolean
+        If True, only one thread runs inference at a time. If False, the
+        backend runs concurrent calls in parallel, which is safe for a
+        TensorFlow 1 session once the predict function is built.
+    """
+    def __init__(self, model, serialize=True):
+        if isinstance(model, ThreadSafeModel):
+            model = model.model
+        self.model = model
+        self.serialize = serialize
+        self.graph, self.session = _get_tf_session()
+        self._lock = threading.Lock()
+
+        # Keras builds the predict function on the first call, which is not
+        # thread-safe
+        with self._context():
+            if hasattr(model, '_make_predict_function'):
+                model._make_predict_function()
+
+    def _context(self):
+        if self.graph is None:
+            return _ContextGroup([])
+        return _ContextGroup([self.graph.as_default(), self.session.as_default()])
+
+    def _call(self, method, *args, **kwargs):
+        if self.serialize:
+            self._lock.acquire()
+        try:
+            with self._context():
+                return method(*args, **kwargs)
+        finally:
+            if self.serialize:
+                self._lock.release()
+
+    def predict_on_batch(self, x):
+        """Runs inference on a batch (see `keras.models.Model.predict_on_batch`)"""
+        return self._call(self.model.predict_on_batch, x)
+
+    def predict(self, x, *args, **kwargs):
+        """Runs inference (see `keras.models.Model.predict`)"""
+        return self._call(self.model.predict, x, *args, **kwargs)
+
+    def __getattr__(self, name):
+        if name == 'model':
+            # Not initialized yet, e.g. when unpickling
+            raise AttributeError(name)
+        return getattr(self.model, name)
+
+
+class _ContextGroup(object):
+    """Context manager that enters several context managers"""
+    def __init__(self, contexts):
+        self._contexts = contexts
+
+    def __enter__(self):
+        for context in self._contexts:
+            context.__enter__()
+
+    def __exit__(self, *exc_info):
+        for context in reversed(self._contexts):
+            context.__exit__(*exc_info)
+
+
+def _get_tf_session():
+    """Returns the default graph and session of a TensorFlow 1 backend, or (None, None)"""
+    import keras.backend as K
+    if K.backend() != 'tensorflow' or not hasattr(K, 'get_session'):
+        return None, None
+    try:
+        session = K.get_session()
+    except Exception:
+        # TensorFlow 2 has no default session
+        return None, None
+    return session.graph, session
+
+
+def _construct_embedding_model(input_repr, content_type, embedding_size, frontend="kapre",
+                               optimize=False, use_xla=False):
     """
+    Constructs a model with the given characteristics and loads its weights.
 
-    # Construct embedding model and load model weights
-    with warnings.catch_warnings():
-        warnings.simplefilter("ignore")
-        m = MODELS[input_repr]()
+    Parameters
+    ----------
+    input_repr : "linear", "mel128", or "mel256"
+        Spectrogram representation used for model.
+    content_type : "music" or "env"
+        Type of content used to train embedding.
+    embedding_size : 6144, 512 or tuple of them
+        Embedding dimensionality, or dimensionalities of the outputs.
+    frontend : "kapre" or "numpy"
+        Whether the model includes the kapre spectrogram layer.
+    optimize : boolean
+        Whether to build the model for inference only (see
+        `_optimize_for_inference`).
+    use_xla : boolean
+        Whether to compile the model with XLA.
 
-    m.load_weights(load_embedding_model_path(input_repr, content_type))
+    Returns
+    -------
+    model : keras.models.Model
+        Model object.
+    """
+
+    _import_keras()
+
+    with _ContextGroup(_get_xla_contexts() if use_xla else []):
+        # Construct embedding model and load model weights
+        with warnings.catch_warnings():
+            warnings.simplefilter("ignore")
+            m = MODELS[input_repr]()
 
-    # Pooling for final output embedding size
-    pool_size = POOLINGS[input_repr][embedding_size]
-    y_a = MaxPooling2D(pool_size=pool_size, padding='same')(m.output)
-    y_a = Flatten()(y_a)
-    m = Model(inputs=m.input, outputs=y_a)
+        m.load_weights(load_embedding_model_path(input_repr, content_type))
+
+        if frontend == "numpy":
+            m = _remove_spectrogram_layer(m)
+
+        if optimize:
+            m = _optimize_for_inference(m)
+
+        # Pooling for final output embedding size(s), sharing the rest of the network
+        sizes = embedding_size if isinstance(embedding_size, tuple) else (embedding_size,)
+        outputs = []
+        for size in sizes:
+            y_a = MaxPooling2D(pool_size=POOLINGS[input_repr][size], padding='same')(m.output)
+            outputs.append(Flatten()(y_a))
+        name = get_model_name(input_repr, content_type, '_'.join(str(size) for size in sizes),
+                              frontend, optimize=optimize, use_xla=use_xla)
+        m = Model(inputs=m.input, outputs=outputs if len(outputs) > 1 else outputs[0],
+                  name=name)
     return m
 
 
+def _optimize_for_inference(m):
+    """
+    Returns a model that computes the same function as the given model (a
+    chain of layers), with each BatchNormalization layer that follows a
+    Conv2D layer folded into the weights of the convolution, and without
+    weight regularizers. The other layers are shared with the given model.
+    """
+    x_a = Input(shape=m.input_shape[1:], dtype='float32')
+    y_a = x_a
+    layers = m.layers[1:]
+    idx = 0
+    while idx < len(layers):
+        layer = layers[idx]
+        if not isinstance(layer, Conv2D):
+            y_a = layer(y_a)
+            idx += 1
+            continue
+
+        config = layer.get_config()
+        for name in ('kernel_regularizer', 'bias_regularizer', 'activity_regularizer'):
+            config[name] = None
+        weights = layer.get_weights()
+        kernel, bias = weights[0], (weights[1] if config['use_bias'] else None)
+
+        next_layer = layers[idx + 1] if idx + 1 < len(layers) else None
+        if isinstance(next_layer, BatchNormalization) and _can_fold(config, next_layer):
+            kernel, bias = _fold_batch_norm(kernel, bias, next_layer)
+            config['use_bias'] = True
+            idx += 1
+
+        conv = Conv2D.from_config(config)
+        y_a = conv(y_a)
+        conv.set_weights([kernel, bias] if config['use_bias'] else [kernel])
+        idx += 1
+
+    return Model(inputs=x_a, outputs=y_a)
+
+
+def _can_fold(conv_config, bn):
+    """Returns whether a BatchNormalization layer can be folded into the preceding Conv2D layer"""
+    axis = bn.axis[0] if isinstance(bn.axis, (list, tuple)) and len(bn.axis) == 1 else bn.axis
+    return conv_config.get('data_format') == 'channels_last' and axis in (-1, 3) \
+        and conv_config.get('activation') == 'linear'
+
+
+def _fold_batch_norm(kernel, bias, bn):
+    """
+    Returns the kernel and bias of a convolution followed by a batch
+    normalization in inference mode, i.e.
+    gamma * (conv(x) + bias - mean) / sqrt(var + epsilon) + beta.
+    """
+    weights = bn.get_weights()
+    n_channels = kernel.shape[-1]
+    gamma = weights.pop(0) if bn.scale else np.ones(n_channels, dtype=kernel.dtype)
+    beta = weights.pop(0) if bn.center else np.zeros(n_channels, dtype=kernel.dtype)
+    mean, var = weights
+    if bias is None:
+        bias = np.zeros(n_channels, dtype=kernel.dtype)
+
+    scale = gamma / np.sqrt(var + bn.epsilon)
+    folded_kernel = (kernel * scale).astype(kernel.dtype)
+    folded_bias = ((bias - mean) * scale + beta).astype(kernel.dtype)
+    return folded_kernel, folded_bias
+
+
+def _get_xla_contexts():
+    """
+    Returns the context managers under which the operations of a model are
+    compiled with XLA. With TensorFlow 1, the operations created in an XLA
+    JIT scope are compiled. With TensorFlow 2, XLA JIT compilation is enabled
+    for the whole process.
+    """
+    try:
+        import tensorflow as tf
+    except ImportError:
+        warnings.warn('XLA requires the TensorFlow backend', OpenL3Warning)
+        return []
+
+    try:
+        from tensorflow.contrib.compiler import jit
+        return [jit.experimental_jit_scope()]
+    except ImportError:
+        pass
+
+    try:
+        tf.config.optimizer.set_jit(True)
+    except AttributeError:
+        warnings.warn('XLA is not supported by this version of TensorFlow', OpenL3Warning)
+    return []
+
+
+def _remove_spectrogram_layer(m):
+    """
+    Returns a model that shares all layers (and weights) of the given model
+    except for the kapre spectrogram layer, and takes the output of that
+    layer as input.
+    """
+    x_a = Input(shape=m.layers[1].output_shape[1:], dtype='float32')
+    y_a = x_a
+    for layer in m.layers[2:]:
+        y_a = layer(y_a)
+    return Model(inputs=x_a, outputs=y_a)
+
+
+def get_spectrogram_input_repr(model):
+    """
+    Returns the input representation of a model that takes spectrograms as
+    input (see `load_embedding_model`), or None if the model takes audio as
+    input.
+
+    Parameters
+    ----------
+    model : keras.models.Model
+        Model object.
+
+    Returns
+    -------
+    input_repr : "linear", "mel128", "mel256" or None
+        Spectrogram representation expected by the model.
+    """
+    input_shape = model.input_shape
+    if len(input_shape) != 4:
+        return None
+
+    for input_repr, params in SPECTROGRAM_PARAMS.items():
+        n_freq = params['n_mels'] or params['n_dft'] // 2 + 1
+        if input_shape[1] == n_freq:
+            return input_repr
+
+    raise OpenL3Error('Unsupported model input shape {}'.format(input_shape))
+
+
+def _evict_models():
+    """Evicts least recently used models until the cache fits its maximum size"""
+    with _MODEL_CACHE_LOCK:
+        while len(_MODEL_CACHE) > _MODEL_CACHE_INFO['max_size']:
+            _MODEL_CACHE.popitem(last=False)
+
+
+def set_model_cache_size(max_size):
+    """
+    Sets the maximum number of models kept resident in the model cache.
+    Least recently used models are evicted if the cache is larger than
+    the new maximum size.
+
+    Parameters
+    ----------
+    max_size : int
+        Maximum number of resident models. If 0, models are not cached.
+    """
+    if not isinstance(max_size, int) or isinstance(max_size, bool) or max_size < 0:
+        raise OpenL3Error('Invalid model cache size {}'.format(max_size))
+
+    with _MODEL_CACHE_LOCK:
+        _MODEL_CACHE_INFO['max_size'] = max_size
+        _evict_models()
+
+
+def clear_model_cache():
+    """
+    Removes all models from the model cache and resets the hit/miss counters.
+    """
+    with _MODEL_CACHE_LOCK:
+        _MODEL_CACHE.clear()
+        _MODEL_CACHE_INFO['hits'] = 0
+        _MODEL_CACHE_INFO['misses'] = 0
+
+
+def preload_embedding_models(configs):
+    """
+    Loads the models with the given characteristics into the model cache.
+
+    Parameters
+    ----------
+    configs : iterable of (input_repr, content_type, embedding_size) or
+              (input_repr, content_type, embedding_size, frontend) tuples
+        Characteristics of the models to load.
+
+    Returns
+    -------
+    models : list of keras.models.Model
+        Loaded model objects, in the order of `configs`. They are shared
+        with the other users of the model cache (see `load_embedding_model`).
+    """
+    return [load_embedding_model(*config) for config in configs]
+
+
+def get_model_cache_info():
+    """
+    Returns statistics about the model cache.
+
+    Returns
+    -------
+    info : dict
+        Dictionary with the number of cache ``hits`` and ``misses``, the
+        current number of resident models (``size``), the maximum number of
+        resident models (``max_size``) and the keys of the resident models in
+        least to most recently used order (``keys``).
+    """
+    with _MODEL_CACHE_LOCK:
+        info = dict(_MODEL_CACHE_INFO)
+        info['size'] = len(_MODEL_CACHE)
+        info['keys'] = list(_MODEL_CACHE.keys())
+    return info
+
+
 def load_embedding_model_path(input_repr, content_type):
     """
     Returns the local path to the model weights file for the model
@@ -0,0 +1,221 @@
+import hashlib
+import traceback
+import numpy as np
+from numbers import Integral
+from six import string_types
+from .utils import write_atomic
+from .reader import open_embedding
+from .openl3_exceptions import OpenL3Error
+
+
+class EmbeddingProjection(object):
+    """
+    Linear projection of embeddings onto their principal components, as
+    fitted by `fit_pca`. It can be passed to `openl3.get_embedding` and
+    `openl3.process_file` (``pca=...``) to reduce the dimensionality of the
+    embeddings batch by batch, as they are computed.
+
+    Parameters
+    ----------
+    mean : np.ndarray [shape=(D,)]
+        Mean of the embeddings the projection was fitted on.
+    components : np.ndarray [shape=(K, D)]
+        Principal components.
+    explained_variance : np.ndarray [shape=(K,)] or None
+        Variance of the embeddings along each component.
+    whiten : boolean
+        If True, the projected embeddings are divided by the square root of
+        the explained variance, so that each component has unit variance.
+    """
+    def __init__(self, mean, components, explained_variance=None, whiten=False):
+        mean = np.asarray(mean, dtype=np.float32)
+        components = np.asarray(components, dtype=np.float32)
+        if components.ndim != 2 or mean.shape != components.shape[1:]:
+            raise OpenL3Error('Invalid projection mean and components shapes {} and {}'.format(
+                mean.shape, components.shape))
+        if whiten and explained_variance is None:
+            raise OpenL3Error('Whitening requires the explained variance')
+        if explained_variance is not None:
+            explained_variance = np.asarray(explained_variance, dtype=np.float32)
+
+        self.mean = mean
+        self.components = components
+        self.explained_variance = explained_variance
+        self.whiten = bool(whiten)
+
+        # Projection matrix and offset, i.e. x -> x.dot(matrix) - offset
+        matrix = components.T
+        if self.whiten:
+            matrix = matrix / np.sqrt(np.maximum(explained_variance, 1e-12))
+        self._matrix = np.ascontiguousarray(matrix, dtype=np.float32)
+        self._offset = mean.dot(self._matrix)
+
+    @property
+    def n_components(self):
+        """Dimensionality of the projected embeddings"""
+        return self.components.shape[0]
+
+    @property
+    def input_dim(self):
+        """Dimensionality of the embeddings that can be projected"""
+        return self.components.shape[1]
+
+    @property
+    def id(self):
+        """Digest of the projection, which identifies its output in the embedding cache"""
+        h = hashlib.sha256(str(self.whiten).encode('utf-8'))
+        h.update(self._matrix.tobytes())
+        h.update(self._offset.tobytes())
+        return h.hexdigest()
+
+    def transform(self, embedding):
+        """
+        Projects embeddings onto the principal components.
+
+        Parameters
+        ----------
+        embedding : np.ndarray [shape=(T, D)]
+            Embeddings.
+
+        Returns
+        -------
+        projected : np.ndarray [shape=(T, K)]
+            Projected embeddings, as float32.
+        """
+        if embedding.ndim != 2 or embedding.shape[1] != self.input_dim:
+            raise OpenL3Error('Cannot project embeddings of shape {} with a projection of '
+                              'dimension {}'.format(embedding.shape, self.input_dim))
+        return np.dot(embedding.astype(np.float32, copy=False), self._matrix) - self._offset
+
+    def save(self, path):
+        """
+        Saves the projection to a .npz file, which can be loaded with
+        `load_projection`.
+
+        Parameters
+        ----------
+        path : str
+            Path to the output file.
+        """
+        arrays = {'mean': self.mean, 'components': self.components,
+                  'whiten': np.array(self.whiten)}
+        if self.explained_variance is not None:
+            arrays['explained_variance'] = self.explained_variance
+        write_atomic(path, lambda f: np.savez(f, **arrays))
+
+
+def load_projection(path):
+    """
+    Loads a projection saved by `EmbeddingProjection.save`.
+
+    Parameters
+    ----------
+    path : str
+        Path to the projection file.
+
+    Returns
+    -------
+    projection : EmbeddingProjection
+        Loaded projection.
+    """
+    try:
+        with np.load(path) as data:
+            explained_variance = data['explained_variance'] \
+                if 'explained_variance' in data.files else None
+            return EmbeddingProjection(data['mean'], data['components'],
+                                       explained_variance=explained_variance,
+                                       whiten=bool(data['whiten']))
+    except OpenL3Error:
+        raise
+    except Exception:
+        raise OpenL3Error('Could not load projection "{}":\n{}'.format(path, traceback.format_exc()))
+
+
+def get_projection(pca):
+    """Returns the projection for a projection object or the path to a projection file"""
+    if pca is None or isinstance(pca, EmbeddingProjection):
+        return pca
+    if isinstance(pca, string_types):
+        return load_projection(pca)
+    raise OpenL3Error('Invalid projection {}'.format(pca))
+
+
+def _iter_embeddings(embeddings):
+    """Yields float32 embedding arrays from arrays or paths to output files"""
+    for embedding in embeddings:
+        if isinstance(embedding, string_types):
+            with open_embedding(embedding) as f:
+                embedding = f[:]
+        embedding = np.asarray(embedding, dtype=np.float32)
+        if embedding.ndim != 2:
+            raise OpenL3Error('Invalid embedding shape {}'.format(embedding.shape))
+        yield embedding
+
+
+def fit_pca(embeddings, n_components, whiten=False, batch_size=1024):
+    """
+    Fits a PCA projection on a sample of embeddings with scikit-learn's
+    `IncrementalPCA`. The embeddings are read one at a time and fitted in
+    batches of frames, so the sample does not have to fit in memory.
+
+    Parameters
+    ----------
+    embeddings : iterable of np.ndarray [shape=(T, D)] or of str
+        Embeddings, or paths to output files saved by `openl3.process_file`.
+    n_components : int
+        Number of principal components.
+    whiten : boolean
+        If True, the projection scales each component to unit variance.
+    batch_size : int
+        Number of frames per `partial_fit` call. It is raised to
+        `n_components` if it is smaller.
+
+    Returns
+    -------
+    projection : EmbeddingProjection
+        Fitted projection.
+    """
+    try:
+        from sklearn.decomposition import IncrementalPCA
+    except ImportError:
+        raise OpenL3Error('scikit-learn is required to fit a PCA projection')
+
+    if not isinstance(n_components, Integral) or isinstance(n_components, bool) \
+            or n_components < 1:
+        raise OpenL3Error('Invalid number of components {}'.format(n_components))
+    if not isinstance(batch_size, Integral) or isinstance(batch_size, bool) or batch_size < 1:
+        raise OpenL3Error('Invalid batch size {}'.format(batch_size))
+    batch_size = max(batch_size, n_components)
+
+    pca = IncrementalPCA(n_components=n_components, whiten=whiten)
+
+    # Each partial_fit call needs at least n_components frames, so a full
+    # batch is only fitted once the next one is complete, and the remaining
+    # frames are fitted with the last full batch
+    buf = []
+    n_buf = 0
+    pending = None
+    for embedding in _iter_embeddings(embeddings):
+        buf.append(embedding)
+        n_buf += embedding.shape[0]
+        if n_buf >= batch_size:
+            frames = np.concatenate(buf)
+            idx = 0
+            while frames.shape[0] - idx >= batch_size:
+                if pending is not None:
+                    pca.partial_fit(pending)
+                pending = frames[idx:idx + batch_size]
+                idx += batch_size
+            buf = [frames[idx:]]
+            n_buf = frames.shape[0] - idx
+
+    if pending is not None:
+        buf.insert(0, pending)
+    n_frames = sum(frames.shape[0] for frames in buf)
+    if n_frames < n_components:
+        raise OpenL3Error('At least {} frames are required to fit the PCA, got {}'.format(
+            n_components, n_frames))
+    pca.partial_fit(np.concatenate(buf))
+
+    return EmbeddingProjection(pca.mean_, pca.components_,
+                               explained_variance=pca.explained_variance_, whiten=whiten)
@@ -0,0 +1,273 @@
+import os
+import struct
+import zipfile
+import traceback
+import numpy as np
+from .utils import write_atomic
+from .openl3_exceptions import OpenL3Error
+
+
+# Arrays of an output file, besides the quantization parameters of "int8" outputs
+_ARRAY_NAMES = ('embedding', 'timestamps')
+_QUANTIZATION_NAMES = ('embedding_scale', 'embedding_offset')
+
+# Size of the fixed part of a zip local file header
+_ZIP_LOCAL_HEADER_SIZE = 30
+
+
+def get_sidecar_path(output_path, name):
+    """
+    Returns the path of the .npy sidecar of an array of an output file, i.e.
+    "/path/to/file.embedding.npy" for the "embedding" array of
+    "/path/to/file.npz".
+
+    Parameters
+    ----------
+    output_path : str
+        Path to output file.
+    name : str
+        Name of the array.
+
+    Returns
+    -------
+    sidecar_path : str
+        Path to the sidecar file.
+    """
+    return '{}.{}.npy'.format(os.path.splitext(output_path)[0], name)
+
+
+def save_sidecars(output_path):
+    """
+    Saves each array of an output file to a .npy sidecar next to it (see
+    `get_sidecar_path`), so that the embedding can be memory-mapped even if
+    the output file is compressed. The sidecars are used by `open_embedding`
+    as long as they are not older than the output file.
+
+    Parameters
+    ----------
+    output_path : str
+        Path to output file.
+
+    Returns
+    -------
+    sidecar_paths : list of str
+        Paths to the sidecar files.
+    """
+    sidecar_paths = []
+    try:
+        with np.load(output_path) as data:
+            for name in data.files:
+                sidecar_path = get_sidecar_path(output_path, name)
+                array = data[name]
+                write_atomic(sidecar_path, lambda f: np.save(f, array))
+                sidecar_paths.append(sidecar_path)
+            # Remove the quantization parameters of a previous "int8" output
+            for name in _QUANTIZATION_NAMES:
+                sidecar_path = get_sidecar_path(output_path, name)
+                if name not in data.files and os.path.exists(sidecar_path):
+                    os.remove(sidecar_path)
+    except OpenL3Error:
+        raise
+    except Exception:
+        raise OpenL3Error('Could not save sidecars of "{}":\n{}'.format(
+            output_path, traceback.format_exc()))
+    return sidecar_paths
+
+
+def _read_npy_header(f):
+    """Reads the header of a .npy file and returns (shape, fortran_order, dtype)"""
+    version = np.lib.format.read_magic(f)
+    if version == (1, 0):
+        return np.lib.format.read_array_header_1_0(f)
+    elif version == (2, 0):
+        return np.lib.format.read_array_header_2_0(f)
+    raise ValueError('Unsupported .npy format version {}'.format(version))
+
+
+def _memmap(path, shape, fortran_order, dtype, offset):
+    """Memory-maps an array stored at the given offset of a file"""
+    if dtype.hasobject:
+        raise ValueError('Cannot memory-map arrays of objects')
+    if int(np.prod(shape)) == 0:
+        # Empty arrays cannot be memory-mapped
+        return np.empty(shape, dtype=dtype)
+    return np.memmap(path, dtype=dtype, mode='r', shape=shape,
+                     order='F' if fortran_order else 'C', offset=offset)
+
+
+def _open_npz_array(npz_path, zip_file, f, name, mmap):
+    """
+    Opens an array of an .npz file. Arrays that are stored uncompressed are
+    memory-mapped from their offset in the zip file, and compressed arrays
+    are read into memory.
+    """
+    info = zip_file.getinfo(name + '.npy')
+    if mmap and info.compress_type == zipfile.ZIP_STORED:
+        f.seek(info.header_offset)
+        header = f.read(_ZIP_LOCAL_HEADER_SIZE)
+        if header[:4] != b'PK\x03\x04':
+            raise ValueError('Invalid zip local file header')
+        name_len, extra_len = struct.unpack('<HH', header[26:30])
+        f.seek(info.header_offset + _ZIP_LOCAL_HEADER_SIZE + name_len + extra_len)
+        shape, fortran_order, dtype = _read_npy_header(f)
+        return _memmap(npz_path, shape, fortran_order, dtype, f.tell())
+
+    with zip_file.open(info) as member:
+        return np.lib.format.read_array(member)
+
+
+def _open_npy_array(npy_path, mmap):
+    """Opens a .npy file, memory-mapped if `mmap` is True"""
+    if not mmap:
+        return np.load(npy_path)
+    with open(npy_path, 'rb') as f:
+        shape, fortran_order, dtype = _read_npy_header(f)
+        offset = f.tell()
+    return _memmap(npy_path, shape, fortran_order, dtype, offset)
+
+
+def _has_sidecars(output_path):
+    """Checks whether an output file has .npy sidecars that are up to date"""
+    sidecar_paths = [get_sidecar_path(output_path, name) for name in _ARRAY_NAMES]
+    if not all(os.path.isfile(path) for path in sidecar_paths):
+        return False
+    if not os.path.isfile(output_path):
+        return True
+    mtime = os.path.getmtime(output_path)
+    return all(os.path.getmtime(path) >= mtime for path in sidecar_paths)
+
+
+class EmbeddingFile(object):
+    """
+    Lazily opened output file. The embedding is memory-mapped when possible,
+    so that ranges of frames can be read without loading the whole
+    embedding into memory. Use `open_embedding` to open an output file.
+
+    Indexing an `EmbeddingFile` returns frames of the embedding as float32
+    (dequantized for "int8" outputs), e.g. ``f[100:200]``.
+
+    Attributes
+    ----------
+    path : str
+        Path to the output file.
+    embedding : np.ndarray [shape=(T, D)]
+        Embedding as stored in the file, i.e. a `np.memmap` if it could be
+        memory-mapped. "int8" embeddings are not dequantized.
+    timestamps : np.ndarray [shape=(T,)]
+        Timestamps of the embedding, loaded in memory.
+    output_format : "float32", "float16" or "int8"
+        Storage format of the embedding.
+    """
+    def __init__(self, path, embedding, timestamps, scale=None, offset=None):
+        if embedding.ndim != 2 or timestamps.shape != embedding.shape[:1]:
+            raise OpenL3Error('Invalid embedding and timestamps shapes {} and {} in "{}"'.format(
+                embedding.shape, timestamps.shape, path))
+        self.path = path
+        self.embedding = embedding
+        self.timestamps = np.asarray(timestamps)
+        self._scale = scale
+        self._offset = offset
+
+    @property
+    def output_format(self):
+        if self._scale is not None:
+            return "int8"
+        return str(self.embedding.dtype)
+
+    @property
+    def shape(self):
+        """Shape of the embedding"""
+        return self.embedding.shape
+
+    def __len__(self):
+        return self.embedding.shape[0]
+
+    def __getitem__(self, key):
+        embedding = np.asarray(self.embedding[key])
+        if self._scale is not None:
+            embedding = embedding * self._scale + self._offset
+        return embedding.astype(np.float32, copy=False)
+
+    def time_slice(self, start_time=None, end_time=None):
+        """
+        Returns the frames whose timestamps are in [start_time, end_time).
+        Only these frames are read from the file.
+
+        Parameters
+        ----------
+        start_time : float or None
+            Start time in seconds. If None, start at the first frame.
+        end_time : float or None
+            End time in seconds (excluded). If None, stop at the last frame.
+
+        Returns
+        -------
+        embedding : np.ndarray [shape=(T, D)]
+            Embedding of the frames, as float32.
+        timestamps : np.ndarray [shape=(T,)]
+            Timestamps of the frames.
+        """
+        start = 0 if start_time is None else \
+            int(np.searchsorted(self.timestamps, start_time, side='left'))
+        stop = len(self) if end_time is None else \
+            int(np.searchsorted(self.timestamps, end_time, side='left'))
+        stop = max(start, stop)
+        return self[start:stop], self.timestamps[start:stop]
+
+    def close(self):
+        """Releases the memory-mapped embedding"""
+        self.embedding = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+def open_embedding(output_path, mmap=True):
+    """
+    Opens an output file saved by `process_file` lazily. If the file has
+    up-to-date .npy sidecars (see `save_sidecars`), they are used instead.
+    The embedding is memory-mapped if `mmap` is True and it is stored
+    uncompressed, i.e. unless the output was saved with `compress=True`
+    and has no sidecars.
+
+    Parameters
+    ----------
+    output_path : str
+        Path to output file (.npz).
+    mmap : boolean
+        If True, memory-map the embedding. Otherwise it is loaded into
+        memory.
+
+    Returns
+    -------
+    embedding_file : EmbeddingFile
+        Opened output file.
+    """
+    try:
+        if _has_sidecars(output_path):
+            arrays = {}
+            for name in _ARRAY_NAMES:
+                arrays[name] = _open_npy_array(get_sidecar_path(output_path, name),
+                                               mmap and name == 'embedding')
+            if arrays['embedding'].dtype == np.int8:
+                for name in _QUANTIZATION_NAMES:
+                    arrays[name] = _open_npy_array(get_sidecar_path(output_path, name), False)
+        else:
+            with open(output_path, 'rb') as f:
+                with zipfile.ZipFile(f) as zip_file:
+                    names = [name[:-4] for name in zip_file.namelist()]
+                    arrays = dict((name, _open_npz_array(output_path, zip_file, f, name,
+                                                         mmap and name == 'embedding'))
+                                  for name in _ARRAY_NAMES + _QUANTIZATION_NAMES
+                                  if name in names)
+        embedding = arrays['embedding']
+        timestamps = arrays['timestamps']
+    except Exception:
+        raise OpenL3Error('Could not open file "{}":\n{}'.format(output_path, traceback.format_exc()))
+
+    return EmbeddingFile(output_path, embedding, timestamps,
+                         scale=arrays.get('embedding_scale'),
+                         offset=arrays.get('embedding_offset'))
@@ -0,0 +1,681 @@
+from __future__ import print_function
+import io
+import os
+import json
+import threading
+import time
+import traceback
+import numpy as np
+from numbers import Real
+import soundfile as sf
+from six import string_types, integer_types
+from six.moves import queue
+from six.moves.BaseHTTPServer import HTTPServer, BaseHTTPRequestHandler
+from six.moves.socketserver import ThreadingMixIn, UnixStreamServer
+from six.moves.urllib.parse import urlparse, parse_qs
+from .core import (
+    TARGET_SR, _validate_embedding_args, _preprocess_audio, _get_audio_frames, _iter_frame_batches,
+    _predict_batches
+)
+from .models import load_embedding_model
+from .version import version
+from .openl3_exceptions import OpenL3Error
+
+
+# Maximum number of windows per inference call
+DEFAULT_MAX_BATCH_SIZE = 64
+
+# Maximum time in seconds that a request waits for other requests to share its batch
+DEFAULT_MAX_WAIT = 0.005
+
+# Maximum size of a request body in bytes
+DEFAULT_MAX_REQUEST_SIZE = 100 * 1024 ** 2
+
+# Maximum duration in seconds of the decoded audio of a request
+DEFAULT_MAX_DURATION = 600
+
+# Maximum number of windows of a request
+DEFAULT_MAX_FRAMES = 12000
+
+# Minimum hop size of a request in seconds, about one spectrogram hop
+# (242 samples at 48kHz). Smaller hops make a short clip expand into a very
+# large number of overlapping windows.
+MIN_HOP_SIZE = 0.005
+
+
+def _load_thread_safe_model(input_repr, content_type, embedding_size, frontend="kapre"):
+    """Loads a model that can be used from any thread (see `openl3.models.ThreadSafeModel`)"""
+    return load_embedding_model(input_repr, content_type, embedding_size, frontend=frontend,
+                                thread_safe=True)
+
+
+class _InferenceError(OpenL3Error):
+    """Error raised when a model could not be loaded or inference failed"""
+
+
+class _Request(object):
+    """Frames waiting to be embedded by a `MicroBatcher`"""
+    def __init__(self, frames, callback=None):
+        self.frames = frames
+        self.embedding = None
+        self.error = None
+        self.cancelled = False
+        self._callback = callback
+        self._done = threading.Event()
+
+    def set_result(self, embedding=None, error=None):
+        self.embedding = embedding
+        self.error = error
+        self._done.set()
+        if self._callback is not None:
+            self._callback(self)
+
+    def cancel(self):
+        """Skips the request if its batch has not been run yet"""
+        self.cancelled = True
+
+    def result(self):
+        """Returns the embedding once the request is done"""
+        self._done.wait()
+        if self.error is not None:
+            raise _InferenceError(self.error)
+        return self.embedding
+
+
+class MicroBatcher(object):
+    """
+    Runs inference for concurrent requests in shared batches. Requests are
+    queued, and a single inference thread collects the requests that arrive
+    within `max_wait` seconds of the first one (or until their windows fill
+    whole batches), packs their windows into batches of at most
+    `max_batch_size` windows and splits the results back per request.
+
+    The model is loaded by calling `load_model` in the inference thread, so
+    that it is constructed and used in the same thread.
+
+    Parameters
+    ----------
+    load_model : callable
+        Function that returns the model.
+    max_batch_size : int
+        Maximum number of windows per inference call.
+    max_wait : float
+        Maximum time in seconds that a request waits for other requests.
+    """
+    def __init__(self, load_model, max_batch_size=DEFAULT_MAX_BATCH_SIZE,
+                 max_wait=DEFAULT_MAX_WAIT):
+        if not isinstance(max_batch_size, int) or isinstance(max_batch_size, bool) \
+                or max_batch_size < 1:
+            raise OpenL3Error('Invalid maximum batch size {}'.format(max_batch_size))
+        if max_wait < 0:
+            raise OpenL3Error('Invalid maximum wait time {}'.format(max_wait))
+
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait
+        self.n_requests = 0
+        self.n_batches = 0
+        self._load_model = load_model
+        self._load_error = None
+        self._ready = threading.Event()
+        self._queue = queue.Queue()
+        self._closed = False
+        self._thread = threading.Thread(target=self._run)
+        self._thread.daemon = True
+        self._thread.start()
+
+    def wait_ready(self):
+        """Waits until the model is loaded, and raises an error if it could not be"""
+        self._ready.wait()
+        if self._load_error is not None:
+            raise OpenL3Error(self._load_error)
+
+    def embed(self, frames):
+        """
+        Computes the embedding of audio windows, in a batch shared with
+        concurrent requests.
+
+        Parameters
+        ----------
+        frames : np.ndarray [shape=(T, 1, N)]
+            Audio windows, see `openl3.core._get_audio_frames`.
+
+        Returns
+        -------
+        embedding : np.ndarray [shape=(T, D)]
+            Embedding of each window.
+        """
+        return self.submit(frames).result()
+
+    def submit(self, frames, callback=None):
+        """
+        Queues audio windows without waiting for their embedding.
+
+        Parameters
+        ----------
+        frames : np.ndarray [shape=(T, 1, N)]
+            Audio windows, see `openl3.core._get_audio_frames`.
+        callback : callable or None
+            Function called with the request in the inference thread once
+            it is done.
+
+        Returns
+        -------
+        request
+            Request whose ``result()`` method waits for and returns the
+            embedding, and whose ``cancel()`` method skips it if its batch
+            has not been run yet.
+        """
+        if self._closed:
+            raise OpenL3Error('Micro-batcher is closed')
+        request = _Request(frames, callback)
+        self._queue.put(request)
+        return request
+
+    def _collect(self):
+        """Returns the requests of the next batch, or None once closed"""
+        request = self._queue.get()
+        if request is None:
+            return None
+
+        requests = [request]
+        n_windows = request.frames.shape[0]
+        deadline = time.time() + self.max_wait
+        # Fill the last batch of the collected requests with the windows of other requests
+        while n_windows % self.max_batch_size:
+            timeout = deadline - time.time()
+            if timeout <= 0:
+                break
+            try:
+                request = self._queue.get(timeout=timeout)
+            except queue.Empty:
+                break
+            if request is None:
+                # Process the collected requests before stopping
+                self._queue.put(None)
+                break
+            requests.append(request)
+            n_windows += request.frames.shape[0]
+        return requests
+
+    def _run(self):
+        """Inference loop"""
+        try:
+            model = self._load_model()
+        except Exception:
+            self._load_error = 'Could not load model:\n{}'.format(traceback.format_exc())
+        self._ready.set()
+
+        while True:
+            requests = self._collect()
+            if requests is None:
+                break
+            requests = [request for request in requests if not request.cancelled]
+            if not requests:
+                continue
+            if self._load_error is not None:
+                for request in requests:
+                    request.set_result(error=self._load_error)
+                continue
+
+            try:
+                frames = [request.frames for request in requests]
+                n_frames = [x.shape[0] for x in frames]
+                embedding = _predict_batches(model,
+                                             _iter_frame_batches(frames, self.max_batch_size),
+                                             sum(n_frames), 0)
+                self.n_requests += len(requests)
+                self.n_batches += -(-sum(n_frames) // self.max_batch_size)
+                for request, request_embedding in zip(
+                        requests, np.split(embedding, np.cumsum(n_frames)[:-1])):
+                    request.set_result(request_embedding)
+            except Exception:
+                error = 'Inference failed:\n{}'.format(traceback.format_exc())
+                for request in requests:
+                    request.set_result(error=error)
+
+    def close(self):
+        """Stops the inference thread once the queued requests are processed"""
+        self._closed = True
+        self._queue.put(None)
+        self._thread.join()
+
+
+class EmbeddingServer(object):
+    """
+    Keeps embedding models resident and computes embeddings for concurrent
+    requests with one `MicroBatcher` per model. Use `make_http_server` or
+    `make_unix_server` to serve requests over HTTP, or `serve` to run a
+    server from the command line.
+
+    Parameters
+    ----------
+    max_batch_size : int
+        Maximum number of windows per inference call.
+    max_wait : float
+        Maximum time in seconds that a request waits for other requests to
+        share its inference batches.
+    allow_paths : boolean
+        If True, requests can give the path of an audio file to read on the
+        server instead of sending the audio. Any file readable by the server
+        process can then be read by clients, so this is disabled by default.
+    max_request_size : int
+        Maximum size of a request body in bytes. Larger requests are
+        rejected with status 413.
+    max_duration : float
+        Maximum duration in seconds of the audio of a request, checked
+        before the audio is decoded. Longer requests are rejected with
+        status 413.
+    max_frames : int
+        Maximum number of windows of a request, checked before the audio
+        is resampled and framed. Requests with more windows are rejected
+        with status 413.
+    input_repr, content_type, embedding_size, frontend
+        Default model characteristics of requests (see
+        `openl3.models.load_embedding_model`).
+    load_model : callable or None
+        Function called with (input_repr, content_type, embedding_size,
+        frontend) to load a model. By default, models are taken from the
+        model cache as `openl3.models.ThreadSafeModel` objects.
+    """
+    def __init__(self, max_batch_size=DEFAULT_MAX_BATCH_SIZE, max_wait=DEFAULT_MAX_WAIT,
+                 allow_paths=False, max_request_size=DEFAULT_MAX_REQUEST_SIZE,
+                 max_duration=DEFAULT_MAX_DURATION, max_frames=DEFAULT_MAX_FRAMES,
+                 input_repr="mel256", content_type="music", embedding_size=6144,
+                 frontend="kapre", load_model=None):
+        if not isinstance(max_request_size, integer_types) \
+                or isinstance(max_request_size, bool) or max_request_size < 1:
+            raise OpenL3Error('Invalid maximum request size {}'.format(max_request_size))
+        if not isinstance(max_duration, Real) or max_duration <= 0:
+            raise OpenL3Error('Invalid maximum duration {}'.format(max_duration))
+        if not isinstance(max_frames, integer_types) or isinstance(max_frames, bool) \
+                or max_frames < 1:
+            raise OpenL3Error('Invalid maximum number of windows {}'.format(max_frames))
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait
+        self.allow_paths = allow_paths
+        self.max_request_size = max_request_size
+        self.max_duration = max_duration
+        self.max_frames = max_frames
+        self.defaults = {'input_repr': input_repr, 'content_type': content_type,
+                         'embedding_size': embedding_size, 'frontend': frontend}
+        self._load_model = load_model or _load_thread_safe_model
+        self._batchers = {}
+        self._lock = threading.Lock()
+
+    def get_batcher(self, input_repr, content_type, embedding_size, frontend="kapre"):
+        """Returns the micro-batcher of the model with the given characteristics"""
+        key = (input_repr, content_type, embedding_size, frontend)
+        with self._lock:
+            if key not in self._batchers:
+                self._batchers[key] = MicroBatcher(lambda: self._load_model(*key),
+                                                   max_batch_size=self.max_batch_size,
+                                                   max_wait=self.max_wait)
+            return self._batchers[key]
+
+    def preload(self, configs):
+        """
+        Loads the models with the given characteristics.
+
+        Parameters
+        ----------
+        configs : iterable of (input_repr, content_type, embedding_size) or
+                  (input_repr, content_type, embedding_size, frontend) tuples
+            Characteristics of the models to load.
+        """
+        for config in configs:
+            self.get_batcher(*config).wait_ready()
+
+    @property
+    def models(self):
+        """Characteristics of the loaded models"""
+        with self._lock:
+            return list(self._batchers)
+
+    def get_embedding(self, audio, sr, input_repr=None, content_type=None,
+                      embedding_size=None, frontend=None, center=True, hop_size=0.1,
+                      resample_method="kaiser_best"):
+        """
+        Computes the embedding of audio data, in inference batches shared
+        with concurrent requests. The parameters are the same as for
+        `openl3.get_embedding`, and the model characteristics default to the
+        ones of the server.
+        """
+        config = self.get_config(input_repr, content_type, embedding_size, frontend,
+                                 center, hop_size, resample_method)
+        audio = _preprocess_audio(audio, sr, resample_method)
+        x = _get_audio_frames(audio, hop_size, center)
+        embedding = self.get_batcher(*config).embed(x)
+        ts = np.arange(embedding.shape[0]) * hop_size
+        return embedding, ts
+
+    def get_config(self, input_repr=None, content_type=None, embedding_size=None,
+                   frontend=None, center=True, hop_size=0.1, resample_method="kaiser_best"):
+        """
+        Checks the embedding arguments of a request, and returns the
+        (input_repr, content_type, embedding_size, frontend) characteristics
+        of its model, which default to the ones of the server.
+        """
+        config = dict(self.defaults)
+        config.update((name, value) for name, value in
+                      (('input_repr', input_repr), ('content_type', content_type),
+                       ('embedding_size', embedding_size), ('frontend', frontend))
+                      if value is not None)
+        _validate_embedding_args(None, config['input_repr'], config['content_type'],
+                                 config['embedding_size'], center, hop_size, 0,
+                                 resample_method, config['frontend'])
+        if isinstance(config['embedding_size'], (list, tuple)):
+            raise OpenL3Error('Requests are limited to a single embedding size')
+        return (config['input_repr'], config['content_type'], config['embedding_size'],
+                config['frontend'])
+
+    def make_http_server(self, host='127.0.0.1', port=8080, verbose=False):
+        """Returns an HTTP server bound to the given address (see `serve`)"""
+        server = _ThreadingHTTPServer((host, port), _RequestHandler)
+        server.embedding_server = self
+        server.verbose = verbose
+        return server
+
+    def make_unix_server(self, socket_path, verbose=False):
+        """Returns an HTTP server bound to a Unix socket (see `serve`)"""
+        if os.path.exists(socket_path):
+            os.remove(socket_path)
+        server = _ThreadingUnixHTTPServer(socket_path, _RequestHandler)
+        server.embedding_server = self
+        server.verbose = verbose
+        return server
+
+    def close(self):
+        """Stops the inference threads"""
+        with self._lock:
+            batchers = list(self._batchers.values())
+            self._batchers = {}
+        for batcher in batchers:
+            batcher.close()
+
+
+class _ThreadingHTTPServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+
+class _ThreadingUnixHTTPServer(ThreadingMixIn, UnixStreamServer):
+    daemon_threads = True
+
+
+_TRUE_VALUES = ('1', 'true', 'yes')
+_FALSE_VALUES = ('0', 'false', 'no')
+
+
+def _parse_bool(value):
+    if isinstance(value, bool):
+        return value
+    value = str(value).lower()
+    if value not in _TRUE_VALUES + _FALSE_VALUES:
+        raise OpenL3Error('Invalid boolean value "{}"'.format(value))
+    return value in _TRUE_VALUES
+
+
+# Parsers of the request parameters passed to `EmbeddingServer.get_embedding`
+_PARAM_PARSERS = {
+    'input_repr': str,
+    'content_type': str,
+    'embedding_size': int,
+    'frontend': str,
+    'center': _parse_bool,
+    'hop_size': float,
+    'resample_method': str,
+}
+
+# Parameters that are not passed to `EmbeddingServer.get_embedding`
+_REQUEST_PARAMS = ('path', 'format')
+
+
+def _parse_params(params):
+    """Returns the keyword arguments of `EmbeddingServer.get_embedding` for request parameters"""
+    kwargs = {}
+    for name, value in params.items():
+        if name in _REQUEST_PARAMS:
+            continue
+        if name not in _PARAM_PARSERS:
+            raise OpenL3Error('Unknown parameter "{}"'.format(name))
+        try:
+            kwargs[name] = _PARAM_PARSERS[name](value)
+        except (ValueError, TypeError):
+            raise OpenL3Error('Invalid value "{}" for parameter "{}"'.format(value, name))
+    return kwargs
+
+
+def _parse_json_params(data):
+    """
+    Returns the parameters of a JSON request body, which gives the "path" of
+    an audio file and optionally the other request parameters
+    """
+    if not isinstance(data, dict) or 'path' not in data:
+        raise OpenL3Error('JSON requests must give the "path" of an audio file')
+    params = {}
+    for name, value in data.items():
+        if name not in _PARAM_PARSERS and name not in _REQUEST_PARAMS:
+            raise OpenL3Error('Unknown parameter "{}"'.format(name))
+        if not isinstance(value, string_types + integer_types + (float, bool)) \
+                or (name == 'path' and not isinstance(value, string_types)):
+            raise OpenL3Error('Invalid value for parameter "{}"'.format(name))
+        params[name] = value
+    return params
+
+
+class _RequestTooLarge(OpenL3Error):
+    """Error raised when a request exceeds the limits of the server"""
+
+
+def _read_request_audio(source, max_duration):
+    """
+    Decodes the audio of a request from a file path or object, checking its
+    duration before decoding it, since compressed audio can decode to many
+    more samples than the size of the request suggests
+    """
+    try:
+        sound_file = sf.SoundFile(source)
+    except Exception as e:
+        raise OpenL3Error('Could not decode audio: {}'.format(e))
+    with sound_file:
+        if sound_file.frames > max_duration * sound_file.samplerate:
+            raise _RequestTooLarge('Audio longer than {} seconds'.format(max_duration))
+        try:
+            audio = sound_file.read()
+        except Exception as e:
+            raise OpenL3Error('Could not decode audio: {}'.format(e))
+    return audio, sound_file.samplerate
+
+
+def _get_n_frames(n_samples, sr, hop_size, center):
+    """
+    Returns the number of windows of audio with the given number of samples
+    at the given sampling rate, once resampled to 48kHz (see
+    `openl3.core._get_audio_frames`). The resampled length is rounded up.
+    """
+    audio_len = int(np.ceil(n_samples * TARGET_SR / float(sr)))
+    if center:
+        audio_len += TARGET_SR // 2
+    hop_len = int(hop_size * TARGET_SR)
+    return 1 + max(0, int(np.ceil((audio_len - TARGET_SR) / float(hop_len))))
+
+
+def _check_request_size(kwargs, n_samples, sr, max_frames):
+    """Checks the hop size and the number of windows of a request"""
+    hop_size = kwargs.get('hop_size', 0.1)
+    if hop_size < MIN_HOP_SIZE:
+        raise OpenL3Error('Hop size {} is smaller than the minimum of {} seconds'.format(
+            hop_size, MIN_HOP_SIZE))
+    n_frames = _get_n_frames(n_samples, sr, hop_size, kwargs.get('center', True))
+    if n_frames > max_frames:
+        raise _RequestTooLarge('Request of {} windows, more than the maximum of {}'.format(
+            n_frames, max_frames))
+
+
+class _RequestHandler(BaseHTTPRequestHandler):
+    """
+    HTTP request handler of the embedding server.
+
+    ``GET /health`` returns the loaded models. ``POST /embedding`` computes
+    the embedding of the audio file sent as the request body, or of the
+    audio file at the "path" of a JSON request body. Parameters are given in
+    the query string (or in the JSON body), and the response is an .npz file
+    with the "embedding" and "timestamps" arrays, or JSON if the "format"
+    parameter is "json".
+    """
+    server_version = 'openl3/{}'.format(version)
+    protocol_version = 'HTTP/1.1'
+
+    def address_string(self):
+        # Clients of Unix socket servers have no address
+        if isinstance(self.client_address, tuple):
+            return str(self.client_address[0])
+        return 'unix'
+
+    def log_message(self, format, *args):
+        if self.server.verbose:
+            BaseHTTPRequestHandler.log_message(self, format, *args)
+
+    def log_error(self, format, *args):
+        # Errors are logged even if requests are not
+        BaseHTTPRequestHandler.log_message(self, format, *args)
+
+    def _send(self, code, body, content_type, close=False):
+        self.send_response(code)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        if close:
+            # The rest of the request is not read
+            self.send_header('Connection', 'close')
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _send_json(self, code, data, close=False):
+        self._send(code, json.dumps(data).encode('utf-8'), 'application/json', close=close)
+
+    def do_GET(self):
+        if urlparse(self.path).path != '/health':
+            return self._send_json(404, {'error': 'Not found'})
+        models = [list(key) for key in self.server.embedding_server.models]
+        self._send_json(200, {'status': 'ok', 'version': version, 'models': models})
+
+    def do_POST(self):
+        url = urlparse(self.path)
+        embedding_server = self.server.embedding_server
+        try:
+            length = int(self.headers.get('Content-Length') or 0)
+        except ValueError:
+            length = -1
+        if length < 0:
+            return self._send_json(400, {'error': 'Invalid Content-Length'}, close=True)
+        if length > embedding_server.max_request_size:
+            return self._send_json(413, {'error': 'Request larger than {} bytes'.format(
+                embedding_server.max_request_size)}, close=True)
+        body = self.rfile.read(length)
+        if url.path != '/embedding':
+            return self._send_json(404, {'error': 'Not found'})
+
+        try:
+            params = dict((name, values[-1]) for name, values in parse_qs(url.query).items())
+            content_type = self.headers.get('Content-Type') or ''
+            if content_type.startswith('application/json'):
+                try:
+                    data = json.loads(body.decode('utf-8'))
+                except ValueError:
+                    raise OpenL3Error('Invalid JSON request')
+                data = _parse_json_params(data)
+                if not embedding_server.allow_paths:
+                    return self._send_json(403, {'error': 'Paths are not allowed'})
+                params.update(data)
+                kwargs = _parse_params(params)
+                audio, sr = _read_request_audio(params['path'], embedding_server.max_duration)
+            else:
+                kwargs = _parse_params(params)
+                audio, sr = _read_request_audio(io.BytesIO(body), embedding_server.max_duration)
+
+            _check_request_size(kwargs, audio.shape[0], sr, embedding_server.max_frames)
+            embedding, ts = embedding_server.get_embedding(audio, sr, **kwargs)
+        except _InferenceError as e:
+            self.log_error('%s', e)
+            return self._send_json(500, {'error': 'Inference failed'})
+        except _RequestTooLarge as e:
+            return self._send_json(413, {'error': str(e)})
+        except OpenL3Error as e:
+            return self._send_json(400, {'error': str(e)})
+        except Exception:
+            # The traceback is only logged on the server
+            self.log_error('Request failed:\n%s', traceback.format_exc())
+            return self._send_json(500, {'error': 'Internal server error'})
+
+        if params.get('format') == 'json':
+            self._send_json(200, {'embedding': embedding.tolist(), 'timestamps': ts.tolist()})
+        else:
+            buf = io.BytesIO()
+            np.savez(buf, embedding=embedding, timestamps=ts)
+            self._send(200, buf.getvalue(), 'application/octet-stream')
+
+
+def serve(host='127.0.0.1', port=8080, socket_path=None, max_batch_size=DEFAULT_MAX_BATCH_SIZE,
+          max_wait=DEFAULT_MAX_WAIT, preload=(), allow_paths=False,
+          max_request_size=DEFAULT_MAX_REQUEST_SIZE, max_duration=DEFAULT_MAX_DURATION,
+          max_frames=DEFAULT_MAX_FRAMES, input_repr="mel256",
+          content_type="music", embedding_size=6144, frontend="kapre", verbose=False):
+    """
+    Runs an embedding server until it is interrupted.
+
+    Parameters
+    ----------
+    host : str
+        Address of the HTTP server.
+    port : int
+        Port of the HTTP server.
+    socket_path : str or None
+        If given, serve over HTTP on this Unix socket instead of `host` and
+        `port`.
+    max_batch_size : int
+        Maximum number of windows per inference call.
+    max_wait : float
+        Maximum time in seconds that a request waits for other requests to
+        share its inference batches.
+    preload : iterable of tuples
+        Characteristics of the models to load on startup (see
+        `EmbeddingServer.preload`). Other models are loaded on first use.
+    allow_paths : boolean
+        If True, requests can give the path of an audio file to read on the
+        server.
+    max_request_size : int
+        Maximum size of a request body in bytes.
+    max_duration : float
+        Maximum duration in seconds of the audio of a request.
+    max_frames : int
+        Maximum number of windows of a request.
+    input_repr, content_type, embedding_size, frontend
+        Default model characteristics of requests.
+    verbose : boolean
+        If True, log requests.
+    """
+    embedding_server = EmbeddingServer(max_batch_size=max_batch_size, max_wait=max_wait,
+                                       allow_paths=allow_paths,
+                                       max_request_size=max_request_size,
+                                       max_duration=max_duration, max_frames=max_frames,
+                                       input_repr=input_repr,
+                                       content_type=content_type,
+                                       embedding_size=embedding_size, frontend=frontend)
+    embedding_server.preload(preload)
+
+    if socket_path:
+        server = embedding_server.make_unix_server(socket_path, verbose=verbose)
+        address = socket_path
+    else:
+        server = embedding_server.make_http_server(host, port, verbose=verbose)
+        address = 'http://{}:{}'.format(host, server.server_address[1])
+
+    print('openl3: Serving embeddings on {}'.format(address))
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        embedding_server.close()
+        if socket_path and os.path.exists(socket_path):
+            os.remove(socket_path)
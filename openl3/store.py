@@ -0,0 +1,325 @@
+import os
+import re
+import threading
+import warnings
+import numpy as np
+import h5py
+from .core import _encode_embedding
+from .utils import replace_file
+from .openl3_exceptions import OpenL3Error
+from .openl3_warnings import OpenL3Warning
+
+
+# Default maximum size of the embeddings of a shard, in bytes
+DEFAULT_SHARD_SIZE = 4 * 1024 ** 3
+
+# Target size of an HDF5 chunk of the embedding dataset, in bytes
+CHUNK_SIZE = 2 ** 20
+
+STORE_OUTPUT_FORMATS = ("float32", "float16", "int8")
+
+_SHARD_NAME_FORMAT = 'shard-{:05d}.h5'
+_SHARD_NAME_REGEX = re.compile(r'^shard-(\d{5})\.h5$')
+
+# Suffix of the shards that could not be opened when appending to a store
+_DISCARDED_SUFFIX = '.discarded'
+
+
+class EmbeddingStore(object):
+    """
+    Sharded HDF5 store of the embeddings of many files. The embeddings,
+    timestamps and source file ids of all files are appended to chunked
+    datasets of a few large shard files, and each shard has an index of the
+    files it contains with the offset and number of frames of each file.
+    The embedding of a file (or any range of its frames) can then be read
+    without opening one file per input file.
+
+    Each shard contains the datasets ``embedding`` (N, D), ``timestamps`` (N,)
+    and ``file_id`` (N,), and the index datasets ``index/path``,
+    ``index/start`` and ``index/length``. For the "int8" format, the
+    per-file, per-dimension quantization parameters are stored in
+    ``index/scale`` and ``index/offset``.
+
+    Parameters
+    ----------
+    path : str
+        Path to the store directory.
+    mode : "r" or "a"
+        "r" opens an existing store for reading, "a" opens a store for
+        reading and appending, and creates it if it does not exist.
+    output_format : "float32", "float16" or "int8"
+        Storage format of new shards (see `openl3.process_file`).
+    compression : str or None
+        HDF5 compression filter of new shards, e.g. "gzip" or "lzf".
+    shard_size : int
+        Maximum size of the embeddings of a shard in bytes. A new shard is
+        started when the current shard reaches this size. The embedding of
+        a file is never split across shards, and existing shards are never
+        modified, so each session that appends to the store starts a new
+        shard.
+
+    Notes
+    -----
+    A file is only added to the index of a shard once its embedding has
+    been written and flushed, and shards are closed and synced to disk once
+    they are full or the store is closed. HDF5 files can however be left
+    unreadable if the process is killed while writing to them, so after a
+    crash the shard that was being written may be lost. When the store is
+    opened for appending, such a shard is renamed with a ".discarded"
+    suffix (with a warning), and the files it contained are no longer in
+    the store, so they are computed again when a run is resumed.
+    """
+    def __init__(self, path, mode='r', output_format="float32", compression=None,
+                 shard_size=DEFAULT_SHARD_SIZE):
+        if mode not in ('r', 'a'):
+            raise OpenL3Error('Invalid store mode "{}"'.format(mode))
+        if output_format not in STORE_OUTPUT_FORMATS:
+            raise OpenL3Error('Invalid output format "{}"'.format(output_format))
+
+        self.path = path
+        self.mode = mode
+        self.output_format = output_format
+        self.compression = compression
+        self.shard_size = shard_size
+        self._lock = threading.RLock()
+        self._shards = []
+        self._index = {}
+        self._writer = None
+        self._next_shard_id = 0
+
+        if mode == 'a' and not os.path.isdir(path):
+            os.makedirs(path)
+        elif not os.path.isdir(path):
+            raise OpenL3Error('Could not find embedding store "{}"'.format(path))
+
+        shard_ids = sorted(int(m.group(1)) for m in
+                           (_SHARD_NAME_REGEX.match(name) for name in os.listdir(path))
+                           if m)
+        for shard_id in shard_ids:
+            self._next_shard_id = shard_id + 1
+            try:
+                self._open_shard(shard_id, 'r')
+            except OpenL3Error:
+                if mode != 'a':
+                    raise
+                self._discard_shard(shard_id)
+
+    def _get_shard_path(self, shard_id):
+        return os.path.join(self.path, _SHARD_NAME_FORMAT.format(shard_id))
+
+    def _open_shard(self, shard_id, mode):
+        """Opens a shard and adds the files it contains to the index"""
+        shard_path = self._get_shard_path(shard_id)
+        shard = None
+        try:
+            shard = h5py.File(shard_path, mode)
+            paths = shard['index/path'][:] if 'index' in shard else []
+        except Exception:
+            if shard is not None:
+                shard.close()
+            raise OpenL3Error('Could not open shard "{}"'.format(shard_path))
+
+        shard_idx = len(self._shards)
+        self._shards.append(shard)
+        for file_id, filepath in enumerate(paths):
+            if isinstance(filepath, bytes):
+                filepath = filepath.decode('utf-8')
+            self._index[filepath] = (shard_idx, file_id)
+        return shard
+
+    def _discard_shard(self, shard_id):
+        """Renames a shard that cannot be read, e.g. after a crash while it was written"""
+        shard_path = self._get_shard_path(shard_id)
+        replace_file(shard_path, shard_path + _DISCARDED_SUFFIX)
+        warnings.warn('Could not open shard "{}", which was renamed to "{}". The files it '
+                      'contained are no longer in the store.'.format(
+                          shard_path, shard_path + _DISCARDED_SUFFIX), OpenL3Warning)
+
+    def _close_writer(self):
+        """
+        Closes the shard being written and syncs it to disk, so that it is
+        not affected by a later crash, and reopens it for reading
+        """
+        writer = self._writer
+        self._writer = None
+        shard_idx = self._shards.index(writer)
+        shard_path = writer.filename
+        writer.close()
+        with open(shard_path, 'rb+') as f:
+            os.fsync(f.fileno())
+        self._shards[shard_idx] = h5py.File(shard_path, 'r')
+
+    def _create_shard(self, n_dims):
+        """Creates a new shard for appending embeddings of the given dimensionality"""
+        shard = self._open_shard(self._next_shard_id, 'w-')
+        self._next_shard_id += 1
+
+        dtype = np.dtype('int8' if self.output_format == "int8" else self.output_format)
+        chunk_rows = max(1, CHUNK_SIZE // (n_dims * dtype.itemsize))
+        kwargs = {'compression': self.compression} if self.compression else {}
+        shard.create_dataset('embedding', shape=(0, n_dims), maxshape=(None, n_dims),
+                             dtype=dtype, chunks=(chunk_rows, n_dims), **kwargs)
+        shard.create_dataset('timestamps', shape=(0,), maxshape=(None,), dtype='float64',
+                             chunks=(chunk_rows,), **kwargs)
+        shard.create_dataset('file_id', shape=(0,), maxshape=(None,), dtype='int32',
+                             chunks=(chunk_rows,), **kwargs)
+        shard.create_dataset('index/path', shape=(0,), maxshape=(None,),
+                             dtype=h5py.special_dtype(vlen=str), chunks=(1024,))
+        shard.create_dataset('index/start', shape=(0,), maxshape=(None,), dtype='int64',
+                             chunks=(1024,))
+        shard.create_dataset('index/length', shape=(0,), maxshape=(None,), dtype='int64',
+                             chunks=(1024,))
+        if self.output_format == "int8":
+            for name in ('index/scale', 'index/offset'):
+                shard.create_dataset(name, shape=(0, n_dims), maxshape=(None, n_dims),
+                                     dtype='float32', chunks=(16, n_dims))
+        shard.attrs['output_format'] = self.output_format
+        return shard
+
+    def _get_writer(self, n_dims, n_frames):
+        """
+        Returns the shard to which an embedding of the given size is appended.
+        Existing shards are read-only, so the first append of a session
+        creates a new shard, which is always the last one.
+        """
+        writer = self._writer
+        if writer is not None:
+            embedding = writer['embedding']
+            size = (embedding.shape[0] + n_frames) * n_dims * embedding.dtype.itemsize
+            if embedding.shape[1] != n_dims or \
+                    (embedding.shape[0] > 0 and size > self.shard_size):
+                self._close_writer()
+                writer = None
+        if writer is None:
+            writer = self._writer = self._create_shard(n_dims)
+        return writer
+
+    def append(self, filepath, embedding, timestamps):
+        """
+        Appends the embedding and timestamps of a file to the store.
+
+        Parameters
+        ----------
+        filepath : str
+            Path to the audio file, which identifies the embedding in the
+            store.
+        embedding : np.ndarray [shape=(T, D)]
+            Embedding of the file.
+        timestamps : np.ndarray [shape=(T,)]
+            Timestamps of the embedding.
+        """
+        if self.mode != 'a':
+            raise OpenL3Error('Embedding store "{}" is read-only'.format(self.path))
+        if embedding.ndim != 2 or timestamps.shape != embedding.shape[:1]:
+            raise OpenL3Error('Invalid embedding and timestamps shapes {} and {}'.format(
+                embedding.shape, timestamps.shape))
+
+        arrays = _encode_embedding(embedding, self.output_format)
+
+        with self._lock:
+            if filepath in self._index:
+                raise OpenL3Error('File "{}" is already in the store'.format(filepath))
+
+            n_frames, n_dims = embedding.shape
+            shard = self._get_writer(n_dims, n_frames)
+            start = shard['embedding'].shape[0]
+            file_id = shard['index/path'].shape[0]
+
+            for name, values in (('embedding', arrays['embedding']),
+                                 ('timestamps', timestamps),
+                                 ('file_id', np.full(n_frames, file_id, dtype=np.int32))):
+                dataset = shard[name]
+                dataset.resize(start + n_frames, axis=0)
+                dataset[start:] = values
+
+            index = [('index/path', filepath), ('index/start', start),
+                     ('index/length', n_frames)]
+            if self.output_format == "int8":
+                index += [('index/scale', arrays['embedding_scale']),
+                          ('index/offset', arrays['embedding_offset'])]
+            # The path is written last, so that a file is only indexed once
+            # its embedding has been written
+            for name, value in index[::-1]:
+                dataset = shard[name]
+                dataset.resize(file_id + 1, axis=0)
+                dataset[file_id] = value
+            shard.flush()
+
+            self._index[filepath] = (len(self._shards) - 1, file_id)
+
+    def __contains__(self, filepath):
+        return filepath in self._index
+
+    def __len__(self):
+        return len(self._index)
+
+    @property
+    def files(self):
+        """List of the files in the store"""
+        return list(self._index)
+
+    def get_length(self, filepath):
+        """Returns the number of frames of the embedding of a file"""
+        shard_idx, file_id = self._lookup(filepath)
+        return int(self._shards[shard_idx]['index/length'][file_id])
+
+    def get(self, filepath, start=None, stop=None):
+        """
+        Reads the embedding and timestamps of a file, or of a range of its
+        frames. Only the requested frames are read.
+
+        Parameters
+        ----------
+        filepath : str
+            Path to the audio file.
+        start : int or None
+            Index of the first frame. If None, start at the first frame.
+        stop : int or None
+            Index after the last frame. If None, stop at the last frame.
+
+        Returns
+        -------
+        embedding : np.ndarray [shape=(T, D)]
+            Embedding, as float32.
+        timestamps : np.ndarray [shape=(T,)]
+            Timestamps of the embedding.
+        """
+        shard_idx, file_id = self._lookup(filepath)
+        shard = self._shards[shard_idx]
+        with self._lock:
+            file_start = int(shard['index/start'][file_id])
+            length = int(shard['index/length'][file_id])
+            start, stop, _ = slice(start, stop).indices(length)
+            stop = max(start, stop)
+
+            embedding = shard['embedding'][file_start + start:file_start + stop]
+            timestamps = shard['timestamps'][file_start + start:file_start + stop]
+            if shard.attrs['output_format'] == "int8":
+                embedding = embedding * shard['index/scale'][file_id] \
+                    + shard['index/offset'][file_id]
+
+        return embedding.astype(np.float32, copy=False), timestamps
+
+    def _lookup(self, filepath):
+        """Returns the shard and file id of a file"""
+        try:
+            return self._index[filepath]
+        except KeyError:
+            raise OpenL3Error('File "{}" is not in the store'.format(filepath))
+
+    def close(self):
+        """Closes all shards"""
+        with self._lock:
+            if self._writer is not None:
+                self._close_writer()
+            for shard in self._shards:
+                shard.close()
+            self._shards = []
+            self._index = {}
+            self._writer = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
@@ -0,0 +1,254 @@
+import os
+import json
+import time
+import socket
+import threading
+import numpy as np
+from numbers import Real
+from .cache import get_model_id
+from .utils import write_atomic
+from .models import get_spectrogram_input_repr
+from .frontend import compute_model_input
+from .openl3_exceptions import OpenL3Error
+
+
+# Default memory budget of an inference batch, in bytes
+DEFAULT_MEMORY_BUDGET = 1024 ** 3
+
+# Batch sizes measured by the tuner, in increasing order
+DEFAULT_BATCH_SIZES = (8, 16, 32, 64, 128, 256)
+
+# A batch size is chosen if its throughput is within this fraction of the
+# best one, so that smaller batches (less memory, lower latency) are
+# preferred when larger ones are not significantly faster
+THROUGHPUT_TOLERANCE = 0.05
+
+# Number of samples of a model input window
+WINDOW_LEN = 48000
+
+_TUNING_INFO = {'memory_budget': DEFAULT_MEMORY_BUDGET}
+
+# Batch sizes chosen in this process, keyed by (model_id, memory_budget, batch_sizes)
+_BATCH_SIZES = {}
+_TUNING_LOCK = threading.Lock()
+
+_timer = getattr(time, 'perf_counter', time.time)
+
+
+def get_tuning_cache_path():
+    """
+    Returns the path of the file in which the throughputs measured by the
+    tuner are kept. It is given by the ``OPENL3_TUNING_CACHE`` environment
+    variable, and defaults to ``openl3/batch_sizes.json`` in the user's cache
+    directory (``$XDG_CACHE_HOME`` or ``~/.cache``).
+
+    Returns
+    -------
+    path : str
+        Path of the tuning cache file.
+    """
+    path = os.environ.get('OPENL3_TUNING_CACHE')
+    if path:
+        return path
+    cache_home = os.environ.get('XDG_CACHE_HOME') or os.path.join(os.path.expanduser('~'),
+                                                                 '.cache')
+    return os.path.join(cache_home, 'openl3', 'batch_sizes.json')
+
+
+def set_memory_budget(memory_budget):
+    """
+    Sets the memory budget of an inference batch used to choose batch sizes
+    automatically (``batch_size="auto"``).
+
+    Parameters
+    ----------
+    memory_budget : int
+        Maximum memory used by an inference batch, in bytes.
+    """
+    _validate_memory_budget(memory_budget)
+    with _TUNING_LOCK:
+        _TUNING_INFO['memory_budget'] = int(memory_budget)
+
+
+def get_memory_budget():
+    """Returns the memory budget of an inference batch in bytes (see `set_memory_budget`)"""
+    return _TUNING_INFO['memory_budget']
+
+
+def _validate_memory_budget(memory_budget):
+    if not isinstance(memory_budget, Real) or isinstance(memory_budget, bool) \
+            or memory_budget <= 0:
+        raise OpenL3Error('Invalid memory budget {}'.format(memory_budget))
+
+
+def estimate_window_memory(model):
+    """
+    Estimates the memory used by inference per window: the audio window and
+    the two largest activations of the network (the input and output of the
+    most expensive layer), in float32.
+
+    Parameters
+    ----------
+    model : keras.models.Model or openl3.models.ThreadSafeModel
+        Model object.
+
+    Returns
+    -------
+    n_bytes : int
+        Estimated memory per window in bytes.
+    """
+    sizes = []
+    for layer in getattr(model, 'layers', []):
+        shapes = layer.output_shape
+        if not isinstance(shapes, list):
+            shapes = [shapes]
+        for shape in shapes:
+            sizes.append(int(np.prod([dim for dim in shape[1:] if dim is not None])))
+    return 4 * (WINDOW_LEN + sum(sorted(sizes)[-2:]))
+
+
+def _measure_throughput(model, batch_size, repeat):
+    """Returns the best throughput of a model in windows per second"""
+    rng = np.random.RandomState(0)
+    batch = rng.uniform(-1, 1, (batch_size, 1, WINDOW_LEN)).astype(np.float32)
+    input_repr = get_spectrogram_input_repr(model)
+
+    def predict():
+        model_input = batch
+        if input_repr is not None:
+            model_input = compute_model_input(batch[:, 0, :], input_repr)
+        model.predict_on_batch(model_input)
+
+    # Warm up, e.g. for the allocation of the buffers of a new batch size
+    predict()
+    best = None
+    for _ in range(repeat):
+        start = _timer()
+        predict()
+        elapsed = _timer() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return batch_size / max(best, 1e-9)
+
+
+def _read_tuning_cache(path):
+    """Reads the tuning cache, ignoring a missing or corrupted file"""
+    try:
+        with open(path) as f:
+            cache = json.load(f)
+    except (IOError, OSError, ValueError):
+        return {}
+    return cache if isinstance(cache, dict) else {}
+
+
+def _write_tuning_cache(path, host, model_id, throughputs):
+    """Merges the throughputs measured for a model into the tuning cache"""
+    directory = os.path.dirname(path)
+    if directory and not os.path.isdir(directory):
+        os.makedirs(directory)
+
+    cache = _read_tuning_cache(path)
+    model_throughputs = cache.setdefault(host, {}).setdefault(model_id, {})
+    model_throughputs.update((str(batch_size), throughput)
+                             for batch_size, throughput in throughputs.items())
+    write_atomic(path, lambda f: f.write(json.dumps(cache, indent=2,
+                                                     sort_keys=True).encode('utf-8')))
+
+
+def _choose_batch_size(throughputs):
+    """Returns the smallest batch size within the tolerance of the best throughput"""
+    best = max(throughputs.values())
+    return min(batch_size for batch_size, throughput in throughputs.items()
+               if throughput >= (1 - THROUGHPUT_TOLERANCE) * best)
+
+
+def get_batch_size(model, memory_budget=None, batch_sizes=DEFAULT_BATCH_SIZES,
+                   cache_path=None, repeat=2):
+    """
+    Returns the inference batch size with the best throughput for a model
+    among the batch sizes that fit in a memory budget (see
+    `estimate_window_memory`). On first use on a host, the throughput of the
+    candidate batch sizes is measured, in increasing order until it stops
+    improving, and kept in a cache file per (host, model), so later calls and
+    processes reuse the measurements. Optimized and XLA-compiled models have
+    their own model id (see `openl3.cache.get_model_name`), so they are
+    measured separately.
+
+    Parameters
+    ----------
+    model : keras.models.Model or openl3.models.ThreadSafeModel
+        Model object.
+    memory_budget : int or None
+        Maximum memory used by an inference batch, in bytes. If None, the
+        budget set with `set_memory_budget` is used.
+    batch_sizes : iterable of int
+        Candidate batch sizes.
+    cache_path : str or None
+        Path of the tuning cache file. If None, `get_tuning_cache_path` is
+        used.
+    repeat : int
+        Number of timed inference calls per batch size; the fastest is used.
+
+    Returns
+    -------
+    batch_size : int
+        Chosen batch size. If not even the smallest candidate fits in the
+        budget, the smallest candidate is returned.
+    """
+    if memory_budget is None:
+        memory_budget = get_memory_budget()
+    _validate_memory_budget(memory_budget)
+    batch_sizes = sorted(set(batch_sizes))
+    if not batch_sizes or any(not isinstance(batch_size, int) or isinstance(batch_size, bool)
+                              or batch_size < 1 for batch_size in batch_sizes):
+        raise OpenL3Error('Invalid batch sizes {}'.format(batch_sizes))
+
+    model_id = get_model_id(model)
+    key = (model_id, int(memory_budget), tuple(batch_sizes))
+    with _TUNING_LOCK:
+        if key in _BATCH_SIZES:
+            return _BATCH_SIZES[key]
+
+    max_batch_size = memory_budget // estimate_window_memory(model)
+    candidates = [batch_size for batch_size in batch_sizes
+                  if batch_size <= max_batch_size] or batch_sizes[:1]
+
+    if cache_path is None:
+        cache_path = get_tuning_cache_path()
+    host = socket.gethostname()
+    with _TUNING_LOCK:
+        cached = _read_tuning_cache(cache_path).get(host, {}).get(model_id, {})
+    throughputs = dict((batch_size, cached[str(batch_size)]) for batch_size in candidates
+                       if str(batch_size) in cached)
+
+    # The measurements run without the lock, so that other models can be
+    # tuned concurrently
+    measured = {}
+    best = 0
+    for batch_size in candidates:
+        if batch_size not in throughputs:
+            throughputs[batch_size] = measured[batch_size] = \
+                _measure_throughput(model, batch_size, repeat)
+        # Larger batches are unlikely to help once the throughput drops
+        if throughputs[batch_size] < (1 - THROUGHPUT_TOLERANCE) * best:
+            break
+        best = max(best, throughputs[batch_size])
+
+    batch_size = _choose_batch_size(throughputs)
+    with _TUNING_LOCK:
+        if measured:
+            try:
+                _write_tuning_cache(cache_path, host, model_id, measured)
+            except (IOError, OSError):
+                # The measurements are still used in this process
+                pass
+        _BATCH_SIZES[key] = batch_size
+    return batch_size
+
+
+def clear_batch_sizes():
+    """
+    Forgets the batch sizes chosen in this process, so that they are chosen
+    again from the tuning cache file. The file itself is not modified.
+    """
+    with _TUNING_LOCK:
+        _BATCH_SIZES.clear()
@@ -0,0 +1,30 @@
+import os
+import uuid
+
+
+def replace_file(src, dst):
+    """
+    Renames `src` to `dst`, replacing `dst` if it exists. On Windows,
+    `os.rename` fails if `dst` exists, so `os.replace` is used where it is
+    available (Python 3.3+).
+    """
+    if hasattr(os, 'replace'):
+        os.replace(src, dst)
+    else:
+        os.rename(src, dst)
+
+
+def write_atomic(path, write):
+    """
+    Calls `write` with a temporary file next to `path`, and moves the
+    temporary file to `path` once it is complete, so that `path` is never
+    left partially written
+    """
+    tmp_path = '{}.{}.tmp'.format(path, uuid.uuid4().hex)
+    try:
+        with open(tmp_path, 'wb') as f:
+            write(f)
+        replace_file(tmp_path, path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
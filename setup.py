@@ -86,6 +86,7 @@ setup(
         'PySoundFile>=0.9.0.post1',
         'resampy>=0.2.1,<0.3.0',
         'h5py>=2.7.0,<3.0.0',
+        'scandir>=1.5; python_version < "3.5"',
     ],
     extras_require={
         'docs': [
@@ -94,7 +95,8 @@ setup(
                 'sphinx_rtd_theme',
                 'numpydoc',
             ],
-        'tests': []
+        'tests': ['scikit-learn>=0.19'],
+        'pca': ['scikit-learn>=0.19'],
     },
     package_data={
         'openl3': weight_files
@@ -0,0 +1,62 @@
+import pytest
+import numpy as np
+from openl3.aggregate import (
+    AGGREGATE_METHODS, EmbeddingAggregator, get_segment_length, validate_aggregate_args
+)
+from openl3.openl3_exceptions import OpenL3Error
+
+
+def _aggregate(embedding, method):
+    if method == "mean":
+        return embedding.mean(axis=0, dtype=np.float64)
+    elif method == "max":
+        return embedding.max(axis=0)
+    elif method == "std":
+        return embedding.std(axis=0, dtype=np.float64)
+    return np.concatenate([embedding.mean(axis=0, dtype=np.float64),
+                           embedding.std(axis=0, dtype=np.float64)])
+
+
+def test_get_segment_length():
+    assert get_segment_length(None, 0.1) is None
+    assert get_segment_length(1, 0.1) == 10
+    assert get_segment_length(0.32, 0.1) == 3
+    assert get_segment_length(0.01, 0.1) == 1
+    pytest.raises(OpenL3Error, get_segment_length, 0, 0.1)
+    pytest.raises(OpenL3Error, get_segment_length, -1, 0.1)
+    pytest.raises(OpenL3Error, get_segment_length, '1', 0.1)
+
+
+def test_validate_aggregate_args():
+    validate_aggregate_args(None, None, 0.1)
+    validate_aggregate_args("mean", 1.0, 0.1)
+    pytest.raises(OpenL3Error, validate_aggregate_args, None, 1.0, 0.1)
+    pytest.raises(OpenL3Error, validate_aggregate_args, "median", None, 0.1)
+    pytest.raises(OpenL3Error, validate_aggregate_args, "mean", 0, 0.1)
+
+
+def test_embedding_aggregator():
+    rng = np.random.RandomState(0)
+    embedding = (rng.randn(1003, 16) * 3 + 1).astype(np.float32)
+
+    for method in AGGREGATE_METHODS:
+        for segment_duration, segment_length in ((None, 1003), (1.0, 10), (0.32, 3)):
+            aggregator = EmbeddingAggregator(method, 0.1, segment_duration)
+            # Make sure the result does not depend on how the frames are batched
+            idx = 0
+            while idx < embedding.shape[0]:
+                batch_size = rng.randint(1, 50)
+                aggregator.update(embedding[idx:idx + batch_size])
+                idx += batch_size
+            embedding_out, ts = aggregator.finalize()
+
+            expected = np.stack([_aggregate(embedding[i:i + segment_length], method)
+                                 for i in range(0, embedding.shape[0], segment_length)])
+            assert embedding_out.dtype == np.float32
+            assert embedding_out.shape == expected.shape
+            assert np.allclose(embedding_out, expected, rtol=1e-5, atol=1e-5)
+            assert np.allclose(ts, np.arange(expected.shape[0]) * segment_length * 0.1
+                               if segment_duration is not None else [0])
+
+    pytest.raises(OpenL3Error, EmbeddingAggregator("mean", 0.1).finalize)
+    pytest.raises(OpenL3Error, EmbeddingAggregator, "median", 0.1)
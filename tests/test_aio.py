@@ -0,0 +1,138 @@
+import pytest
+import os
+import threading
+import warnings
+import numpy as np
+import soundfile as sf
+import openl3
+from openl3.openl3_exceptions import OpenL3Error
+
+asyncio = pytest.importorskip('asyncio')
+from openl3.aio import AsyncEmbedder, aget_embedding  # noqa: E402
+
+
+TEST_DIR = os.path.dirname(__file__)
+TEST_AUDIO_DIR = os.path.join(TEST_DIR, 'data', 'audio')
+CHIRP_1S_PATH = os.path.join(TEST_AUDIO_DIR, 'chirp_1s.wav')
+
+
+class _AudioModel(object):
+    """Model taking audio windows as input, whose inference waits for an event"""
+    input_shape = (None, 1, 48000)
+
+    def __init__(self):
+        self.batch_sizes = []
+        self.event = threading.Event()
+        self.event.set()
+
+    def predict_on_batch(self, batch):
+        self.event.wait()
+        self.batch_sizes.append(batch.shape[0])
+        return batch[:, 0, ::6000]
+
+
+def _run(loop, coro):
+    return loop.run_until_complete(coro)
+
+
+def test_aget_embedding():
+    audio, sr = sf.read(CHIRP_1S_PATH)
+    expected, expected_ts = openl3.get_embedding(audio, sr, input_repr='linear',
+                                                 embedding_size=512, hop_size=0.5,
+                                                 verbose=False)
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+    try:
+        results = _run(loop, asyncio.gather(
+            aget_embedding(audio, sr, input_repr='linear', embedding_size=512, hop_size=0.5),
+            aget_embedding(CHIRP_1S_PATH, input_repr='linear', embedding_size=512,
+                           hop_size=0.5)))
+    finally:
+        asyncio.set_event_loop(None)
+        loop.close()
+
+    for embedding, ts in results:
+        assert np.allclose(embedding, expected, atol=1e-5)
+        assert np.allclose(ts, expected_ts)
+
+
+def test_async_embedder():
+    audio, sr = sf.read(CHIRP_1S_PATH)
+    model = _AudioModel()
+    embedder = AsyncEmbedder(max_batch_size=8, max_wait=0.05, load_model=lambda *args: model)
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+    try:
+        _run(loop, embedder.preload([('mel256', 'music', 6144)]))
+
+        # Concurrent requests share inference batches
+        results = _run(loop, asyncio.gather(*[
+            embedder.get_embedding(audio, sr, hop_size=0.05) for _ in range(4)]))
+        for embedding, ts in results:
+            assert embedding.shape == (11, 8)
+            assert np.allclose(ts, np.arange(11) * 0.05)
+            assert np.array_equal(embedding, results[0][0])
+        assert sum(model.batch_sizes) == 44
+        assert max(model.batch_sizes) <= 8
+        assert len(model.batch_sizes) < 4 * 2
+
+        with pytest.raises(OpenL3Error):
+            _run(loop, embedder.get_embedding(audio, sr, hop_size=-1))
+        with pytest.raises(OpenL3Error):
+            _run(loop, embedder.get_embedding(audio))
+        with pytest.raises(OpenL3Error):
+            _run(loop, embedder.get_embedding(os.path.join(TEST_AUDIO_DIR, 'missing.wav')))
+    finally:
+        asyncio.set_event_loop(None)
+        loop.close()
+        embedder.close()
+
+    pytest.raises(OpenL3Error, AsyncEmbedder, max_pending=0)
+    pytest.raises(OpenL3Error, AsyncEmbedder, max_workers=0)
+
+
+def test_async_embedder_running_loop():
+    audio, sr = sf.read(CHIRP_1S_PATH)
+    embedder = AsyncEmbedder(load_model=lambda *args: _AudioModel())
+    # The loop running the coroutines is used, without the deprecated lookup
+    # of the current event loop
+    loop = asyncio.new_event_loop()
+    try:
+        with warnings.catch_warnings():
+            warnings.simplefilter('error', DeprecationWarning)
+            embedding, _ = _run(loop, embedder.get_embedding(audio, sr, hop_size=0.5))
+        assert embedding.shape == (2, 8)
+    finally:
+        loop.close()
+        embedder.close()
+
+
+def test_async_embedder_backpressure():
+    audio, sr = sf.read(CHIRP_1S_PATH)
+    model = _AudioModel()
+    embedder = AsyncEmbedder(max_pending=3, max_batch_size=16, max_wait=0,
+                             load_model=lambda *args: model)
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+    try:
+        # The first request blocks inference, the next two wait in the
+        # inference queue and the last two wait for a pending request to finish
+        model.event.clear()
+        tasks = [loop.create_task(embedder.get_embedding(audio, sr)) for _ in range(5)]
+        _run(loop, asyncio.sleep(0.2))
+        assert embedder.n_pending == 3
+
+        # Cancelled requests are skipped
+        tasks[1].cancel()
+        tasks[3].cancel()
+        _run(loop, asyncio.sleep(0.1))
+        model.event.set()
+        results = _run(loop, asyncio.gather(*tasks, return_exceptions=True))
+        assert [isinstance(result, asyncio.CancelledError) for result in results] == \
+            [False, True, False, True, False]
+        assert sum(model.batch_sizes) == 3 * 6
+        assert embedder.n_pending == 0
+    finally:
+        asyncio.set_event_loop(None)
+        loop.close()
+        embedder.close()
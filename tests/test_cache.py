@@ -0,0 +1,116 @@
+import pytest
+import os
+import shutil
+import tempfile
+import numpy as np
+import soundfile as sf
+from openl3.cache import (
+    EmbeddingCache, get_model_name, get_model_id, get_audio_hash,
+    get_sound_file_hash, get_cache_key
+)
+from openl3.models import load_embedding_model
+from openl3.openl3_exceptions import OpenL3Error
+
+
+TEST_DIR = os.path.dirname(__file__)
+TEST_AUDIO_DIR = os.path.join(TEST_DIR, 'data', 'audio')
+
+CHIRP_MONO_PATH = os.path.join(TEST_AUDIO_DIR, 'chirp_mono.wav')
+CHIRP_STEREO_PATH = os.path.join(TEST_AUDIO_DIR, 'chirp_stereo.wav')
+
+
+def test_get_audio_hash():
+    for path in (CHIRP_MONO_PATH, CHIRP_STEREO_PATH):
+        audio, sr = sf.read(path)
+        audio_hash = get_audio_hash(audio, sr)
+
+        # Make sure the hash does not depend on how the file is read
+        with sf.SoundFile(path) as sound_file:
+            assert get_sound_file_hash(sound_file, block_size=1000) == audio_hash
+            assert sound_file.tell() == 0
+
+        # Make sure the hash depends on the samples and the sampling rate
+        assert get_audio_hash(audio, sr + 1) != audio_hash
+        modified = audio.copy()
+        modified[0] += 1e-6
+        assert get_audio_hash(modified, sr) != audio_hash
+
+
+def test_get_cache_key():
+    key = get_cache_key('abc', 'model', True, 0.1, 'kaiser_best')
+    assert key == get_cache_key('abc', 'model', True, 0.1, 'kaiser_best')
+    assert len(key) == 64
+
+    for args in (('abd', 'model', True, 0.1, 'kaiser_best'),
+                 ('abc', 'model2', True, 0.1, 'kaiser_best'),
+                 ('abc', 'model', False, 0.1, 'kaiser_best'),
+                 ('abc', 'model', True, 0.2, 'kaiser_best'),
+                 ('abc', 'model', True, 0.1, 'polyphase'),
+                 ('abc', 'model', True, 0.1, 'kaiser_best', 'float32', False, 'mean'),
+                 ('abc', 'model', True, 0.1, 'kaiser_best', 'float32', False, 'mean', 1.0),
+                 ('abc', 'model', True, 0.1, 'kaiser_best', 'float32', False, None, None,
+                  'projection'),
+                 ('abc', 'model', True, 0.1, 'kaiser_best', 'float32', False, None, None,
+                  None, -60)):
+        assert get_cache_key(*args) != key
+
+    # Make sure optimized and XLA-compiled models get their own cache keys
+    names = [get_model_name('mel128', 'env', 512, optimize=optimize, use_xla=use_xla)
+             for optimize in (False, True) for use_xla in (False, True)]
+    keys = [get_cache_key('audio', name, True, 0.1, 'kaiser_best') for name in names]
+    assert len(set(keys)) == 4
+
+
+def test_get_model_id():
+    model = load_embedding_model('mel128', 'env', 512, use_cache=False)
+    assert get_model_id(model) == get_model_name('mel128', 'env', 512)
+    assert get_model_name('mel128', 'env', 512, 'numpy') != get_model_name('mel128', 'env', 512)
+
+
+def test_embedding_cache():
+    cache_dir = tempfile.mkdtemp()
+    try:
+        cache = EmbeddingCache(os.path.join(cache_dir, 'cache'))
+        key1 = get_cache_key('1', 'model', True, 0.1, 'kaiser_best')
+        key2 = get_cache_key('2', 'model', True, 0.1, 'kaiser_best')
+        embedding = np.random.randn(20, 8).astype(np.float32)
+        ts = np.arange(20) * 0.1
+
+        assert cache.get(key1) is None
+        assert cache.load(key1) is None
+        cache.put(key1, embedding, ts)
+        cached_embedding, cached_ts = cache.load(key1)
+        assert np.array_equal(cached_embedding, embedding)
+        assert np.array_equal(cached_ts, ts)
+
+        # Make sure cached outputs can be copied
+        output_path = os.path.join(cache_dir, 'output.npz')
+        assert not cache.copy_to(key2, output_path)
+        assert cache.copy_to(key1, output_path)
+        data = np.load(output_path)
+        assert np.array_equal(data['embedding'], embedding)
+
+        # Make sure the size is tracked across instances
+        entry_size = cache.size
+        assert EmbeddingCache(cache.cache_dir).size == entry_size
+
+        # Make sure replacing an entry does not count its size twice
+        cache.put(key1, embedding, ts)
+        assert cache.size == entry_size
+
+        # Make sure the least recently used entries are evicted
+        small_cache = EmbeddingCache(cache.cache_dir, max_size=entry_size)
+        os.utime(cache.get(key1), (0, 0))
+        small_cache.put_file(key2, output_path)
+        assert small_cache.get(key1) is None
+        assert small_cache.get(key2) is not None
+        assert small_cache.size == entry_size
+
+        small_cache.clear()
+        assert small_cache.get(key2) is None
+        assert small_cache.size == 0
+
+        pytest.raises(OpenL3Error, EmbeddingCache, cache.cache_dir, max_size=-1)
+        pytest.raises(OpenL3Error, EmbeddingCache, output_path)
+    finally:
+        shutil.rmtree(cache_dir)
@@ -1,8 +1,14 @@
 import pytest
 import os
-from openl3.cli import positive_float, get_file_list, parse_args, run, main
+import sys
+from openl3.cli import (
+    positive_float, positive_int, batch_size_type, get_file_list, iter_file_list, read_file_list,
+    parse_args, run, main, read_manifest, _get_worker_context, _decode_worker
+)
+from openl3.cache import EmbeddingCache
 from argparse import ArgumentTypeError
 from openl3.openl3_exceptions import OpenL3Error
+from openl3.store import EmbeddingStore
 import tempfile
 import numpy as np
 import shutil
@@ -49,6 +55,31 @@ def test_positive_float():
         pytest.raises(ArgumentTypeError, positive_float, i)
 
 
+def test_positive_int():
+
+    # test that returned value is int
+    i = positive_int(5)
+    assert i == 5
+    assert type(i) is int
+
+    # test it works for valid strings
+    i = positive_int('3')
+    assert i == 3
+    assert type(i) is int
+
+    # make sure error raised for all invalid values:
+    invalid = [-5, 0, 1.5, '2.5', None, 'hello']
+    for i in invalid:
+        pytest.raises(ArgumentTypeError, positive_int, i)
+
+
+def test_batch_size_type():
+    assert batch_size_type('auto') == 'auto'
+    assert batch_size_type('16') == 16
+    for value in ['0', '-1', '2.5', 'fast']:
+        pytest.raises(ArgumentTypeError, batch_size_type, value)
+
+
 def test_get_file_list():
 
     # test for invalid input (must be iterable, e.g. list)
@@ -80,6 +111,51 @@ def test_get_file_list():
     pytest.raises(OpenL3Error, get_file_list, ['/fake/path/to/file'])
 
 
+def test_iter_file_list():
+    tempdir = tempfile.mkdtemp()
+    try:
+        for path in ('a.wav', 'b.WAV', 'c.txt', os.path.join('sub', 'd.flac'),
+                     os.path.join('sub', 'e.wav'), os.path.join('sub', 'skip', 'f.wav')):
+            path = os.path.join(tempdir, path)
+            if not os.path.isdir(os.path.dirname(path)):
+                os.makedirs(os.path.dirname(path))
+            open(path, 'w').close()
+
+        def relpaths(file_list):
+            return sorted(os.path.relpath(path, tempdir) for path in file_list)
+
+        # make sure files are discovered lazily
+        flist = iter_file_list([tempdir, '/fake/path/to/file'])
+        assert os.path.isfile(next(flist))
+        pytest.raises(OpenL3Error, list, flist)
+
+        # test filters
+        assert relpaths(iter_file_list([tempdir])) == ['a.wav', 'b.WAV']
+        assert relpaths(iter_file_list([tempdir], extensions=None)) == ['a.wav', 'b.WAV', 'c.txt']
+        assert relpaths(iter_file_list([tempdir], recursive=True)) == [
+            'a.wav', 'b.WAV', os.path.join('sub', 'd.flac'), os.path.join('sub', 'e.wav'),
+            os.path.join('sub', 'skip', 'f.wav')]
+        assert relpaths(iter_file_list([tempdir], recursive=True, extensions=['flac'])) == [
+            os.path.join('sub', 'd.flac')]
+        assert relpaths(iter_file_list([tempdir], recursive=True,
+                                       include=[os.path.join('sub', '*')],
+                                       exclude=[os.path.join('sub', 'skip')])) == [
+            os.path.join('sub', 'd.flac'), os.path.join('sub', 'e.wav')]
+
+        # input files are not filtered
+        assert relpaths(get_file_list([os.path.join(tempdir, 'c.txt')])) == ['c.txt']
+
+        # test file lists
+        list_path = os.path.join(tempdir, 'list.txt')
+        with open(list_path, 'w') as f:
+            f.write('# comment\n{}\n\n{}\n'.format(CHIRP_44K_PATH, TEST_AUDIO_DIR))
+        flist = list(read_file_list(list_path))
+        assert flist == [CHIRP_44K_PATH, TEST_AUDIO_DIR]
+        assert len(get_file_list(read_file_list(list_path))) == 8
+    finally:
+        shutil.rmtree(tempdir)
+
+
 def test_parse_args():
 
     # test for all the defaults
@@ -93,13 +169,44 @@ def test_parse_args():
     assert args.embedding_size == 6144
     assert args.no_centering is False
     assert args.hop_size == 0.1
+    assert args.resample_method == 'kaiser_best'
+    assert args.frontend == 'kapre'
+    assert args.streaming is False
+    assert args.jobs == 1
+    assert args.batch_size == 32
+    assert args.memory_budget == 1
+    assert args.cache_dir is None
+    assert args.cache_size == 10
+    assert args.resume is False
+    assert args.manifest is None
+    assert args.file_list is None
+    assert args.recursive is False
+    assert args.ext is None
+    assert args.include is None
+    assert args.exclude is None
+    assert args.output_format == 'float32'
+    assert args.compress is False
+    assert args.store is None
+    assert args.aggregate is None
+    assert args.segment_duration is None
+    assert args.pca is None
+    assert args.silence_threshold is None
+    assert args.config is None
     assert args.quiet is False
 
     # test when setting all values
     args = [CHIRP_44K_PATH, '-o', '/output/dir', '--suffix', 'suffix',
             '--input-repr', 'linear', '--content-type', 'env',
             '--embedding-size', '512', '--no-centering', '--hop-size', '0.5',
-            '--quiet']
+            '--resample-method', 'polyphase', '--frontend', 'numpy', '--streaming', '--jobs', '4',
+            '--batch-size', '16', '--memory-budget', '0.5',
+            '--cache-dir', '/cache/dir', '--cache-size', '0.5', '--resume',
+            '--manifest', '/manifest.jsonl', '--file-list', '-', '--recursive',
+            '--ext', 'wav', '--ext', 'flac', '--include', '*.wav', '--exclude', 'tmp*',
+            '--output-format', 'int8', '--compress', '--store', '/store/dir',
+            '--aggregate', 'meanstd', '--segment-duration', '2', '--pca', '/pca.npz',
+            '--silence-threshold', '-60', '--config', 'mel128,music,512',
+            '--config', 'linear,env,6144,numpy', '--quiet']
     args = parse_args(args)
     assert args.inputs == [CHIRP_44K_PATH]
     assert args.output_dir == '/output/dir'
@@ -109,8 +216,36 @@ def test_parse_args():
     assert args.embedding_size == 512
     assert args.no_centering is True
     assert args.hop_size == 0.5
+    assert args.resample_method == 'polyphase'
+    assert args.frontend == 'numpy'
+    assert args.streaming is True
+    assert args.jobs == 4
+    assert args.batch_size == 16
+    assert args.memory_budget == 0.5
+    assert args.cache_dir == '/cache/dir'
+    assert args.cache_size == 0.5
+    assert args.resume is True
+    assert args.manifest == '/manifest.jsonl'
+    assert args.file_list == '-'
+    assert args.recursive is True
+    assert args.ext == ['wav', 'flac']
+    assert args.include == ['*.wav']
+    assert args.exclude == ['tmp*']
+    assert args.output_format == 'int8'
+    assert args.compress is True
+    assert args.store == '/store/dir'
+    assert args.aggregate == 'meanstd'
+    assert args.segment_duration == 2
+    assert args.pca == '/pca.npz'
+    assert args.silence_threshold == -60
+    assert args.config == [('mel128', 'music', 512), ('linear', 'env', 6144, 'numpy')]
     assert args.quiet is True
 
+    # test that an input or a file list is required
+    pytest.raises(SystemExit, parse_args, [])
+    args = parse_args(['--file-list', '/file/list.txt'])
+    assert args.inputs == []
+
 
 def test_run(capsys):
 
@@ -178,6 +313,225 @@ def test_run(capsys):
     shutil.rmtree(tempdir)
 
 
+def test_run_parallel():
+
+    # test invalid number of jobs
+    pytest.raises(OpenL3Error, run, CHIRP_44K_PATH, jobs=0)
+    pytest.raises(OpenL3Error, run, CHIRP_44K_PATH, jobs=2, streaming=True)
+    pytest.raises(OpenL3Error, run, CHIRP_44K_PATH, jobs=2, output_format='int4')
+    pytest.raises(OpenL3Error, run, CHIRP_44K_PATH, jobs=2, aggregate='median')
+
+    # test correct execution on test files (regression)
+    tempdir = tempfile.mkdtemp()
+    try:
+        run([CHIRP_44K_PATH, CHIRP_1S_PATH, CHIRP_STEREO_PATH], output_dir=tempdir,
+            jobs=2, verbose=True)
+
+        # check output files created
+        for name in ('chirp_44k.npz', 'chirp_1s.npz', 'chirp_stereo.npz'):
+            assert os.path.isfile(os.path.join(tempdir, name))
+
+        # regression test
+        data_reg = np.load(REG_CHIRP_44K_PATH)
+        data_out = np.load(os.path.join(tempdir, 'chirp_44k.npz'))
+
+        assert sorted(data_out.files) == sorted(['embedding', 'timestamps'])
+        assert np.allclose(data_out['timestamps'], data_reg['timestamps'],
+                           rtol=1e-05, atol=1e-06, equal_nan=False)
+        assert np.allclose(data_out['embedding'], data_reg['embedding'],
+                           rtol=1e-05, atol=1e-06, equal_nan=False)
+
+        # make sure the embeddings are aggregated by the pipeline
+        run(CHIRP_44K_PATH, output_dir=tempdir, jobs=2, aggregate='mean',
+            segment_duration=1.0)
+        data_out = np.load(os.path.join(tempdir, 'chirp_44k.npz'))
+        assert np.allclose(data_out['embedding'][0], data_reg['embedding'][:10].mean(axis=0),
+                           rtol=1e-05, atol=1e-05)
+        assert np.allclose(data_out['timestamps'], np.arange(data_out['timestamps'].shape[0]))
+
+        # make sure failures in the workers are reported
+        pytest.raises(OpenL3Error, run, [CHIRP_44K_PATH, EMPTY_PATH],
+                      output_dir=tempdir, jobs=2)
+
+        # make sure discovery failures are reported
+        pytest.raises(OpenL3Error, run, [CHIRP_44K_PATH, '/fake/path/to/file'],
+                      output_dir=tempdir, jobs=2)
+
+        # test file lists
+        list_path = os.path.join(tempdir, 'list.txt')
+        with open(list_path, 'w') as f:
+            f.write('{}\n'.format(CHIRP_1S_PATH))
+        os.remove(os.path.join(tempdir, 'chirp_1s.npz'))
+        run(None, output_dir=tempdir, file_list_path=list_path, jobs=2)
+        assert os.path.isfile(os.path.join(tempdir, 'chirp_1s.npz'))
+    finally:
+        shutil.rmtree(tempdir)
+
+
+def test_decode_worker():
+    tempdir = tempfile.mkdtemp()
+    try:
+        context = _get_worker_context()
+        if sys.version_info[0] >= 3:
+            # make sure the workers never inherit the models of this process
+            assert context.get_start_method() == 'spawn'
+
+        # make sure the worker and its arguments can be sent to a spawned process
+        cache = EmbeddingCache(os.path.join(tempdir, 'cache'))
+        task_queue = context.Queue()
+        result_queue = context.Queue()
+        worker = context.Process(target=_decode_worker,
+                                 args=(task_queue, result_queue, 'kaiser_fast', cache,
+                                       ('model', True, 0.1, 'float32', False, None, None,
+                                        None, None)))
+        worker.start()
+        task_queue.put((CHIRP_1S_PATH, os.path.join(tempdir, 'chirp_1s.npz')))
+        task_queue.put((EMPTY_PATH, os.path.join(tempdir, 'empty.npz')))
+        task_queue.put(None)
+        filepath, audio, cache_key, error = result_queue.get(timeout=60)
+        assert filepath == CHIRP_1S_PATH
+        assert audio.ndim == 1 and audio.dtype == np.float32
+        assert cache_key is not None
+        assert error is None
+        filepath, audio, cache_key, error = result_queue.get(timeout=60)
+        assert filepath == EMPTY_PATH
+        assert audio is None
+        assert error is not None
+        assert result_queue.get(timeout=60) is None
+        worker.join()
+    finally:
+        shutil.rmtree(tempdir)
+
+
+def test_run_resume(capsys):
+    tempdir = tempfile.mkdtemp()
+    manifest_path = os.path.join(tempdir, 'manifest.jsonl')
+    files = [CHIRP_44K_PATH, CHIRP_1S_PATH]
+    try:
+        for jobs in (1, 2):
+            run(files, output_dir=tempdir, manifest=manifest_path, jobs=jobs,
+                verbose=False)
+            manifest = read_manifest(manifest_path)
+            assert sorted(manifest['completed']) == sorted(files)
+            assert manifest['failed'] == []
+            assert manifest['pending'] == []
+
+            # make sure only the missing or truncated outputs are recomputed
+            with open(os.path.join(tempdir, 'chirp_1s.npz'), 'r+b') as f:
+                f.truncate(100)
+            run(files, output_dir=tempdir, manifest=manifest_path, jobs=jobs,
+                resume=True, verbose=True)
+            captured = capsys.readouterr()
+            assert 'Skipping (output exists): {}'.format(CHIRP_44K_PATH) in captured.out
+            assert 'Processing: {}'.format(CHIRP_1S_PATH) in captured.out
+
+            data_out = np.load(os.path.join(tempdir, 'chirp_1s.npz'))
+            assert data_out['embedding'].shape[0] == data_out['timestamps'].shape[0]
+
+            # make sure failures are recorded and the other files are still processed
+            bad_path = os.path.join(tempdir, 'bad.wav')
+            with open(bad_path, 'w') as f:
+                f.write('not audio')
+            os.remove(os.path.join(tempdir, 'chirp_1s.npz'))
+            with pytest.raises(OpenL3Error) as excinfo:
+                run([EMPTY_PATH, bad_path, CHIRP_1S_PATH], output_dir=tempdir,
+                    manifest=manifest_path, jobs=jobs, resume=True)
+            assert 'Could not process 2 file(s)' in str(excinfo.value)
+            assert EMPTY_PATH in str(excinfo.value)
+            assert bad_path in str(excinfo.value)
+            manifest = read_manifest(manifest_path)
+            assert sorted(manifest['completed']) == sorted(files)
+            assert sorted(manifest['failed']) == sorted([EMPTY_PATH, bad_path])
+            assert manifest['pending'] == []
+            assert os.path.isfile(os.path.join(tempdir, 'chirp_1s.npz'))
+            os.remove(bad_path)
+            os.remove(manifest_path)
+    finally:
+        shutil.rmtree(tempdir)
+
+
+def test_run_cache(capsys):
+    tempdir = tempfile.mkdtemp()
+    cache_dir = os.path.join(tempdir, 'cache')
+    output_path = os.path.join(tempdir, 'chirp_44k.npz')
+    try:
+        run(CHIRP_44K_PATH, output_dir=tempdir, cache_dir=cache_dir, verbose=False)
+        data_out = np.load(output_path)
+        embedding = data_out['embedding']
+        os.remove(output_path)
+
+        # make sure the cached output is used by the parallel pipeline
+        run([CHIRP_44K_PATH, CHIRP_1S_PATH], output_dir=tempdir, cache_dir=cache_dir,
+            jobs=2, verbose=True)
+        captured = capsys.readouterr()
+        assert 'Copied from cache: {}'.format(CHIRP_44K_PATH) in captured.out
+        assert 'Processing: {}'.format(CHIRP_1S_PATH) in captured.out
+        assert np.array_equal(np.load(output_path)['embedding'], embedding)
+        assert sum(len(files) for _, _, files in os.walk(cache_dir)) == 2
+    finally:
+        shutil.rmtree(tempdir)
+
+
+def test_run_store(capsys):
+    tempdir = tempfile.mkdtemp()
+    files = [CHIRP_44K_PATH, CHIRP_1S_PATH]
+    try:
+        for jobs in (1, 2):
+            store_dir = os.path.join(tempdir, 'store{}'.format(jobs))
+            run(files, store=store_dir, jobs=jobs, output_format='float16',
+                verbose=False)
+            with EmbeddingStore(store_dir) as store:
+                assert sorted(store.files) == sorted(files)
+                embedding, ts = store.get(CHIRP_1S_PATH)
+                assert embedding.shape[0] == ts.shape[0]
+            assert os.listdir(store_dir) == ['shard-00000.h5']
+
+            # make sure files that are already in the store are skipped
+            run(files + [SHORT_PATH], store=store_dir, jobs=jobs, resume=True,
+                verbose=True)
+            captured = capsys.readouterr()
+            assert 'Skipping (output exists): {}'.format(CHIRP_44K_PATH) in captured.out
+            assert 'Processing: {}'.format(SHORT_PATH) in captured.out
+            with EmbeddingStore(store_dir) as store:
+                assert len(store) == 3
+
+        pytest.raises(OpenL3Error, run, files, store=store_dir,
+                      cache_dir=os.path.join(tempdir, 'cache'))
+    finally:
+        shutil.rmtree(tempdir)
+
+
+def test_run_configs(capsys):
+    tempdir = tempfile.mkdtemp()
+    manifest_path = os.path.join(tempdir, 'manifest.jsonl')
+    files = [CHIRP_44K_PATH, CHIRP_1S_PATH]
+    configs = [('mel256', 'music', 512), ('mel128', 'music', 512), ('mel256', 'music', 6144)]
+    try:
+        run(files, output_dir=tempdir, suffix='x', configs=configs, frontend='numpy',
+            manifest=manifest_path, verbose=False)
+        for config in configs:
+            output_path = os.path.join(tempdir, 'chirp_1s_x_{}_{}_{}.npz'.format(*config))
+            data_out = np.load(output_path)
+            assert data_out['embedding'].shape[1] == config[2]
+            assert data_out['embedding'].shape[0] == data_out['timestamps'].shape[0]
+        assert sorted(read_manifest(manifest_path)['completed']) == sorted(files)
+
+        # make sure only the missing outputs are recomputed
+        os.remove(os.path.join(tempdir, 'chirp_1s_x_mel128_music_512.npz'))
+        run(files, output_dir=tempdir, suffix='x', configs=configs, frontend='numpy',
+            resume=True, verbose=True)
+        captured = capsys.readouterr()
+        assert 'Skipping (outputs exist): {}'.format(CHIRP_44K_PATH) in captured.out
+        assert 'Processing: {}'.format(CHIRP_1S_PATH) in captured.out
+        assert os.path.exists(os.path.join(tempdir, 'chirp_1s_x_mel128_music_512.npz'))
+
+        pytest.raises(OpenL3Error, run, files, configs=configs, streaming=True)
+        pytest.raises(OpenL3Error, run, files, configs=configs, aggregate='mean')
+        pytest.raises(OpenL3Error, run, files, configs=configs + [configs[0]])
+    finally:
+        shutil.rmtree(tempdir)
+
+
 def test_main():
 
     # Duplicate regression test from test_run just to hit coverage
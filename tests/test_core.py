@@ -7,6 +7,7 @@ import shutil
 import soundfile as sf
 from openl3.openl3_exceptions import OpenL3Error
 from openl3.openl3_warnings import OpenL3Warning
+from openl3.store import EmbeddingStore
 
 
 TEST_DIR = os.path.dirname(__file__)
@@ -120,6 +121,21 @@ def test_get_embedding():
     assert np.all(np.abs(emb1load - emb1) < tol)
     assert np.all(np.abs(ts1load - ts1) < tol)
 
+    # Make sure the inference batch size does not change the embedding
+    emb1batch, ts1batch = openl3.get_embedding(audio, sr,
+        model=model, center=True, hop_size=hop_size, batch_size=3, verbose=1)
+    assert emb1batch.dtype == emb1.dtype
+    assert np.all(np.abs(emb1batch - emb1) < tol)
+    assert np.all(np.abs(ts1batch - ts1) < tol)
+
+    # Make sure the numpy front-end gives approximately the same embedding
+    emb1numpy, ts1numpy = openl3.get_embedding(audio, sr,
+        input_repr="linear", content_type="env", embedding_size=6144,
+        center=True, hop_size=hop_size, frontend="numpy", verbose=1)
+    assert emb1numpy.shape == emb1.shape
+    assert np.allclose(emb1numpy, emb1, rtol=1e-3, atol=1e-3)
+    assert np.all(np.abs(ts1numpy - ts1) < tol)
+
     # Make sure that the embeddings are approximately the same with mono and stereo
     audio, sr = sf.read(CHIRP_STEREO_PATH)
     emb2, ts2 = openl3.get_embedding(audio, sr,
@@ -140,6 +156,19 @@ def test_get_embedding():
     # assert np.all(np.abs(ts1 - ts3) < tol)
     assert not np.any(np.isnan(emb3))
 
+    # Make sure all resampling methods give embeddings of the same shape
+    for resample_method in ("kaiser_fast", "polyphase"):
+        emb3r, ts3r = openl3.get_embedding(audio, sr,
+            input_repr="mel256", content_type="music", embedding_size=6144,
+            center=True, hop_size=0.1, resample_method=resample_method, verbose=1)
+        assert emb3r.shape == emb3.shape
+        assert np.all(np.abs(ts3r - ts3) < tol)
+        assert not np.any(np.isnan(emb3r))
+
+    pytest.raises(OpenL3Error, openl3.get_embedding, audio, sr,
+        input_repr="mel256", content_type="music", embedding_size=6144,
+        center=True, hop_size=0.1, resample_method="invalid", verbose=1)
+
     # Make sure empty audio is handled
     audio, sr = sf.read(EMPTY_PATH)
     pytest.raises(OpenL3Error, openl3.get_embedding, audio, sr,
@@ -229,11 +258,242 @@ def test_get_embedding():
     pytest.raises(OpenL3Error, openl3.get_embedding, audio, sr,
         input_repr="mel256", content_type="music", embedding_size=6144,
         center='invalid', hop_size=0.1, verbose=1)
+    pytest.raises(OpenL3Error, openl3.get_embedding, audio, sr,
+        input_repr="mel256", content_type="music", embedding_size=6144,
+        center=True, hop_size=0.1, batch_size=0, verbose=1)
+    pytest.raises(OpenL3Error, openl3.get_embedding, audio, sr,
+        input_repr="mel256", content_type="music", embedding_size=6144,
+        center=True, hop_size=0.1, frontend="invalid", verbose=1)
     pytest.raises(OpenL3Error, openl3.get_embedding, np.ones((10,10,10)), sr,
         input_repr="mel256", content_type="music", embedding_size=6144,
         center=True, hop_size=0.1, verbose=1)
 
 
+def test_get_embeddings_batch():
+    hop_size = 0.1
+    tol = 1e-5
+
+    audio_mono, sr_mono = sf.read(CHIRP_MONO_PATH)
+    audio_44k, sr_44k = sf.read(CHIRP_44K_PATH)
+    audio_short, sr_short = sf.read(SHORT_PATH)
+    audios = [audio_mono, audio_44k, audio_short]
+    srs = [sr_mono, sr_44k, sr_short]
+
+    model = openl3.models.load_embedding_model("mel256", "music", 512)
+    embs, tss = openl3.get_embeddings_batch(audios, srs, model=model,
+        center=True, hop_size=hop_size, batch_size=4, verbose=0)
+    assert len(embs) == len(tss) == 3
+
+    # Make sure results match the single clip API
+    for audio, sr, emb, ts in zip(audios, srs, embs, tss):
+        emb1, ts1 = openl3.get_embedding(audio, sr, model=model, center=True,
+                                         hop_size=hop_size, verbose=0)
+        assert emb.shape == emb1.shape
+        assert emb.shape[1] == 512
+        assert np.all(np.abs(emb - emb1) < tol)
+        assert np.all(np.abs(ts - ts1) < tol)
+
+    # Make sure a single sampling rate can be shared by all clips
+    embs, tss = openl3.get_embeddings_batch([audio_mono, audio_mono], sr_mono,
+        input_repr="mel256", content_type="music", embedding_size=512,
+        center=True, hop_size=hop_size, verbose=0)
+    assert len(embs) == 2
+    assert np.all(np.abs(embs[0] - embs[1]) < tol)
+
+    # Make sure an empty list is handled
+    embs, tss = openl3.get_embeddings_batch([], [], model=model, verbose=0)
+    assert embs == [] and tss == []
+
+    # Make sure invalid arguments don't work
+    pytest.raises(OpenL3Error, openl3.get_embeddings_batch, audio_mono, sr_mono,
+                  model=model)
+    pytest.raises(OpenL3Error, openl3.get_embeddings_batch, audios, [sr_mono],
+                  model=model)
+    pytest.raises(OpenL3Error, openl3.get_embeddings_batch, audios, 'invalid',
+                  model=model)
+    pytest.raises(OpenL3Error, openl3.get_embeddings_batch, audios, srs,
+                  model=model, batch_size=0)
+    pytest.raises(OpenL3Error, openl3.get_embeddings_batch, audios, srs,
+                  model=model, hop_size=0)
+    pytest.raises(OpenL3Error, openl3.get_embeddings_batch, [np.array([])], sr_mono,
+                  model=model)
+
+
+def test_get_embedding_multi_output():
+    hop_size = 0.1
+    tol = 1e-5
+
+    audio, sr = sf.read(CHIRP_MONO_PATH)
+    embs, ts = openl3.get_embedding(audio, sr, input_repr="mel256", content_type="music",
+                                    embedding_size=[6144, 512], hop_size=hop_size, verbose=0)
+    assert sorted(embs) == [512, 6144]
+
+    # Make sure each size matches the single size API
+    for size in (6144, 512):
+        emb1, ts1 = openl3.get_embedding(audio, sr, input_repr="mel256", content_type="music",
+                                         embedding_size=size, hop_size=hop_size, verbose=0)
+        assert embs[size].shape == emb1.shape
+        assert np.all(np.abs(embs[size] - emb1) < tol)
+        assert np.all(np.abs(ts - ts1) < tol)
+
+    audio_44k, sr_44k = sf.read(CHIRP_44K_PATH)
+    embs, tss = openl3.get_embeddings_batch([audio, audio_44k], [sr, sr_44k],
+                                            embedding_size=(512, 6144), hop_size=hop_size,
+                                            verbose=0)
+    assert len(embs) == len(tss) == 2
+    for emb, ts in zip(embs, tss):
+        assert sorted(emb) == [512, 6144]
+        assert emb[512].shape[0] == emb[6144].shape[0] == ts.shape[0]
+
+    # Make sure invalid arguments don't work
+    pytest.raises(OpenL3Error, openl3.get_embedding, audio, sr, embedding_size=[512, 512])
+    pytest.raises(OpenL3Error, openl3.get_embedding, audio, sr, embedding_size=[])
+    pytest.raises(OpenL3Error, openl3.get_embedding, audio, sr, embedding_size=[512, 6144],
+                  aggregate='mean')
+    pytest.raises(OpenL3Error, openl3.process_file, CHIRP_MONO_PATH,
+                  embedding_size=[512, 6144])
+
+    # Make sure models with several outputs are rejected when saving, in memory or streaming
+    model = openl3.models.load_embedding_model("mel256", "music", [6144, 512])
+    for streaming in (False, True):
+        pytest.raises(OpenL3Error, openl3.process_file, CHIRP_MONO_PATH, model=model,
+                      streaming=streaming)
+
+
+def test_get_config_embeddings():
+    hop_size = 0.1
+    tol = 1e-5
+
+    audio, sr = sf.read(CHIRP_44K_PATH)
+    configs = [('mel256', 'music', 6144), ('mel128', 'music', 512), ('mel256', 'music', 512),
+               ('linear', 'env', 512, 'kapre')]
+    embs, ts = openl3.get_config_embeddings(audio, sr, configs, hop_size=hop_size,
+                                            frontend='numpy', verbose=0)
+    assert sorted(embs) == sorted(config[:3] for config in configs)
+
+    # Make sure each configuration matches the single configuration API
+    for config in configs:
+        frontend = config[3] if len(config) == 4 else 'numpy'
+        emb1, ts1 = openl3.get_embedding(audio, sr, input_repr=config[0],
+                                         content_type=config[1], embedding_size=config[2],
+                                         hop_size=hop_size, frontend=frontend, verbose=0)
+        assert embs[config[:3]].shape == emb1.shape
+        assert np.allclose(embs[config[:3]], emb1, atol=tol)
+        assert np.all(np.abs(ts - ts1) < tol)
+
+    # Make sure invalid arguments don't work
+    pytest.raises(OpenL3Error, openl3.get_config_embeddings, audio, sr, [])
+    pytest.raises(OpenL3Error, openl3.get_config_embeddings, audio, sr, 'mel256')
+    pytest.raises(OpenL3Error, openl3.get_config_embeddings, audio, sr,
+                  [('mel256', 'music')])
+    pytest.raises(OpenL3Error, openl3.get_config_embeddings, audio, sr,
+                  [('mel256', 'music', 512), ('mel256', 'music', 512, 'numpy')])
+    pytest.raises(OpenL3Error, openl3.get_config_embeddings, audio, sr,
+                  [('mel256', 'music', [512, 6144])])
+
+
+def test_process_file_configs():
+    tempdir = tempfile.mkdtemp()
+    configs = [('mel256', 'music', 512), ('mel128', 'env', 512)]
+    try:
+        openl3.process_file_configs(CHIRP_1S_PATH, configs, output_dir=tempdir, suffix='x',
+                                    output_format='float16', verbose=0)
+        assert sorted(os.listdir(tempdir)) == ['chirp_1s_x_mel128_env_512.npz',
+                                               'chirp_1s_x_mel256_music_512.npz']
+        for config in configs:
+            output_path = os.path.join(tempdir, 'chirp_1s_{}.npz'.format(
+                openl3.core.get_config_suffix(config, 'x')))
+            embedding, ts = openl3.load_embedding(output_path)
+            emb1, ts1 = openl3.get_embedding(*sf.read(CHIRP_1S_PATH), input_repr=config[0],
+                                             content_type=config[1], embedding_size=config[2],
+                                             verbose=0)
+            assert np.allclose(embedding, emb1, atol=1e-2, rtol=1e-2)
+            assert np.allclose(ts, ts1)
+
+        # Make sure existing outputs are not recomputed
+        mtimes = [os.path.getmtime(os.path.join(tempdir, name)) for name in os.listdir(tempdir)]
+        openl3.process_file_configs(CHIRP_1S_PATH, configs, output_dir=tempdir, suffix='x',
+                                    skip_existing=True, verbose=0)
+        assert mtimes == [os.path.getmtime(os.path.join(tempdir, name))
+                          for name in os.listdir(tempdir)]
+
+        pytest.raises(OpenL3Error, openl3.process_file_configs,
+                      os.path.join(tempdir, 'missing.wav'), configs)
+        pytest.raises(OpenL3Error, openl3.process_file_configs, CHIRP_1S_PATH, configs,
+                      output_format='int4')
+    finally:
+        shutil.rmtree(tempdir)
+
+
+def test_get_embedding_silence_threshold():
+    audio, sr = sf.read(CHIRP_1S_PATH)
+    audio = np.concatenate([audio, np.zeros(3 * sr), 1e-5 * audio, audio])
+    model = openl3.models.load_embedding_model("mel256", "music", 512)
+    emb, ts = openl3.get_embedding(audio, sr, model=model, verbose=0)
+    emb1, ts1, mask = openl3.get_embedding(audio, sr, model=model, silence_threshold=-60,
+                                           return_mask=True, verbose=0)
+    assert emb1.shape == emb.shape
+    assert np.array_equal(ts1, ts)
+    assert 0 < mask.sum() < mask.size
+
+    # Active windows are unchanged, and silent windows get the silence embedding
+    silence, _ = openl3.get_embedding(np.zeros(sr), sr, model=model, center=False, verbose=0)
+    assert np.allclose(emb1[mask], emb[mask], atol=1e-5)
+    assert np.allclose(emb1[~mask], silence[0], atol=1e-5)
+
+    # Make sure the streaming mode gives the same output
+    tempdir = tempfile.mkdtemp()
+    try:
+        audio_path = os.path.join(tempdir, 'audio.wav')
+        sf.write(audio_path, audio, sr, subtype='FLOAT')
+        openl3.process_file(audio_path, model=model, streaming=True, silence_threshold=-60,
+                            verbose=0)
+        assert np.allclose(np.load(os.path.join(tempdir, 'audio.npz'))['embedding'], emb1,
+                           atol=1e-5)
+    finally:
+        shutil.rmtree(tempdir)
+
+    pytest.raises(OpenL3Error, openl3.get_embedding, audio, sr, model=model,
+                  silence_threshold=10)
+    pytest.raises(OpenL3Error, openl3.get_embedding, audio, sr, model=model,
+                  silence_threshold=-60, return_mask=True, aggregate='mean')
+
+
+def test_silence_gate():
+    rng = np.random.RandomState(0)
+    batch = np.zeros((4, 1, 48000), dtype=np.float32)
+    batch[1, 0] = 0.1 * rng.randn(48000)
+    batch[2, 0] = 1e-4 * rng.randn(48000)
+    batch[3, 0, :100] = 1
+
+    gate = openl3.core._SilenceGate(-60)
+    assert gate.mask.shape == (0,)
+    assert list(gate.update(batch)) == [False, True, False, True]
+    assert list(gate.update(batch[:2])) == [False, True]
+    assert list(gate.mask) == [False, True, False, True, False, True]
+
+    gate = openl3.core._SilenceGate(-100)
+    assert list(gate.update(batch)) == [False, True, True, True]
+
+
+def test_get_embedding_auto_batch_size(monkeypatch):
+    tempdir = tempfile.mkdtemp()
+    monkeypatch.setenv('OPENL3_TUNING_CACHE', os.path.join(tempdir, 'batch_sizes.json'))
+    audio, sr = sf.read(CHIRP_1S_PATH)
+    model = openl3.models.load_embedding_model("mel256", "music", 512)
+    try:
+        emb, ts = openl3.get_embedding(audio, sr, model=model, batch_size=4, verbose=0)
+        emb1, ts1 = openl3.get_embedding(audio, sr, model=model, batch_size="auto", verbose=0)
+        assert np.allclose(emb1, emb, atol=1e-5)
+        assert os.path.exists(os.path.join(tempdir, 'batch_sizes.json'))
+
+        pytest.raises(OpenL3Error, openl3.get_embedding, audio, sr, model=model,
+                      batch_size="fast")
+    finally:
+        openl3.tuning.clear_batch_sizes()
+        shutil.rmtree(tempdir)
+
+
 def test_get_output_path():
     test_filepath = '/path/to/the/test/file/audio.wav'
     suffix = 'embedding.npz'
@@ -301,6 +561,326 @@ def test_process_file():
     pytest.raises(OpenL3Error, openl3.process_file, '/fake/directory/asdf.wav')
 
 
+def test_process_file_cache():
+    test_output_dir = tempfile.mkdtemp()
+    cache_dir = os.path.join(test_output_dir, "cache")
+    output_path = os.path.join(test_output_dir, "chirp_44k.npz")
+
+    model = openl3.models.load_embedding_model("mel256", "music", 512)
+    try:
+        for streaming in (False, True):
+            openl3.process_file(CHIRP_44K_PATH, output_dir=test_output_dir, model=model,
+                                cache=cache_dir, streaming=streaming, verbose=False)
+            data = np.load(output_path)
+            embedding, ts = data['embedding'], data['timestamps']
+            os.remove(output_path)
+
+            # Make sure the cached output is used with an identical model
+            model_copy = openl3.models.load_embedding_model("mel256", "music", 512,
+                                                            use_cache=False)
+            model_copy.predict_on_batch = None
+            openl3.process_file(CHIRP_44K_PATH, output_dir=test_output_dir,
+                                model=model_copy, cache=cache_dir,
+                                streaming=not streaming, verbose=False)
+            data = np.load(output_path)
+            assert np.array_equal(data['embedding'], embedding)
+            assert np.array_equal(data['timestamps'], ts)
+
+            openl3.process_file(CHIRP_44K_PATH, output_dir=test_output_dir, model=model,
+                                cache=cache_dir, hop_size=0.5, verbose=False)
+            data = np.load(output_path)
+            assert data['embedding'].shape[0] < embedding.shape[0]
+            shutil.rmtree(cache_dir)
+
+        pytest.raises(OpenL3Error, openl3.process_file, CHIRP_44K_PATH,
+                      output_dir=test_output_dir, model=model, cache=5)
+    finally:
+        shutil.rmtree(test_output_dir)
+
+
+def test_process_file_skip_existing():
+    test_output_dir = tempfile.mkdtemp()
+    output_path = os.path.join(test_output_dir, "chirp_1s.npz")
+
+    model = openl3.models.load_embedding_model("mel256", "music", 512)
+    try:
+        openl3.process_file(CHIRP_1S_PATH, output_dir=test_output_dir, model=model,
+                            verbose=False)
+        mtime = os.path.getmtime(output_path)
+        os.utime(output_path, (mtime - 10, mtime - 10))
+
+        # Make sure valid outputs are not recomputed
+        openl3.process_file(CHIRP_1S_PATH, output_dir=test_output_dir, model=model,
+                            skip_existing=True, verbose=False)
+        assert os.path.getmtime(output_path) == mtime - 10
+
+        # Make sure truncated outputs are recomputed
+        with open(output_path, 'r+b') as f:
+            f.truncate(100)
+        openl3.process_file(CHIRP_1S_PATH, output_dir=test_output_dir, model=model,
+                            skip_existing=True, verbose=False)
+        assert openl3.core.is_valid_output(output_path)
+
+        # Make sure no temporary files are left behind
+        assert os.listdir(test_output_dir) == ["chirp_1s.npz"]
+
+        # Make sure the output format is used in both paths
+        embedding, _ = openl3.load_embedding(output_path)
+        for streaming in (False, True):
+            openl3.process_file(CHIRP_1S_PATH, output_dir=test_output_dir, model=model,
+                                output_format="int8", compress=True,
+                                streaming=streaming, verbose=False)
+            assert np.load(output_path)['embedding'].dtype == np.int8
+            embedding_int8, _ = openl3.load_embedding(output_path)
+            assert np.allclose(embedding_int8, embedding, rtol=0,
+                               atol=np.abs(embedding).max() / 127.)
+
+        pytest.raises(OpenL3Error, openl3.process_file, CHIRP_1S_PATH,
+                      output_dir=test_output_dir, model=model, output_format="int4")
+    finally:
+        shutil.rmtree(test_output_dir)
+
+
+def test_process_file_aggregate():
+    test_output_dir = tempfile.mkdtemp()
+    output_path = os.path.join(test_output_dir, "chirp_44k.npz")
+    model = openl3.models.load_embedding_model("mel256", "music", 512)
+    try:
+        audio, sr = sf.read(CHIRP_44K_PATH)
+        embedding, _ = openl3.get_embedding(audio, sr, model=model, verbose=False)
+
+        embedding_out, ts_out = openl3.get_embedding(audio, sr, model=model, batch_size=4,
+                                                     aggregate="meanstd", verbose=False)
+        assert embedding_out.shape == (1, 1024)
+        assert np.allclose(embedding_out[0, :512], embedding.mean(axis=0), atol=1e-5)
+        assert np.allclose(embedding_out[0, 512:], embedding.std(axis=0), atol=1e-5)
+        assert np.array_equal(ts_out, [0])
+
+        # Make sure both paths aggregate over the same segments
+        for streaming in (False, True):
+            openl3.process_file(CHIRP_44K_PATH, output_dir=test_output_dir, model=model,
+                                batch_size=4, aggregate="max", segment_duration=0.5,
+                                streaming=streaming, verbose=False)
+            data = np.load(output_path)
+            assert np.allclose(data['embedding'],
+                               [embedding[i:i + 5].max(axis=0)
+                                for i in range(0, embedding.shape[0], 5)], atol=1e-5)
+            assert np.allclose(data['timestamps'], np.arange(data['embedding'].shape[0]) * 0.5)
+            assert os.listdir(test_output_dir) == ["chirp_44k.npz"]
+
+        pytest.raises(OpenL3Error, openl3.get_embedding, audio, sr, model=model,
+                      aggregate="median")
+        pytest.raises(OpenL3Error, openl3.process_file, CHIRP_44K_PATH, model=model,
+                      segment_duration=1.0)
+    finally:
+        shutil.rmtree(test_output_dir)
+
+
+def test_process_file_pca():
+    test_output_dir = tempfile.mkdtemp()
+    output_path = os.path.join(test_output_dir, "chirp_44k.npz")
+    model = openl3.models.load_embedding_model("mel256", "music", 512)
+    try:
+        audio, sr = sf.read(CHIRP_44K_PATH)
+        embedding, _ = openl3.get_embedding(audio, sr, model=model, verbose=False)
+        rng = np.random.RandomState(0)
+        projection = openl3.pca.EmbeddingProjection(
+            rng.randn(512), np.linalg.qr(rng.randn(512, 16))[0].T)
+        pca_path = os.path.join(test_output_dir, "pca.npz")
+        projection.save(pca_path)
+
+        embedding_out, _ = openl3.get_embedding(audio, sr, model=model, batch_size=4,
+                                                pca=projection, verbose=False)
+        assert embedding_out.shape == (embedding.shape[0], 16)
+        assert np.allclose(embedding_out, projection.transform(embedding), atol=1e-4)
+
+        embeddings_out, _ = openl3.get_embeddings_batch([audio, audio], sr, model=model,
+                                                        pca=pca_path, verbose=False)
+        assert np.allclose(embeddings_out[1], embedding_out, atol=1e-4)
+
+        for streaming in (False, True):
+            openl3.process_file(CHIRP_44K_PATH, output_dir=test_output_dir, model=model,
+                                pca=pca_path, streaming=streaming, verbose=False)
+            assert np.allclose(np.load(output_path)['embedding'], embedding_out, atol=1e-4)
+
+        pytest.raises(OpenL3Error, openl3.get_embedding, audio, sr, model=model, pca=16)
+    finally:
+        shutil.rmtree(test_output_dir)
+
+
+def test_process_file_store():
+    model = openl3.models.load_embedding_model("mel256", "music", 512)
+    audio, sr = sf.read(CHIRP_1S_PATH)
+    embedding, ts = openl3.get_embedding(audio, sr, model=model, verbose=False)
+
+    for streaming in (False, True):
+        store_dir = tempfile.mkdtemp()
+        try:
+            with EmbeddingStore(store_dir, mode='a') as store:
+                openl3.process_file(CHIRP_1S_PATH, model=model, streaming=streaming,
+                                    store=store, verbose=False)
+                embedding_out, ts_out = store.get(CHIRP_1S_PATH)
+                assert np.allclose(embedding_out, embedding, atol=1e-5)
+                assert np.array_equal(ts_out, ts)
+
+                # Make sure files that are already in the store are skipped
+                openl3.process_file(CHIRP_1S_PATH, model=model, streaming=streaming,
+                                    store=store, skip_existing=True, verbose=False)
+                pytest.raises(OpenL3Error, openl3.process_file, CHIRP_1S_PATH,
+                              model=model, streaming=streaming, store=store)
+                pytest.raises(OpenL3Error, openl3.process_file, CHIRP_1S_PATH,
+                              model=model, store=store, cache=store_dir)
+
+            # Make sure no temporary files are left in the store directory
+            assert os.listdir(store_dir) == ['shard-00000.h5']
+        finally:
+            shutil.rmtree(store_dir)
+
+
+def test_output_formats():
+    test_output_dir = tempfile.mkdtemp()
+    output_path = os.path.join(test_output_dir, "output.npz")
+
+    embedding = np.maximum(np.random.RandomState(0).randn(1000, 64), 0).astype(np.float32)
+    embedding[:, 0] = 1.5
+    ts = np.arange(1000) * 0.1
+    chunk_size = openl3.core.OUTPUT_CHUNK_SIZE
+    try:
+        # Use short chunks so that the embedding is converted in several chunks
+        openl3.core.OUTPUT_CHUNK_SIZE = 300
+        sizes = {}
+        for output_format in ("float32", "float16", "int8"):
+            for compress in (False, True):
+                openl3.core._save_output(output_path, embedding, ts, output_format, compress)
+                assert openl3.core.is_valid_output(output_path)
+                sizes[(output_format, compress)] = os.path.getsize(output_path)
+
+                loaded_embedding, loaded_ts = openl3.load_embedding(output_path)
+                assert loaded_embedding.dtype == np.float32
+                assert np.array_equal(loaded_ts, ts)
+                if output_format == "float32":
+                    assert np.array_equal(loaded_embedding, embedding)
+                elif output_format == "float16":
+                    assert np.allclose(loaded_embedding, embedding, rtol=1e-3, atol=0)
+                else:
+                    # The error is at most half a quantization step
+                    step = (embedding.max(axis=0) - embedding.min(axis=0)) / 254
+                    assert np.all(np.abs(loaded_embedding - embedding) <= step / 2 + 1e-6)
+                    assert np.array_equal(loaded_embedding[:, 0], embedding[:, 0])
+
+        assert sizes[("float16", False)] < 0.55 * sizes[("float32", False)]
+        assert sizes[("int8", False)] < 0.3 * sizes[("float32", False)]
+        for output_format in ("float32", "float16", "int8"):
+            assert sizes[(output_format, True)] < sizes[(output_format, False)]
+
+        pytest.raises(OpenL3Error, openl3.load_embedding,
+                      os.path.join(test_output_dir, "missing.npz"))
+    finally:
+        openl3.core.OUTPUT_CHUNK_SIZE = chunk_size
+        shutil.rmtree(test_output_dir)
+
+
+def test_is_valid_output():
+    test_output_dir = tempfile.mkdtemp()
+    output_path = os.path.join(test_output_dir, "output.npz")
+    try:
+        assert not openl3.core.is_valid_output(output_path)
+
+        openl3.core._save_output(output_path, np.zeros((10, 4)), np.arange(10))
+        assert openl3.core.is_valid_output(output_path)
+
+        np.savez(output_path, embedding=np.zeros((10, 4)), timestamps=np.arange(9))
+        assert not openl3.core.is_valid_output(output_path)
+
+        np.savez(output_path, embedding=np.zeros((10, 4)))
+        assert not openl3.core.is_valid_output(output_path)
+
+        openl3.core._save_output(output_path, np.zeros((10, 4)), np.arange(10))
+        with open(output_path, 'rb') as f:
+            data = f.read()
+        with open(output_path, 'wb') as f:
+            f.write(data[:len(data) // 2])
+        assert not openl3.core.is_valid_output(output_path)
+    finally:
+        shutil.rmtree(test_output_dir)
+
+
+def test_process_file_streaming():
+    test_output_dir = tempfile.mkdtemp()
+    test_subdir = os.path.join(test_output_dir, "subdir")
+    os.makedirs(test_subdir)
+
+    model = openl3.models.load_embedding_model("mel256", "music", 512)
+    block_duration = openl3.core.RESAMPLE_BLOCK_DURATION
+    try:
+        # Use short blocks so that the files are processed in several blocks
+        openl3.core.RESAMPLE_BLOCK_DURATION = 0.5
+        for path in (CHIRP_44K_PATH, CHIRP_STEREO_PATH, CHIRP_1S_PATH):
+            for center, hop_size, resample_method in ((True, 0.1, "kaiser_best"),
+                                                      (False, 0.25, "polyphase")):
+                openl3.process_file(path, output_dir=test_output_dir, model=model,
+                                    center=center, hop_size=hop_size,
+                                    resample_method=resample_method,
+                                    batch_size=5, verbose=False)
+                openl3.process_file(path, output_dir=test_subdir, model=model,
+                                    center=center, hop_size=hop_size,
+                                    resample_method=resample_method,
+                                    batch_size=5, streaming=True, verbose=False)
+
+                output_name = os.path.splitext(os.path.basename(path))[0] + '.npz'
+                data = np.load(os.path.join(test_output_dir, output_name))
+                data_stream = np.load(os.path.join(test_subdir, output_name))
+
+                # Make sure the streaming output is identical
+                assert np.array_equal(data['embedding'], data_stream['embedding'])
+                assert np.array_equal(data['timestamps'], data_stream['timestamps'])
+
+        # Make sure no temporary files are left behind
+        assert sorted(os.listdir(test_subdir)) == ['chirp_1s.npz', 'chirp_44k.npz',
+                                                   'chirp_stereo.npz']
+
+        # Make sure short audio and silence are handled
+        pytest.warns(OpenL3Warning, openl3.process_file, SHORT_PATH,
+                     output_dir=test_subdir, model=model, streaming=True)
+        pytest.warns(OpenL3Warning, openl3.process_file, SILENCE_PATH,
+                     output_dir=test_subdir, model=model, streaming=True)
+
+        # Make sure we fail when invalid files are provided
+        pytest.raises(OpenL3Error, openl3.process_file, EMPTY_PATH,
+                      output_dir=test_subdir, model=model, streaming=True)
+        pytest.raises(OpenL3Error, openl3.process_file, CHIRP_MONO_PATH,
+                      output_dir=test_subdir, model=model, streaming=True,
+                      hop_size=0)
+    finally:
+        openl3.core.RESAMPLE_BLOCK_DURATION = block_duration
+        shutil.rmtree(test_output_dir)
+
+
+def test_get_polyphase_filter():
+    up, down, filt = openl3.core._get_polyphase_filter(44100, 48000)
+    assert up == 160
+    assert down == 147
+    assert filt.size == 2 * 10 * 160 + 1
+
+    # Make sure the filter is cached
+    assert openl3.core._get_polyphase_filter(44100, 48000)[2] is filt
+
+
+def test_resample_blocks():
+    block_duration = openl3.core.RESAMPLE_BLOCK_DURATION
+    audio = np.random.RandomState(0).randn(44100 * 3)
+    try:
+        for resample_method in ("kaiser_best", "kaiser_fast", "polyphase"):
+            openl3.core.RESAMPLE_BLOCK_DURATION = 60
+            audio_full = openl3.core._preprocess_audio(audio, 44100, resample_method)
+            openl3.core.RESAMPLE_BLOCK_DURATION = 0.7
+            audio_blocks = openl3.core._preprocess_audio(audio, 44100, resample_method)
+            assert audio_full.size == audio_blocks.size == 48000 * 3
+            assert np.allclose(audio_full, audio_blocks, atol=1e-8)
+    finally:
+        openl3.core.RESAMPLE_BLOCK_DURATION = block_duration
+
+
 def test_center_audio():
     audio_len = 100
     audio = np.ones((audio_len,))
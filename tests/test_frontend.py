@@ -0,0 +1,82 @@
+import numpy as np
+from openl3.frontend import (
+    SPECTROGRAM_PARAMS, compute_power_spectrogram, power_to_model_input,
+    compute_model_input, _get_mel_filterbank, _get_frame_layout
+)
+
+
+def test_get_mel_filterbank():
+    for n_mels in (128, 256):
+        fb = _get_mel_filterbank(2048, n_mels)
+        assert fb.shape == (n_mels, 1025)
+        assert fb.dtype == np.float32
+        assert np.all(fb >= 0)
+
+        # Filters are ordered by center frequency
+        centers = np.argmax(fb, axis=1)
+        assert np.all(np.diff(centers[fb.max(axis=1) > 0]) >= 0)
+
+    # Make sure the filterbank is cached
+    assert _get_mel_filterbank(2048, 128) is _get_mel_filterbank(2048, 128)
+
+
+def test_get_frame_layout():
+    # 'same' padding, as computed by Keras
+    n_frames, pad_left = _get_frame_layout(2048, 242, 'same', 48000)
+    assert n_frames == 199
+    assert pad_left == 982
+
+    # 'valid' padding
+    n_frames, pad_left = _get_frame_layout(512, 242, 'valid', 48000)
+    assert n_frames == 197
+    assert pad_left == 0
+
+
+def test_compute_power_spectrogram():
+    rng = np.random.RandomState(0)
+    audio = rng.randn(48000 * 3)
+
+    # A sinusoid at the center frequency of a DFT bin peaks at that bin
+    t = np.arange(48000) / 48000.0
+    sine = np.sin(2 * np.pi * 100 * (48000 / 512.0) * t)[np.newaxis, :]
+    power = compute_power_spectrogram(sine, 'linear')
+    assert power.shape == (1, 197, 257)
+    assert np.all(np.argmax(power[0], axis=-1) == 100)
+
+    for input_repr, params in SPECTROGRAM_PARAMS.items():
+        for hop_len in (242 * 20, 242 * 4, 4800):
+            n_windows = 1 + (audio.size - 48000) // hop_len
+            frames = np.stack([audio[i * hop_len:i * hop_len + 48000]
+                               for i in range(n_windows)])
+
+            # Make sure the shared STFT gives the same result as the
+            # STFT of each window
+            power_shared = compute_power_spectrogram(frames, input_repr, hop_len=hop_len)
+            power_windows = compute_power_spectrogram(frames, input_repr)
+            assert power_shared.shape == power_windows.shape
+            assert power_shared.shape[0] == n_windows
+            assert power_shared.shape[2] == params['n_dft'] // 2 + 1
+            assert np.allclose(power_shared, power_windows, rtol=1e-6, atol=1e-6)
+
+
+def test_compute_model_input():
+    rng = np.random.RandomState(0)
+    frames = rng.randn(3, 48000)
+    frames[1] = 0
+
+    for input_repr, n_freq, n_frames in (('linear', 257, 197),
+                                         ('mel128', 128, 199),
+                                         ('mel256', 256, 199)):
+        spec = compute_model_input(frames, input_repr)
+        assert spec.shape == (3, n_freq, n_frames, 1)
+        assert spec.dtype == np.float32
+
+        # Each window is normalized to a maximum of 0 dB with 80 dB of range
+        assert np.allclose(spec.max(axis=(1, 2, 3)), 0)
+        assert np.all(spec >= -80)
+
+        # Silence gives a constant spectrogram
+        assert np.all(spec[1] == 0)
+
+        power = compute_power_spectrogram(frames, input_repr)
+        assert np.array_equal(power_to_model_input(power, input_repr), spec)
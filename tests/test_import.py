@@ -0,0 +1,76 @@
+import os
+import sys
+import json
+import subprocess
+
+
+TEST_DIR = os.path.dirname(__file__)
+PACKAGE_DIR = os.path.dirname(os.path.abspath(TEST_DIR))
+
+# Modules that must not be loaded until a model is built or inference runs
+HEAVY_MODULES = ('keras', 'tensorflow', 'kapre', 'resampy', 'numba', 'sklearn', 'h5py')
+
+# Generous bounds, so that the test does not depend on the speed of the machine
+MAX_IMPORT_TIME = 3.0
+MAX_IMPORT_RSS_MB = 200
+
+IMPORT_SCRIPT = '''
+import json
+import sys
+import time
+
+start = time.time()
+import openl3
+from openl3.cli import parse_args, get_file_list
+try:
+    parse_args(['--help'])
+except SystemExit:
+    pass
+elapsed = time.time() - start
+
+rss_mb = None
+try:
+    # Peak RSS of this process; ru_maxrss can include the peak of the parent
+    # process on Linux, since it is kept across fork and exec
+    with open('/proc/self/status') as f:
+        for line in f:
+            if line.startswith('VmHWM:'):
+                rss_mb = int(line.split()[1]) / 1024.
+except IOError:
+    try:
+        import resource
+        rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # Kilobytes on Linux, bytes on macOS
+        rss_mb = rss / 1024. ** (2 if sys.platform == 'darwin' else 1)
+    except ImportError:
+        pass
+
+sys.stderr.write(json.dumps({
+    'time': elapsed,
+    'rss_mb': rss_mb,
+    'modules': sorted(set(name.split('.')[0] for name in sys.modules)),
+}))
+'''
+
+
+def _measure_import():
+    env = dict(os.environ)
+    env['PYTHONPATH'] = os.pathsep.join([PACKAGE_DIR] + [p for p in [env.get('PYTHONPATH')] if p])
+    process = subprocess.Popen([sys.executable, '-c', IMPORT_SCRIPT], env=env,
+                               stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    _, stderr = process.communicate()
+    assert process.returncode == 0, stderr
+    return json.loads(stderr.decode('utf-8').strip().splitlines()[-1])
+
+
+def test_import_is_lightweight():
+    result = _measure_import()
+
+    loaded = [name for name in HEAVY_MODULES if name in result['modules']]
+    assert loaded == [], 'Heavy modules loaded on import: {}'.format(loaded)
+
+    assert result['time'] < MAX_IMPORT_TIME, \
+        'Importing openl3 took {:.2f}s'.format(result['time'])
+    if result['rss_mb'] is not None:
+        assert result['rss_mb'] < MAX_IMPORT_RSS_MB, \
+            'Importing openl3 used {:.0f}MB'.format(result['rss_mb'])
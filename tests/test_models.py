@@ -1,4 +1,16 @@
-from openl3.models import load_embedding_model, load_embedding_model_path
+import pytest
+import time
+import threading
+import openl3.models
+import numpy as np
+from openl3.models import (
+    load_embedding_model, load_embedding_model_path, clear_model_cache,
+    set_model_cache_size, preload_embedding_models, get_model_cache_info,
+    get_spectrogram_input_repr, ThreadSafeModel, _fold_batch_norm
+)
+from openl3.frontend import compute_model_input
+from openl3.cache import get_model_name, get_model_id
+from openl3.openl3_exceptions import OpenL3Error
 
 
 def test_load_embedding_model_path():
@@ -57,3 +69,254 @@ def test_load_embedding_model():
 
     m = load_embedding_model('mel256', 'env', 512)
     assert m.output_shape[1] == 512
+
+
+def test_load_embedding_model_multi_output():
+    rng = np.random.RandomState(0)
+    frames = rng.randn(4, 1, 48000).astype(np.float32)
+
+    for input_repr in ('linear', 'mel128', 'mel256'):
+        m = load_embedding_model(input_repr, 'music', [6144, 512], use_cache=False)
+        assert m.name == 'openl3_audio_{}_music_6144_512_kapre'.format(input_repr)
+        assert [shape[1] for shape in m.output_shape] == [6144, 512]
+
+        # Make sure both outputs match the single output models
+        outputs = m.predict_on_batch(frames)
+        for size, output in zip((6144, 512), outputs):
+            m1 = load_embedding_model(input_repr, 'music', size)
+            assert np.allclose(output, m1.predict_on_batch(frames), atol=1e-5)
+
+    # A single size in a list is the same as the size itself
+    m = load_embedding_model('mel256', 'music', [512])
+    assert m is load_embedding_model('mel256', 'music', 512)
+
+
+def test_model_cache():
+    clear_model_cache()
+    set_model_cache_size(2)
+    try:
+        m1 = load_embedding_model('linear', 'music', 512)
+        info = get_model_cache_info()
+        assert info['hits'] == 0
+        assert info['misses'] == 1
+        assert info['size'] == 1
+
+        # Make sure the same model object is returned on a cache hit
+        assert load_embedding_model('linear', 'music', 512) is m1
+        info = get_model_cache_info()
+        assert info['hits'] == 1
+        assert info['misses'] == 1
+
+        # Make sure uncached loads do not touch the cache
+        m_uncached = load_embedding_model('linear', 'music', 512, use_cache=False)
+        assert m_uncached is not m1
+        assert get_model_cache_info()['misses'] == 1
+
+        # Make sure least recently used models are evicted
+        m2, m3 = preload_embedding_models([('linear', 'env', 512),
+                                           ('mel128', 'music', 512)])
+        assert m2.output_shape[1] == 512
+        assert m3.output_shape[1] == 512
+        info = get_model_cache_info()
+        assert info['size'] == 2
+        assert info['keys'] == [('linear', 'env', 512, 'kapre'),
+                                ('mel128', 'music', 512, 'kapre')]
+
+        load_embedding_model('linear', 'env', 512)
+        assert get_model_cache_info()['keys'] == [('mel128', 'music', 512, 'kapre'),
+                                                  ('linear', 'env', 512, 'kapre')]
+
+        # Make sure shrinking the cache evicts models
+        set_model_cache_size(1)
+        assert get_model_cache_info()['keys'] == [('linear', 'env', 512, 'kapre')]
+
+        pytest.raises(OpenL3Error, set_model_cache_size, -1)
+        pytest.raises(OpenL3Error, set_model_cache_size, 'invalid')
+
+        clear_model_cache()
+        info = get_model_cache_info()
+        assert info['size'] == 0
+        assert info['hits'] == 0
+        assert info['misses'] == 0
+    finally:
+        clear_model_cache()
+        set_model_cache_size(4)
+
+
+def test_model_cache_concurrent_loads(monkeypatch):
+    constructed = []
+    building = threading.Event()
+
+    class _Model(object):
+        pass
+
+    def construct(input_repr, content_type, embedding_size, frontend, **kwargs):
+        constructed.append((input_repr, content_type, embedding_size))
+        if input_repr == 'mel256':
+            building.set()
+            time.sleep(0.5)
+        return _Model()
+
+    monkeypatch.setattr(openl3.models, '_construct_embedding_model', construct)
+    clear_model_cache()
+    try:
+        m1 = load_embedding_model('linear', 'music', 512)
+        results = []
+        threads = [threading.Thread(target=lambda: results.append(
+            load_embedding_model('mel256', 'music', 512))) for _ in range(3)]
+        for thread in threads:
+            thread.start()
+        building.wait()
+
+        # Make sure cached models are returned while another model is constructed
+        start = time.time()
+        assert load_embedding_model('linear', 'music', 512) is m1
+        get_model_cache_info()
+        assert time.time() - start < 0.25
+
+        # Make sure concurrent loads of the same model construct it once
+        for thread in threads:
+            thread.join()
+        assert constructed.count(('mel256', 'music', 512)) == 1
+        assert results[0] is results[1] is results[2]
+        info = get_model_cache_info()
+        assert info['misses'] == 2
+        assert info['hits'] == 3
+    finally:
+        clear_model_cache()
+
+
+def test_load_embedding_model_numpy_frontend():
+    rng = np.random.RandomState(0)
+    frames = rng.randn(4, 48000).astype(np.float32)
+
+    for input_repr, n_freq, n_frames in (('linear', 257, 197),
+                                         ('mel128', 128, 199),
+                                         ('mel256', 256, 199)):
+        m = load_embedding_model(input_repr, 'music', 512, use_cache=False)
+        m_spec = load_embedding_model(input_repr, 'music', 512, frontend='numpy',
+                                      use_cache=False)
+        assert m_spec.input_shape == (None, n_freq, n_frames, 1)
+        assert m_spec.output_shape[1] == 512
+        assert get_spectrogram_input_repr(m) is None
+        assert get_spectrogram_input_repr(m_spec) == input_repr
+
+        # Make sure the embeddings match the kapre front-end
+        emb = m.predict(frames[:, np.newaxis, :])
+        emb_spec = m_spec.predict(compute_model_input(frames, input_repr))
+        assert np.allclose(emb, emb_spec, rtol=1e-3, atol=1e-3)
+
+    pytest.raises(OpenL3Error, load_embedding_model, 'mel256', 'music', 512,
+                  frontend='invalid')
+
+
+def test_thread_safe_model():
+    clear_model_cache()
+    try:
+        model = load_embedding_model('linear', 'music', 512)
+        safe_model = load_embedding_model('linear', 'music', 512, thread_safe=True)
+        assert isinstance(safe_model, ThreadSafeModel)
+        assert safe_model.model is model
+        assert safe_model.name == model.name
+        assert safe_model.input_shape == model.input_shape
+        assert get_spectrogram_input_repr(safe_model) is None
+
+        # Make sure the wrapper of cached models is shared
+        assert load_embedding_model('linear', 'music', 512, thread_safe=True) is safe_model
+        assert isinstance(load_embedding_model('linear', 'music', 512, use_cache=False,
+                                               thread_safe=True), ThreadSafeModel)
+        assert ThreadSafeModel(safe_model).model is model
+
+        rng = np.random.RandomState(0)
+        batches = [rng.randn(3, 1, 48000).astype(np.float32) for _ in range(8)]
+        expected = [model.predict_on_batch(batch) for batch in batches]
+
+        # Make sure concurrent calls from other threads give the same results
+        for serialize in (True, False):
+            shared_model = ThreadSafeModel(model, serialize=serialize)
+            results = [None] * len(batches)
+
+            def predict(i):
+                results[i] = shared_model.predict_on_batch(batches[i])
+
+            threads = [threading.Thread(target=predict, args=(i,)) for i in range(len(batches))]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+            for result, expected_result in zip(results, expected):
+                assert np.allclose(result, expected_result, atol=1e-5)
+    finally:
+        clear_model_cache()
+
+
+class _BatchNorm(object):
+    """Parameters of a BatchNormalization layer"""
+    def __init__(self, weights, scale=True, center=True, epsilon=1e-3):
+        self.weights = weights
+        self.scale = scale
+        self.center = center
+        self.epsilon = epsilon
+
+    def get_weights(self):
+        return list(self.weights)
+
+
+def test_fold_batch_norm():
+    rng = np.random.RandomState(0)
+    x = rng.randn(10, 4).astype(np.float32)
+    kernel = rng.randn(1, 1, 4, 3).astype(np.float32)
+    bias = rng.randn(3).astype(np.float32)
+    gamma, beta, mean = rng.randn(3, 3).astype(np.float32)
+    var = rng.uniform(0.5, 2, 3).astype(np.float32)
+
+    # A 1x1 convolution is a matrix product
+    y = x.dot(kernel[0, 0]) + bias
+    for bn, expected in (
+            (_BatchNorm([gamma, beta, mean, var]),
+             gamma * (y - mean) / np.sqrt(var + 1e-3) + beta),
+            (_BatchNorm([mean, var], scale=False, center=False),
+             (y - mean) / np.sqrt(var + 1e-3))):
+        folded_kernel, folded_bias = _fold_batch_norm(kernel, bias, bn)
+        assert folded_kernel.dtype == np.float32
+        assert np.allclose(x.dot(folded_kernel[0, 0]) + folded_bias, expected, atol=1e-5)
+
+    bn = _BatchNorm([gamma, beta, mean, var])
+    folded_kernel, folded_bias = _fold_batch_norm(kernel, None, bn)
+    assert np.allclose(x.dot(folded_kernel[0, 0]) + folded_bias,
+                       gamma * (x.dot(kernel[0, 0]) - mean) / np.sqrt(var + 1e-3) + beta,
+                       atol=1e-5)
+
+
+def test_optimize_for_inference():
+    rng = np.random.RandomState(0)
+    frames = rng.randn(4, 1, 48000).astype(np.float32)
+
+    for input_repr in ('linear', 'mel128', 'mel256'):
+        for embedding_size in (512, 6144):
+            m = load_embedding_model(input_repr, 'music', embedding_size, use_cache=False)
+            m_opt = load_embedding_model(input_repr, 'music', embedding_size, use_cache=False,
+                                         optimize=True)
+            # Make sure embeddings of optimized models are cached separately
+            assert get_model_id(m_opt) != get_model_id(m)
+            assert get_model_id(m_opt) == get_model_name(input_repr, 'music', embedding_size,
+                                                         optimize=True)
+            assert m_opt.output_shape == m.output_shape
+
+            # Only the batch normalization of the spectrogram is left
+            n_bn = sum(type(layer).__name__ == 'BatchNormalization' for layer in m_opt.layers)
+            assert n_bn == 1
+            assert not m_opt.losses
+
+            assert np.allclose(m_opt.predict_on_batch(frames), m.predict_on_batch(frames),
+                               atol=1e-4, rtol=1e-3)
+
+    # Make sure optimized models are cached separately
+    clear_model_cache()
+    try:
+        m = load_embedding_model('linear', 'music', 512)
+        assert load_embedding_model('linear', 'music', 512, optimize=True) is not m
+        assert get_model_cache_info()['keys'] == [('linear', 'music', 512, 'kapre'),
+                                                  ('linear', 'music', 512, 'kapre', True, False)]
+    finally:
+        clear_model_cache()
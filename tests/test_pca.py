@@ -0,0 +1,97 @@
+import pytest
+import os
+import shutil
+import tempfile
+import numpy as np
+from openl3.core import _save_output
+from openl3.pca import EmbeddingProjection, fit_pca, load_projection, get_projection
+from openl3.openl3_exceptions import OpenL3Error
+
+
+def _make_embeddings(n_frames=3000, n_dims=64, seed=0):
+    rng = np.random.RandomState(seed)
+    # Low-rank embeddings with well separated principal components, plus noise
+    scales = np.array([10, 8, 6, 4, 2], dtype=np.float32)
+    basis = np.linalg.qr(rng.randn(n_dims, 5))[0].T
+    embedding = (rng.randn(n_frames, 5) * scales).dot(basis) + 3
+    embedding += rng.randn(n_frames, n_dims) * 0.01
+    return embedding.astype(np.float32), basis
+
+
+def test_fit_pca():
+    pytest.importorskip('sklearn')
+    embedding, basis = _make_embeddings()
+
+    # Make sure the result does not depend on how the frames are split
+    chunks = np.split(embedding, [7, 1500, 1501, 2900])
+    projection = fit_pca(chunks, 5, batch_size=700)
+    assert projection.n_components == 5
+    assert projection.input_dim == 64
+    assert np.allclose(np.abs((projection.components * basis).sum(axis=1)), 1, atol=1e-2)
+    assert np.allclose(projection.mean, embedding.mean(axis=0), atol=1e-3)
+
+    projected = projection.transform(embedding)
+    assert projected.dtype == np.float32
+    assert projected.shape == (3000, 5)
+    assert np.allclose(projected.mean(axis=0), 0, atol=1e-3)
+    assert np.allclose(projected.dot(projection.components) + projection.mean, embedding,
+                       atol=0.1)
+
+    whitened = fit_pca([embedding], 5, whiten=True).transform(embedding)
+    assert np.allclose(whitened.std(axis=0), 1, atol=1e-2)
+
+    pytest.raises(OpenL3Error, fit_pca, [embedding[:3]], 5)
+    pytest.raises(OpenL3Error, fit_pca, [], 5)
+    pytest.raises(OpenL3Error, fit_pca, [embedding], 0)
+    pytest.raises(OpenL3Error, fit_pca, [embedding], 5, batch_size=0)
+    pytest.raises(OpenL3Error, fit_pca, [embedding[0]], 1)
+
+
+def test_fit_pca_files():
+    pytest.importorskip('sklearn')
+    embedding, _ = _make_embeddings()
+    tempdir = tempfile.mkdtemp()
+    try:
+        paths = []
+        for i, chunk in enumerate(np.split(embedding, 3)):
+            path = os.path.join(tempdir, '{}.npz'.format(i))
+            _save_output(path, chunk, np.arange(chunk.shape[0]) * 0.1)
+            paths.append(path)
+        projection = fit_pca(paths, 5)
+        assert np.allclose(projection.transform(embedding),
+                           fit_pca(np.split(embedding, 3), 5).transform(embedding))
+    finally:
+        shutil.rmtree(tempdir)
+
+
+def test_embedding_projection():
+    rng = np.random.RandomState(0)
+    mean = rng.randn(16)
+    components = np.linalg.qr(rng.randn(16, 4))[0].T
+    embedding = rng.randn(10, 16).astype(np.float32)
+    tempdir = tempfile.mkdtemp()
+    try:
+        for explained_variance, whiten in ((None, False), (np.arange(1, 5), True)):
+            projection = EmbeddingProjection(mean, components, explained_variance, whiten)
+            expected = (embedding - mean).dot(components.T)
+            if whiten:
+                expected /= np.sqrt(explained_variance)
+            assert np.allclose(projection.transform(embedding), expected, atol=1e-5)
+
+            path = os.path.join(tempdir, 'pca.npz')
+            projection.save(path)
+            loaded = load_projection(path)
+            assert loaded.id == projection.id
+            assert np.array_equal(loaded.transform(embedding), projection.transform(embedding))
+            assert get_projection(path).id == projection.id
+            assert get_projection(projection) is projection
+
+        assert EmbeddingProjection(mean, components).id != projection.id
+        assert get_projection(None) is None
+        pytest.raises(OpenL3Error, projection.transform, embedding[:, :8])
+        pytest.raises(OpenL3Error, EmbeddingProjection, mean[:8], components)
+        pytest.raises(OpenL3Error, EmbeddingProjection, mean, components, whiten=True)
+        pytest.raises(OpenL3Error, load_projection, os.path.join(tempdir, 'missing.npz'))
+        pytest.raises(OpenL3Error, get_projection, 5)
+    finally:
+        shutil.rmtree(tempdir)
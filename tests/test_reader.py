@@ -0,0 +1,65 @@
+import pytest
+import os
+import shutil
+import tempfile
+import numpy as np
+from openl3 import open_embedding, load_embedding
+from openl3.core import OUTPUT_FORMATS, _save_output
+from openl3.reader import save_sidecars, get_sidecar_path
+from openl3.openl3_exceptions import OpenL3Error
+
+
+def test_open_embedding():
+    tempdir = tempfile.mkdtemp()
+    output_path = os.path.join(tempdir, 'output.npz')
+    rng = np.random.RandomState(0)
+    embedding = rng.randn(1000, 16).astype(np.float32)
+    ts = np.arange(1000) * 0.1
+    try:
+        for output_format in OUTPUT_FORMATS:
+            for compress in (False, True):
+                _save_output(output_path, embedding, ts, output_format, compress)
+                embedding_ref, _ = load_embedding(output_path)
+
+                with open_embedding(output_path) as f:
+                    assert f.output_format == output_format
+                    assert f.shape == embedding.shape
+                    assert len(f) == 1000
+                    # Make sure uncompressed outputs are memory-mapped
+                    assert isinstance(f.embedding, np.memmap) != compress
+                    assert np.array_equal(f[:], embedding_ref)
+                    assert np.array_equal(f[10:20], embedding_ref[10:20])
+                    assert f[10:20].dtype == np.float32
+
+                    embedding_out, ts_out = f.time_slice(10.05, 20)
+                    assert np.array_equal(embedding_out, embedding_ref[101:200])
+                    assert np.array_equal(ts_out, ts[101:200])
+                    assert f.time_slice(start_time=99.5)[0].shape == (5, 16)
+                    assert f.time_slice(end_time=0.15)[1].tolist() == [0, 0.1]
+                    assert f.time_slice(20, 10)[0].shape == (0, 16)
+
+                with open_embedding(output_path, mmap=False) as f:
+                    assert not isinstance(f.embedding, np.memmap)
+                    assert np.array_equal(f[:], embedding_ref)
+
+                # Make sure sidecars are memory-mapped, and only used while up to date
+                sidecar_paths = save_sidecars(output_path)
+                assert get_sidecar_path(output_path, 'embedding') in sidecar_paths
+                with open_embedding(output_path) as f:
+                    assert isinstance(f.embedding, np.memmap)
+                    assert np.array_equal(f[:], embedding_ref)
+                mtime = os.path.getmtime(output_path)
+                for path in sidecar_paths:
+                    os.utime(path, (mtime - 10, mtime - 10))
+                with open_embedding(output_path) as f:
+                    assert isinstance(f.embedding, np.memmap) != compress
+                for path in sidecar_paths:
+                    os.remove(path)
+
+        pytest.raises(OpenL3Error, open_embedding, os.path.join(tempdir, 'missing.npz'))
+        with open(output_path, 'r+b') as f:
+            f.truncate(100)
+        pytest.raises(OpenL3Error, open_embedding, output_path)
+        pytest.raises(OpenL3Error, save_sidecars, output_path)
+    finally:
+        shutil.rmtree(tempdir)
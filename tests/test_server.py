@@ -0,0 +1,281 @@
+import pytest
+import os
+import io
+import json
+import socket
+import shutil
+import tempfile
+import threading
+import numpy as np
+import soundfile as sf
+from six.moves import http_client
+import openl3
+from openl3.cli import parse_serve_args, model_config
+from openl3.server import MicroBatcher, EmbeddingServer, _get_n_frames
+from openl3.core import _get_audio_frames
+from openl3.openl3_exceptions import OpenL3Error
+
+
+TEST_DIR = os.path.dirname(__file__)
+TEST_AUDIO_DIR = os.path.join(TEST_DIR, 'data', 'audio')
+CHIRP_1S_PATH = os.path.join(TEST_AUDIO_DIR, 'chirp_1s.wav')
+
+
+class _AudioModel(object):
+    """Model taking audio windows as input, which records its batch sizes"""
+    input_shape = (None, 1, 48000)
+
+    def __init__(self):
+        self.batch_sizes = []
+
+    def predict_on_batch(self, batch):
+        self.batch_sizes.append(batch.shape[0])
+        return batch[:, 0, ::6000]
+
+
+class _UnixHTTPConnection(http_client.HTTPConnection):
+    def __init__(self, socket_path):
+        http_client.HTTPConnection.__init__(self, 'localhost')
+        self.socket_path = socket_path
+
+    def connect(self):
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.connect(self.socket_path)
+
+
+def _serve(server):
+    thread = threading.Thread(target=server.serve_forever)
+    thread.daemon = True
+    thread.start()
+    return thread
+
+
+def _post(conn, path, body, content_type='audio/wav'):
+    conn.request('POST', path, body, {'Content-Type': content_type})
+    response = conn.getresponse()
+    return response.status, response.read()
+
+
+def test_micro_batcher():
+    model = _AudioModel()
+    batcher = MicroBatcher(lambda: model, max_batch_size=16, max_wait=0.5)
+    batcher.wait_ready()
+    rng = np.random.RandomState(0)
+    frames = [rng.randn(n, 1, 48000).astype(np.float32) for n in (3, 5, 2, 20)]
+    results = [None] * len(frames)
+
+    def embed(i):
+        results[i] = batcher.embed(frames[i])
+
+    threads = [threading.Thread(target=embed, args=(i,)) for i in range(len(frames))]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    batcher.close()
+
+    for x, embedding in zip(frames, results):
+        assert np.array_equal(embedding, x[:, 0, ::6000])
+
+    # Concurrent requests share batches of at most max_batch_size windows
+    assert max(model.batch_sizes) <= 16
+    assert len(model.batch_sizes) < len(frames)
+    assert sum(model.batch_sizes) == 30
+    assert batcher.n_requests == 4
+
+    pytest.raises(OpenL3Error, batcher.embed, frames[0])
+    pytest.raises(OpenL3Error, MicroBatcher, lambda: model, max_batch_size=0)
+    pytest.raises(OpenL3Error, MicroBatcher, lambda: model, max_wait=-1)
+
+    def load_error():
+        raise IOError('missing weights')
+    batcher = MicroBatcher(load_error)
+    pytest.raises(OpenL3Error, batcher.wait_ready)
+    pytest.raises(OpenL3Error, batcher.embed, frames[0])
+    batcher.close()
+
+
+def test_embedding_server():
+    audio, sr = sf.read(CHIRP_1S_PATH)
+    buf = io.BytesIO()
+    sf.write(buf, audio, sr, format='WAV')
+    wav = buf.getvalue()
+
+    embedding_server = EmbeddingServer(max_batch_size=8, allow_paths=True, input_repr='linear',
+                                       embedding_size=512)
+    embedding_server.preload([('linear', 'music', 512)])
+    server = embedding_server.make_http_server(port=0)
+    _serve(server)
+    try:
+        conn = http_client.HTTPConnection('127.0.0.1', server.server_address[1])
+        conn.request('GET', '/health')
+        response = conn.getresponse()
+        assert response.status == 200
+        assert json.loads(response.read().decode('utf-8'))['models'] == \
+            [['linear', 'music', 512, 'kapre']]
+
+        expected, expected_ts = openl3.get_embedding(audio, sr, input_repr='linear',
+                                                     embedding_size=512, hop_size=0.5,
+                                                     verbose=False)
+
+        status, body = _post(conn, '/embedding?hop_size=0.5', wav)
+        assert status == 200
+        with np.load(io.BytesIO(body)) as data:
+            assert np.allclose(data['embedding'], expected, atol=1e-5)
+            assert np.allclose(data['timestamps'], expected_ts)
+
+        status, body = _post(conn, '/embedding?format=json',
+                             json.dumps({'path': CHIRP_1S_PATH, 'hop_size': 0.5}),
+                             'application/json')
+        assert status == 200
+        data = json.loads(body.decode('utf-8'))
+        assert np.allclose(data['embedding'], expected, atol=1e-5)
+
+        assert _post(conn, '/embedding', b'not audio')[0] == 400
+        assert _post(conn, '/embedding?hop_size=-1', wav)[0] == 400
+        assert _post(conn, '/embedding?unknown=1', wav)[0] == 400
+        assert _post(conn, '/missing', wav)[0] == 404
+        conn.close()
+    finally:
+        server.shutdown()
+        server.server_close()
+        embedding_server.close()
+
+
+def test_embedding_server_unix_socket():
+    if not hasattr(socket, 'AF_UNIX'):
+        pytest.skip('Unix sockets are not supported')
+
+    tempdir = tempfile.mkdtemp()
+    model = _AudioModel()
+    embedding_server = EmbeddingServer(load_model=lambda *args: model)
+    socket_path = os.path.join(tempdir, 'openl3.sock')
+    server = embedding_server.make_unix_server(socket_path)
+    _serve(server)
+    try:
+        conn = _UnixHTTPConnection(socket_path)
+        with open(CHIRP_1S_PATH, 'rb') as f:
+            status, body = _post(conn, '/embedding?format=json&center=false', f.read())
+        assert status == 200
+        data = json.loads(body.decode('utf-8'))
+        assert np.array(data['embedding']).shape == (1, 8)
+        assert data['timestamps'] == [0.]
+
+        status, _ = _post(conn, '/embedding', json.dumps({'path': CHIRP_1S_PATH}),
+                          'application/json')
+        assert status == 403
+        conn.close()
+    finally:
+        server.shutdown()
+        server.server_close()
+        embedding_server.close()
+        shutil.rmtree(tempdir)
+
+
+def test_embedding_server_errors():
+    with open(CHIRP_1S_PATH, 'rb') as f:
+        wav = f.read()
+
+    class _FailingModel(_AudioModel):
+        def predict_on_batch(self, batch):
+            raise RuntimeError('secret server state')
+
+    embedding_server = EmbeddingServer(allow_paths=True, max_request_size=len(wav),
+                                       load_model=lambda *args: _FailingModel())
+    server = embedding_server.make_http_server(port=0)
+    _serve(server)
+    try:
+        conn = http_client.HTTPConnection('127.0.0.1', server.server_address[1])
+
+        # Requests larger than the maximum size are rejected without being read
+        status, body = _post(conn, '/embedding', wav + b'0')
+        assert status == 413
+        conn.close()
+
+        # JSON requests are limited to the request parameters
+        for data in ({'path': CHIRP_1S_PATH, 'model': 'x'}, {'path': 1},
+                     {'path': CHIRP_1S_PATH, 'hop_size': [0.1]}, {'hop_size': 0.1}):
+            status, _ = _post(conn, '/embedding', json.dumps(data), 'application/json')
+            assert status == 400
+
+        # Internal errors do not reveal the traceback
+        status, body = _post(conn, '/embedding', wav)
+        assert status == 500
+        assert b'secret' not in body and b'Traceback' not in body
+        conn.close()
+    finally:
+        server.shutdown()
+        server.server_close()
+        embedding_server.close()
+
+
+def test_embedding_server_limits():
+    with open(CHIRP_1S_PATH, 'rb') as f:
+        wav = f.read()
+    # 20 seconds of silence compress into a small FLAC file
+    buf = io.BytesIO()
+    sf.write(buf, np.zeros(20 * 48000), 48000, format='FLAC')
+    flac = buf.getvalue()
+    assert len(flac) < len(wav)
+
+    embedding_server = EmbeddingServer(max_duration=10, max_frames=20,
+                                       load_model=lambda *args: _AudioModel())
+    server = embedding_server.make_http_server(port=0)
+    _serve(server)
+    try:
+        conn = http_client.HTTPConnection('127.0.0.1', server.server_address[1])
+        assert _post(conn, '/embedding?hop_size=0.1', wav)[0] == 200
+
+        # Hop sizes that would expand a clip into too many windows are rejected
+        for hop_size in ('0.00001', '0.001'):
+            assert _post(conn, '/embedding?hop_size=' + hop_size, wav)[0] == 400
+        assert _post(conn, '/embedding?hop_size=0.02', wav)[0] == 413
+
+        # The duration of compressed audio is checked before it is decoded
+        assert _post(conn, '/embedding?hop_size=1', flac, 'audio/flac')[0] == 413
+        conn.close()
+    finally:
+        server.shutdown()
+        server.server_close()
+        embedding_server.close()
+
+    pytest.raises(OpenL3Error, EmbeddingServer, max_duration=0)
+    pytest.raises(OpenL3Error, EmbeddingServer, max_frames=0)
+
+
+def test_get_n_frames():
+    for n_samples, sr in ((48000, 48000), (100, 48000), (44100 * 3 + 7, 44100),
+                          (16000 * 5, 16000)):
+        for hop_size in (0.1, 0.25, 1.):
+            for center in (True, False):
+                n_resampled = int(np.ceil(n_samples * 48000. / sr))
+                x = _get_audio_frames(np.zeros(n_resampled), hop_size, center)
+                assert _get_n_frames(n_samples, sr, hop_size, center) == x.shape[0]
+
+
+def test_parse_serve_args():
+    args = parse_serve_args([])
+    assert args.host == '127.0.0.1'
+    assert args.port == 8080
+    assert args.socket is None
+    assert args.preload is None
+    assert args.allow_paths is False
+    assert args.max_request_size == 100
+    assert args.max_duration == 600
+    assert args.max_frames == 12000
+
+    args = parse_serve_args(['--port', '0', '--max-batch-size', '16', '--max-wait', '20',
+                             '--preload', 'mel256,music,6144',
+                             '--preload', 'linear,env,512,numpy', '--allow-paths',
+                             '--max-request-size', '1.5'])
+    assert args.max_batch_size == 16
+    assert args.max_wait == 20
+    assert args.preload == [('mel256', 'music', 6144), ('linear', 'env', 512, 'numpy')]
+    assert args.allow_paths is True
+    assert args.max_request_size == 1.5
+
+    assert model_config('mel128,env,512') == ('mel128', 'env', 512)
+    with pytest.raises(SystemExit):
+        parse_serve_args(['--preload', 'mel256,music'])
+    with pytest.raises(SystemExit):
+        parse_serve_args(['--max-wait', '-1'])
@@ -0,0 +1,131 @@
+import pytest
+import os
+import shutil
+import tempfile
+import numpy as np
+from openl3.store import EmbeddingStore
+from openl3.openl3_exceptions import OpenL3Error
+from openl3.openl3_warnings import OpenL3Warning
+
+
+def _make_embedding(n_frames, n_dims=8, seed=0):
+    rng = np.random.RandomState(seed)
+    embedding = rng.randn(n_frames, n_dims).astype(np.float32)
+    ts = np.arange(n_frames) * 0.1
+    return embedding, ts
+
+
+def test_embedding_store():
+    store_dir = tempfile.mkdtemp()
+    try:
+        emb1, ts1 = _make_embedding(10, seed=1)
+        emb2, ts2 = _make_embedding(25, seed=2)
+        with EmbeddingStore(store_dir, mode='a') as store:
+            store.append('/a.wav', emb1, ts1)
+            store.append('/b.wav', emb2, ts2)
+            assert len(store) == 2
+            assert '/a.wav' in store
+            assert '/c.wav' not in store
+            assert store.get_length('/b.wav') == 25
+
+            embedding, ts = store.get('/a.wav')
+            assert np.array_equal(embedding, emb1)
+            assert np.array_equal(ts, ts1)
+
+            # Make sure only the requested frames are returned
+            embedding, ts = store.get('/b.wav', 5, 12)
+            assert np.array_equal(embedding, emb2[5:12])
+            assert np.array_equal(ts, ts2[5:12])
+            embedding, ts = store.get('/b.wav', start=-3)
+            assert np.array_equal(embedding, emb2[-3:])
+            assert store.get('/b.wav', 12, 5)[0].shape == (0, 8)
+
+            # Make sure duplicates and invalid shapes are rejected
+            pytest.raises(OpenL3Error, store.append, '/a.wav', emb1, ts1)
+            pytest.raises(OpenL3Error, store.append, '/c.wav', emb1, ts2)
+            pytest.raises(OpenL3Error, store.append, '/c.wav', emb1[0], ts1[:1])
+            pytest.raises(OpenL3Error, store.get, '/c.wav')
+
+        # Make sure the store can be reopened and appended to
+        emb3, ts3 = _make_embedding(5, seed=3)
+        with EmbeddingStore(store_dir, mode='a') as store:
+            assert sorted(store.files) == ['/a.wav', '/b.wav']
+            store.append('/c.wav', emb3, ts3)
+        assert sorted(os.listdir(store_dir)) == ['shard-00000.h5', 'shard-00001.h5']
+
+        with EmbeddingStore(store_dir) as store:
+            assert len(store) == 3
+            assert np.array_equal(store.get('/b.wav')[0], emb2)
+            assert np.array_equal(store.get('/c.wav')[0], emb3)
+            pytest.raises(OpenL3Error, store.append, '/d.wav', emb3, ts3)
+
+        pytest.raises(OpenL3Error, EmbeddingStore, os.path.join(store_dir, 'missing'))
+        pytest.raises(OpenL3Error, EmbeddingStore, store_dir, mode='w')
+        pytest.raises(OpenL3Error, EmbeddingStore, store_dir, output_format='int4')
+    finally:
+        shutil.rmtree(store_dir)
+
+
+def test_embedding_store_shards():
+    store_dir = tempfile.mkdtemp()
+    try:
+        # Each file takes 10 * 8 * 4 bytes, so each shard holds 2 files
+        embeddings = [_make_embedding(10, seed=seed) for seed in range(5)]
+        with EmbeddingStore(store_dir, mode='a', shard_size=10 * 8 * 4 * 2) as store:
+            for i, (embedding, ts) in enumerate(embeddings):
+                store.append('/{}.wav'.format(i), embedding, ts)
+            # Make sure a new shard is started when the dimensionality changes
+            emb_512, ts_512 = _make_embedding(3, n_dims=512)
+            store.append('/512.wav', emb_512, ts_512)
+        assert len(os.listdir(store_dir)) == 4
+
+        with EmbeddingStore(store_dir) as store:
+            for i, (embedding, ts) in enumerate(embeddings):
+                assert np.array_equal(store.get('/{}.wav'.format(i))[0], embedding)
+            assert np.array_equal(store.get('/512.wav')[0], emb_512)
+    finally:
+        shutil.rmtree(store_dir)
+
+
+def test_embedding_store_discard_shard():
+    store_dir = tempfile.mkdtemp()
+    try:
+        emb1, ts1 = _make_embedding(10, seed=1)
+        with EmbeddingStore(store_dir, mode='a') as store:
+            store.append('/a.wav', emb1, ts1)
+        # Simulate a shard left unreadable by a crash
+        with open(os.path.join(store_dir, 'shard-00001.h5'), 'wb') as f:
+            f.write(b'truncated')
+
+        pytest.raises(OpenL3Error, EmbeddingStore, store_dir)
+        with pytest.warns(OpenL3Warning):
+            store = EmbeddingStore(store_dir, mode='a')
+        with store:
+            assert store.files == ['/a.wav']
+            store.append('/b.wav', emb1, ts1)
+        assert sorted(os.listdir(store_dir)) == \
+            ['shard-00000.h5', 'shard-00001.h5.discarded', 'shard-00002.h5']
+
+        with EmbeddingStore(store_dir) as store:
+            assert sorted(store.files) == ['/a.wav', '/b.wav']
+    finally:
+        shutil.rmtree(store_dir)
+
+
+def test_embedding_store_formats():
+    embedding, ts = _make_embedding(50, n_dims=16)
+    for output_format, compression, atol in (("float16", None, 1e-2),
+                                             ("int8", "gzip", np.abs(embedding).max() / 127.)):
+        store_dir = tempfile.mkdtemp()
+        try:
+            with EmbeddingStore(store_dir, mode='a', output_format=output_format,
+                                compression=compression) as store:
+                store.append('/a.wav', embedding, ts)
+            with EmbeddingStore(store_dir) as store:
+                embedding_out, ts_out = store.get('/a.wav')
+                assert embedding_out.dtype == np.float32
+                assert np.allclose(embedding_out, embedding, rtol=0, atol=atol)
+                assert np.array_equal(ts_out, ts)
+                assert np.allclose(store.get('/a.wav', 10, 20)[0], embedding_out[10:20])
+        finally:
+            shutil.rmtree(store_dir)
@@ -0,0 +1,162 @@
+import pytest
+import os
+import json
+import time
+import shutil
+import socket
+import tempfile
+import threading
+from openl3.tuning import (
+    get_batch_size, estimate_window_memory, set_memory_budget, get_memory_budget,
+    get_tuning_cache_path, clear_batch_sizes, DEFAULT_MEMORY_BUDGET
+)
+from openl3.cache import get_model_name
+from openl3.openl3_exceptions import OpenL3Error
+
+
+class _Layer(object):
+    def __init__(self, output_shape):
+        self.output_shape = output_shape
+
+
+class _TimedModel(object):
+    """Model whose inference time has a fixed cost per call and a cost per window"""
+    input_shape = (None, 1, 48000)
+    layers = [_Layer((None, 1, 48000)), _Layer((None, 100, 100, 16)),
+              _Layer([(None, 10), (None, 20)])]
+
+    def __init__(self, name, call_time=0.005, window_time=0.0002):
+        self.name = name
+        self.call_time = call_time
+        self.window_time = window_time
+        self.batch_sizes = []
+
+    def get_weights(self):
+        return []
+
+    def predict_on_batch(self, batch):
+        self.batch_sizes.append(batch.shape[0])
+        time.sleep(self.call_time + self.window_time * batch.shape[0])
+        return batch[:, 0, :10]
+
+
+def test_estimate_window_memory():
+    assert estimate_window_memory(_TimedModel('openl3_test')) == 4 * (48000 + 160000 + 48000)
+
+
+def test_get_batch_size():
+    tempdir = tempfile.mkdtemp()
+    cache_path = os.path.join(tempdir, 'tuning', 'batch_sizes.json')
+    window_memory = estimate_window_memory(_TimedModel('openl3_test'))
+    try:
+        # The fixed cost per call favours the largest batch that fits in the budget
+        model = _TimedModel('openl3_test_a')
+        batch_size = get_batch_size(model, memory_budget=40 * window_memory,
+                                    batch_sizes=(8, 16, 32, 64), cache_path=cache_path)
+        assert batch_size == 32
+        assert 64 not in model.batch_sizes
+        with open(cache_path) as f:
+            cache = json.load(f)
+        assert sorted(cache[socket.gethostname()]['openl3_test_a']) == ['16', '32', '8']
+
+        # The batch size is remembered in this process and on disk
+        n_calls = len(model.batch_sizes)
+        assert get_batch_size(model, memory_budget=40 * window_memory,
+                              batch_sizes=(8, 16, 32, 64), cache_path=cache_path) == 32
+        clear_batch_sizes()
+        assert get_batch_size(model, memory_budget=40 * window_memory,
+                              batch_sizes=(8, 16, 32, 64), cache_path=cache_path) == 32
+        assert len(model.batch_sizes) == n_calls
+
+        # Only the batch sizes that were not measured yet are measured
+        assert get_batch_size(model, memory_budget=100 * window_memory,
+                              batch_sizes=(8, 16, 32, 64), cache_path=cache_path) == 64
+        assert model.batch_sizes[n_calls:] == [64] * 3
+
+        # Without a fixed cost per call, the smallest batch size is as fast
+        model = _TimedModel('openl3_test_b', call_time=0, window_time=0.001)
+        assert get_batch_size(model, memory_budget=100 * window_memory,
+                              batch_sizes=(8, 16, 32, 64), cache_path=cache_path) == 8
+
+        # The smallest batch size is used if none fits in the budget
+        model = _TimedModel('openl3_test_c')
+        assert get_batch_size(model, memory_budget=1, batch_sizes=(8, 16),
+                              cache_path=cache_path) == 8
+        assert set(model.batch_sizes) == {8}
+
+        # A corrupted cache file is ignored and replaced
+        with open(cache_path, 'w') as f:
+            f.write('{"truncated')
+        clear_batch_sizes()
+        assert get_batch_size(_TimedModel('openl3_test_c'), memory_budget=1, batch_sizes=(8,),
+                              cache_path=cache_path) == 8
+        with open(cache_path) as f:
+            assert list(json.load(f)[socket.gethostname()]) == ['openl3_test_c']
+
+        model = _TimedModel('openl3_test_d')
+        pytest.raises(OpenL3Error, get_batch_size, model, memory_budget=0)
+        pytest.raises(OpenL3Error, get_batch_size, model, batch_sizes=())
+        pytest.raises(OpenL3Error, get_batch_size, model, batch_sizes=(0, 8))
+    finally:
+        clear_batch_sizes()
+        shutil.rmtree(tempdir)
+
+
+def test_get_batch_size_model_options():
+    tempdir = tempfile.mkdtemp()
+    cache_path = os.path.join(tempdir, 'batch_sizes.json')
+    try:
+        # Optimized and XLA-compiled models are measured separately
+        plain = _TimedModel(get_model_name('mel256', 'music', 512))
+        optimized = _TimedModel(get_model_name('mel256', 'music', 512, optimize=True,
+                                               use_xla=True))
+        get_batch_size(plain, batch_sizes=(8,), cache_path=cache_path)
+        get_batch_size(optimized, batch_sizes=(8,), cache_path=cache_path)
+        assert optimized.batch_sizes
+        with open(cache_path) as f:
+            assert sorted(json.load(f)[socket.gethostname()]) == \
+                ['openl3_mel256_music_512_kapre', 'openl3_mel256_music_512_kapre_optimize_xla']
+    finally:
+        clear_batch_sizes()
+        shutil.rmtree(tempdir)
+
+
+def test_get_batch_size_concurrent():
+    tempdir = tempfile.mkdtemp()
+    cache_path = os.path.join(tempdir, 'batch_sizes.json')
+    try:
+        # A slow model being tuned does not block the tuning of another model
+        slow, fast = _TimedModel('openl3_test_f', call_time=0.5), _TimedModel('openl3_test_g')
+        thread = threading.Thread(target=get_batch_size, args=(slow,),
+                                  kwargs={'batch_sizes': (8,), 'cache_path': cache_path})
+        thread.start()
+        while not slow.batch_sizes:
+            time.sleep(0.01)
+        start = time.time()
+        get_batch_size(fast, batch_sizes=(8,), cache_path=cache_path)
+        assert time.time() - start < 0.5
+        thread.join()
+        with open(cache_path) as f:
+            assert sorted(json.load(f)[socket.gethostname()]) == ['openl3_test_f', 'openl3_test_g']
+    finally:
+        clear_batch_sizes()
+        shutil.rmtree(tempdir)
+
+
+def test_memory_budget():
+    try:
+        assert get_memory_budget() == DEFAULT_MEMORY_BUDGET
+        set_memory_budget(2 ** 20)
+        assert get_memory_budget() == 2 ** 20
+        pytest.raises(OpenL3Error, set_memory_budget, 0)
+        pytest.raises(OpenL3Error, set_memory_budget, 'auto')
+    finally:
+        set_memory_budget(DEFAULT_MEMORY_BUDGET)
+
+
+def test_get_tuning_cache_path(monkeypatch):
+    monkeypatch.setenv('OPENL3_TUNING_CACHE', '/tuning/cache.json')
+    assert get_tuning_cache_path() == '/tuning/cache.json'
+    monkeypatch.delenv('OPENL3_TUNING_CACHE')
+    monkeypatch.setenv('XDG_CACHE_HOME', '/cache/home')
+    assert get_tuning_cache_path() == os.path.join('/cache/home', 'openl3', 'batch_sizes.json')
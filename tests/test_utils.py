@@ -0,0 +1,34 @@
+import pytest
+import os
+import shutil
+import tempfile
+from openl3.utils import write_atomic, replace_file
+
+
+def test_write_atomic():
+    tempdir = tempfile.mkdtemp()
+    path = os.path.join(tempdir, 'output.bin')
+    try:
+        write_atomic(path, lambda f: f.write(b'first'))
+        # Make sure an existing file is replaced
+        write_atomic(path, lambda f: f.write(b'second'))
+        with open(path, 'rb') as f:
+            assert f.read() == b'second'
+
+        # Make sure a failed write leaves the previous file and no temporary file
+        def write(f):
+            f.write(b'partial')
+            raise IOError('disk full')
+        pytest.raises(IOError, write_atomic, path, write)
+        with open(path, 'rb') as f:
+            assert f.read() == b'second'
+        assert os.listdir(tempdir) == ['output.bin']
+
+        other_path = os.path.join(tempdir, 'other.bin')
+        write_atomic(other_path, lambda f: f.write(b'other'))
+        replace_file(other_path, path)
+        with open(path, 'rb') as f:
+            assert f.read() == b'other'
+        assert os.listdir(tempdir) == ['output.bin']
+    finally:
+        shutil.rmtree(tempdir)